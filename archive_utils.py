@@ -0,0 +1,170 @@
+"""
+Помесячная архивация старых операций.
+
+Подтвержденные и отклоненные операции старше TRANSACTION_ARCHIVE_DAYS
+переносятся из transactions в таблицы transactions_archive_YYYYMM с теми же
+колонками и id. Реестр архивов (transaction_archives) хранит границы дат
+каждого месяца, поэтому журнал, экспорт и статистика подключают архивы
+только тогда, когда запрошенный период их задевает. Операция может быть
+подтверждена позже месяца создания, поэтому для остатков на дату реестр
+хранит и время последнего подтверждения в архиве.
+
+Остатки, итоги движений и дневные итоги хранятся отдельно и при переносе
+не меняются.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import MetaData, Table, Column, Index, select, insert, delete, union_all, func, and_
+from sqlalchemy.orm import aliased
+from database import Transaction, TransactionArchive, get_database, run_sync
+from config import TRANSACTION_ARCHIVE_DAYS, TRANSACTION_ARCHIVE_INTERVAL
+
+ARCHIVED_STATUSES = ('confirmed', 'rejected')
+
+# Архивные таблицы не входят в Base.metadata, чтобы create_all их не трогал
+_archive_metadata = MetaData()
+
+
+def get_archive_table(month):
+    """Возвращает описание архивной таблицы за месяц month ('YYYYMM')"""
+    name = f'transactions_archive_{month}'
+    table = _archive_metadata.tables.get(name)
+    if table is None:
+        columns = [Column(column.name, column.type, primary_key=column.primary_key)
+                   for column in Transaction.__table__.columns]
+        table = Table(name, _archive_metadata, *columns,
+                      Index(f'ix_{name}_created_at', 'created_at', 'id'))
+    return table
+
+
+def _month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def _next_month(month_start):
+    if month_start.month == 12:
+        return datetime(month_start.year + 1, 1, 1)
+    return datetime(month_start.year, month_start.month + 1, 1)
+
+
+def get_archive_tables(executor, start_date=None, end_date=None, confirmed_after=None):
+    """Архивные таблицы, чьи даты пересекаются с периодом [start_date, end_date].
+
+    При confirmed_after - только архивы с операциями, подтвержденными позже этого момента.
+    """
+    query = select(TransactionArchive.month).order_by(TransactionArchive.month)
+    if start_date is not None:
+        query = query.where(TransactionArchive.last_created_at >= start_date)
+    if end_date is not None:
+        query = query.where(TransactionArchive.first_created_at <= end_date)
+    if confirmed_after is not None:
+        query = query.where(TransactionArchive.last_confirmed_at > confirmed_after)
+    return [get_archive_table(month) for month in executor.execute(query).scalars()]
+
+
+def transactions_source(executor, start_date=None, end_date=None, confirmed_after=None):
+    """Таблица операций за период: сама transactions или ее объединение с нужными архивами"""
+    archives = get_archive_tables(executor, start_date, end_date, confirmed_after)
+    if not archives:
+        return Transaction.__table__
+
+    columns = [column.name for column in Transaction.__table__.columns]
+    parts = [select(*[table.c[name] for name in columns]) for table in [Transaction.__table__, *archives]]
+    return union_all(*parts).subquery('all_transactions')
+
+
+def transactions_entity(session, start_date=None, end_date=None):
+    """ORM-сущность операций за период: Transaction или ее псевдоним над архивами.
+
+    Объекты, загруженные через псевдоним, - обычные Transaction со связями
+    product, from_vitrine и to_vitrine; их нужно только читать.
+    """
+    source = transactions_source(session, start_date, end_date)
+    if source is Transaction.__table__:
+        return Transaction
+    return aliased(Transaction, source)
+
+
+def _register_archive(connection, month, table):
+    bounds = connection.execute(
+        select(func.min(table.c.created_at), func.max(table.c.created_at), func.max(table.c.confirmed_at),
+               func.count())
+    ).one()
+    values = {
+        'table_name': table.name,
+        'first_created_at': bounds[0],
+        'last_created_at': bounds[1],
+        'last_confirmed_at': bounds[2],
+        'rows': bounds[3],
+        'archived_at': datetime.utcnow(),
+    }
+    updated = connection.execute(
+        TransactionArchive.__table__.update().where(TransactionArchive.month == month).values(**values)
+    )
+    if updated.rowcount == 0:
+        connection.execute(TransactionArchive.__table__.insert().values(month=month, **values))
+
+
+def archive_transactions(engine, older_than_days=TRANSACTION_ARCHIVE_DAYS, now=None):
+    """Переносит завершенные операции старше older_than_days в помесячные архивы.
+
+    Архивируются только целые месяцы до границы. Каждый месяц переносится
+    в своей транзакции. Возвращает {месяц: перенесено строк}.
+    """
+    if older_than_days <= 0:
+        return {}
+
+    cutoff = _month_start((now or datetime.utcnow()) - timedelta(days=older_than_days))
+    transactions = Transaction.__table__
+
+    with engine.connect() as connection:
+        first, newest_id = connection.execute(
+            select(func.min(transactions.c.created_at), func.max(transactions.c.id))
+        ).one()
+
+    if first is None or first >= cutoff:
+        return {}
+
+    moved_by_month = {}
+    month_start = _month_start(first)
+    while month_start < cutoff:
+        month_end = _next_month(month_start)
+        month = month_start.strftime('%Y%m')
+        condition = and_(
+            transactions.c.created_at >= month_start,
+            transactions.c.created_at < month_end,
+            transactions.c.status.in_(ARCHIVED_STATUSES),
+            # Последняя операция остается на месте, чтобы SQLite не выдал ее id повторно
+            transactions.c.id < newest_id,
+        )
+
+        with engine.begin() as connection:
+            if connection.execute(select(transactions.c.id).where(condition).limit(1)).first():
+                table = get_archive_table(month)
+                table.create(connection, checkfirst=True)
+                connection.execute(insert(table).from_select(
+                    [column.name for column in transactions.columns],
+                    select(*transactions.columns).where(condition)
+                ))
+                moved = connection.execute(delete(transactions).where(condition)).rowcount
+                _register_archive(connection, month, table)
+                moved_by_month[month] = moved
+                print(f"✅ Архив {month}: перенесено операций {moved}")
+
+        month_start = month_end
+
+    return moved_by_month
+
+
+async def archive_loop(interval=TRANSACTION_ARCHIVE_INTERVAL):
+    """Периодически архивирует старые операции в пуле потоков БД"""
+    if TRANSACTION_ARCHIVE_DAYS <= 0 or interval <= 0:
+        return
+
+    database = get_database()
+    while True:
+        try:
+            await run_sync(archive_transactions, database.engine)
+        except Exception as e:
+            print(f"⚠️ Ошибка архивации операций: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,140 @@
+"""
+Атомарные изменения остатков на витринах.
+
+Остаток меняется одним UPDATE с условием прямо в базе, а не чтением строки
+и записью нового значения из Python: так две одновременные продажи не могут
+обе пройти проверку и увести остаток в минус.
+
+В PostgreSQL операции, затрагивающие несколько строк остатков, дополнительно
+блокируют их (SELECT ... FOR UPDATE) в одном и том же порядке, чтобы встречные
+перемещения не приводили к взаимной блокировке.
+
+Вместе с остатком в той же транзакции обновляются итоги движений по витрине
+(vitrine_movements), из которых строятся отчеты.
+"""
+from datetime import datetime
+from sqlalchemy import update, select, tuple_, union_all, and_, func
+from sqlalchemy.dialects import sqlite, postgresql
+from database import Balance, VitrineMovement
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite,
+    'postgresql': postgresql,
+}
+
+# Типы операций, которые прибавляют товар получателю и списывают его у отправителя
+INCOMING_TYPES = ('give', 'transfer')
+OUTGOING_TYPES = ('return', 'sale', 'take', 'transfer')
+
+
+def lock_balances(session, keys):
+    """Блокирует строки остатков по парам (vitrine_id, product_id) до конца транзакции"""
+    if session.get_bind().dialect.name != 'postgresql' or not keys:
+        return
+
+    session.execute(
+        select(Balance.id)
+        .where(tuple_(Balance.vitrine_id, Balance.product_id).in_(sorted(keys)))
+        .order_by(Balance.vitrine_id, Balance.product_id)
+        .with_for_update()
+    ).all()
+
+
+def decrease_balance(session, vitrine_id, product_id, quantity):
+    """Списывает quantity, только если товара хватает; возвращает True при успешном списании"""
+    result = session.execute(
+        update(Balance)
+        .where(
+            Balance.vitrine_id == vitrine_id,
+            Balance.product_id == product_id,
+            Balance.quantity >= quantity
+        )
+        .values(quantity=Balance.quantity - quantity, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def upsert_increment(session, model, keys, increments):
+    """Прибавляет increments к строке model с ключом keys, создавая строку при необходимости.
+
+    keys должны совпадать с колонками уникального индекса модели.
+    """
+    now = datetime.utcnow()
+    dialect = _UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+
+    if dialect is not None:
+        # INSERT ... ON CONFLICT по уникальному индексу keys
+        statement = dialect.insert(model).values(**keys, **increments, updated_at=now)
+        changes = {name: getattr(model, name) + statement.excluded[name] for name in increments}
+        changes['updated_at'] = now
+        statement = statement.on_conflict_do_update(index_elements=list(keys), set_=changes)
+        session.execute(statement)
+        return
+
+    result = session.execute(
+        update(model)
+        .where(*[getattr(model, name) == value for name, value in keys.items()])
+        .values(**{name: getattr(model, name) + value for name, value in increments.items()}, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        session.add(model(**keys, **increments, updated_at=now))
+        session.flush()
+
+
+def increase_balance(session, vitrine_id, product_id, quantity):
+    """Добавляет quantity к остатку, создавая строку остатка при необходимости"""
+    upsert_increment(session, Balance, {'vitrine_id': vitrine_id, 'product_id': product_id},
+                     {'quantity': quantity})
+
+
+def add_movement(session, vitrine_id, product_id, movement_type, quantity):
+    """Прибавляет quantity к итогу движений витрины по товару и типу операции"""
+    upsert_increment(session, VitrineMovement,
+                     {'vitrine_id': vitrine_id, 'product_id': product_id, 'type': movement_type},
+                     {'quantity': quantity})
+
+
+def record_movements(session, transaction):
+    """Учитывает подтвержденную операцию в итогах движений затронутых витрин"""
+    if transaction.type == 'give':
+        add_movement(session, transaction.to_vitrine_id, transaction.product_id, 'give', transaction.quantity)
+
+    elif transaction.type in ('return', 'take', 'sale'):
+        add_movement(session, transaction.from_vitrine_id, transaction.product_id, transaction.type,
+                     transaction.quantity)
+
+    elif transaction.type == 'transfer':
+        add_movement(session, transaction.from_vitrine_id, transaction.product_id, 'transfer_out',
+                     transaction.quantity)
+        add_movement(session, transaction.to_vitrine_id, transaction.product_id, 'transfer_in',
+                     transaction.quantity)
+
+
+def balance_changes(transactions, *conditions):
+    """Изменения остатков от подтвержденных операций: подзапрос (vitrine_id, product_id, quantity со знаком)"""
+    c = transactions.c
+    confirmed = and_(c.status == 'confirmed', c.product_id.isnot(None), *conditions)
+    return union_all(
+        select(c.to_vitrine_id.label('vitrine_id'), c.product_id.label('product_id'), c.quantity.label('quantity'))
+        .where(confirmed, c.type.in_(INCOMING_TYPES), c.to_vitrine_id.isnot(None)),
+        select(c.from_vitrine_id, c.product_id, -c.quantity)
+        .where(confirmed, c.type.in_(OUTGOING_TYPES), c.from_vitrine_id.isnot(None)),
+    ).subquery('balance_changes')
+
+
+def aggregate_balance_changes(transactions, *conditions):
+    """SELECT vitrine_id, product_id, SUM(изменения остатка) по подтвержденным операциям"""
+    changes = balance_changes(transactions, *conditions)
+    return (
+        select(changes.c.vitrine_id, changes.c.product_id, func.sum(changes.c.quantity))
+        .group_by(changes.c.vitrine_id, changes.c.product_id)
+    )
+
+
+def get_balance_quantity(session, vitrine_id, product_id):
+    """Возвращает текущий остаток или None, если строки остатка нет"""
+    return session.execute(
+        select(Balance.quantity).where(Balance.vitrine_id == vitrine_id, Balance.product_id == product_id)
+    ).scalar()
@@ -0,0 +1,178 @@
+"""
+Массовая выдача товара витринам.
+
+Администратор присылает таблицу "витрина;артикул;количество" текстом или
+файлом CSV. Таблица проверяется целиком до записи: если есть хотя бы одна
+ошибка, не создается ни одной операции. Проверенные строки вставляются одной
+пачкой в одной транзакции, а на каждую витрину заводится своя выдача
+(give_batches), которую витрина подтверждает одним нажатием.
+"""
+import csv
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload
+from database import User, Product, Transaction, GiveBatch
+from rollup_utils import add_rows_to_rollup
+from config import BULK_GIVE_MAX_ROWS
+
+MAX_GIVE_QUANTITY = 10000
+DELIMITERS = (';', '\t', ',')
+
+
+def _detect_delimiter(lines):
+    for line in lines:
+        if line.strip():
+            for delimiter in DELIMITERS:
+                if delimiter in line:
+                    return delimiter
+            break
+    return DELIMITERS[0]
+
+
+def _clean_username(value):
+    # Витрину можно скопировать прямо с кнопки ("🏪 name") или указать как @name
+    return value.replace("🏪", "").strip().lstrip('@')
+
+
+def parse_give_matrix(text, max_rows=BULK_GIVE_MAX_ROWS):
+    """Разбирает таблицу выдачи.
+
+    Возвращает (строки, ошибки): строки - [(номер строки, витрина, артикул,
+    количество)], ошибки - [(номер строки, ключ текста ошибки, значение)].
+    Первая строка без числа в колонке количества считается заголовком.
+    """
+    lines = text.splitlines()
+    reader = csv.reader(lines, delimiter=_detect_delimiter(lines))
+
+    rows, errors = [], []
+    for line_number, cells in enumerate(reader, start=1):
+        cells = [cell.strip() for cell in cells]
+        if not any(cells):
+            continue
+        if len(cells) != 3 or not cells[0] or not cells[1]:
+            errors.append((line_number, 'bulk_give_bad_line', ';'.join(cells)))
+            continue
+
+        username, sku, quantity_text = cells
+        try:
+            quantity = int(quantity_text)
+        except ValueError:
+            if not rows and not errors:
+                continue
+            errors.append((line_number, 'quantity_error', quantity_text))
+            continue
+
+        if quantity <= 0:
+            errors.append((line_number, 'quantity_positive_error', quantity_text))
+        elif quantity > MAX_GIVE_QUANTITY:
+            errors.append((line_number, 'quantity_max_error', quantity_text))
+        else:
+            rows.append((line_number, _clean_username(username), sku, quantity))
+
+    if not rows and not errors:
+        errors.append((0, 'bulk_give_empty', ''))
+    elif len(rows) > max_rows:
+        errors.append((0, 'bulk_give_too_many_rows', str(len(rows))))
+    return rows, errors
+
+
+def decode_give_file(data):
+    """Текст загруженного файла: UTF-8 (с BOM или без), иначе cp1251 из Excel"""
+    for encoding in ('utf-8-sig', 'cp1251'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='replace')
+
+
+def validate_give_rows(session, rows):
+    """Сверяет витрины и артикулы двумя запросами и складывает повторы.
+
+    Возвращает ({(vitrine_id, product_id): количество}, ошибки).
+    """
+    usernames = {username for _, username, _, _ in rows}
+    skus = {sku for _, _, sku, _ in rows}
+    vitrines = dict(session.query(User.username, User.id).filter(
+        User.role == 'vitrine', User.username.in_(usernames)
+    ))
+    products = dict(session.query(Product.sku, Product.id).filter(Product.sku.in_(skus)))
+
+    items, errors = {}, []
+    for line_number, username, sku, quantity in rows:
+        vitrine_id = vitrines.get(username)
+        product_id = products.get(sku)
+        if vitrine_id is None:
+            errors.append((line_number, 'vitrine_not_found', username))
+        if product_id is None:
+            errors.append((line_number, 'product_not_found', sku))
+        if vitrine_id is None or product_id is None:
+            continue
+
+        key = (vitrine_id, product_id)
+        items[key] = items.get(key, 0) + quantity
+        if items[key] > MAX_GIVE_QUANTITY:
+            errors.append((line_number, 'quantity_max_error', str(items[key])))
+
+    return items, errors
+
+
+def create_bulk_give(session, admin_id, rows, parse_errors=()):
+    """Проверяет строки и создает выдачи одной транзакцией.
+
+    parse_errors - ошибки разбора таблицы: они показываются вместе с ошибками
+    сверки с базой. Возвращает (выдачи по витринам, ошибки); при ошибках
+    ничего не записывается.
+    """
+    items, errors = validate_give_rows(session, rows)
+    errors = sorted([*parse_errors, *errors], key=lambda error: error[0])
+    if errors:
+        return [], errors
+
+    now = datetime.utcnow()
+    by_vitrine = {}
+    for (vitrine_id, product_id), quantity in items.items():
+        by_vitrine.setdefault(vitrine_id, []).append((product_id, quantity))
+
+    batches = [
+        GiveBatch(admin_id=admin_id, vitrine_id=vitrine_id, status='pending', items=len(vitrine_items),
+                  quantity=sum(quantity for _, quantity in vitrine_items), created_at=now)
+        for vitrine_id, vitrine_items in by_vitrine.items()
+    ]
+    session.add_all(batches)
+    session.flush()
+
+    transaction_rows = [
+        {
+            'type': 'give',
+            'product_id': product_id,
+            'quantity': quantity,
+            'to_vitrine_id': batch.vitrine_id,
+            'admin_id': admin_id,
+            'status': 'pending',
+            'needs_confirmation': True,
+            'batch_id': batch.id,
+            'created_at': now,
+        }
+        for batch in batches
+        for product_id, quantity in by_vitrine[batch.vitrine_id]
+    ]
+    # Одна вставка на все строки вместо INSERT на каждую операцию
+    session.execute(insert(Transaction), transaction_rows)
+    add_rows_to_rollup(session, transaction_rows)
+    session.commit()
+
+    # Витрины нужны для подписей в логах после закрытия сессии
+    return session.query(GiveBatch).options(joinedload(GiveBatch.vitrine)).filter(
+        GiveBatch.id.in_([batch.id for batch in batches])
+    ).order_by(GiveBatch.id).all(), []
+
+
+def get_batch_transactions(session, batch_id, status=None):
+    """Операции выдачи вместе с товарами в порядке вставки"""
+    query = session.query(Transaction).options(joinedload(Transaction.product)).filter(
+        Transaction.batch_id == batch_id
+    )
+    if status is not None:
+        query = query.filter(Transaction.status == status)
+    return query.order_by(Transaction.id).all()
@@ -0,0 +1,267 @@
+"""
+Каталог товаров: импорт из CSV и кэш в памяти процесса.
+
+Файл каталога читается потоком и применяется пачками по
+CATALOG_IMPORT_BATCH_SIZE строк: на пачку один SELECT уже известных
+артикулов, один INSERT новых товаров и один UPDATE (executemany) измененных.
+Ключ товара - уникальный sku. Неверные строки пропускаются и попадают в
+отчет; весь файл применяется в одной транзакции.
+
+Кэш каталога (catalog_cache) хранит неизменяемые копии товаров по id,
+артикулу и названию. Он загружается при запуске, перечитывается после
+импорта и раз в CATALOG_CACHE_TTL секунд (на случай записи другим процессом),
+а его размер ограничен CATALOG_CACHE_MAX_PRODUCTS товарами.
+"""
+import codecs
+import csv
+import io
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select, insert, update, bindparam
+from database import Product, run_in_session
+from repository import get_product_by_name
+from config import CATALOG_IMPORT_BATCH_SIZE, CATALOG_CACHE_MAX_PRODUCTS, CATALOG_CACHE_TTL
+
+SKU_MAX_LENGTH = Product.__table__.c.sku.type.length
+NAME_MAX_LENGTH = Product.__table__.c.name.type.length
+
+# Сколько неверных строк запоминать для отчета
+MAX_REPORTED_ERRORS = 20
+
+_products = Product.__table__
+
+
+def open_catalog_file(buffer, chunk_size=64 * 1024):
+    """Текстовый поток по загруженному файлу: UTF-8 (с BOM или без), иначе cp1251 из Excel"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    encoding = 'utf-8-sig'
+    try:
+        for chunk in iter(lambda: buffer.read(chunk_size), b''):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        encoding = 'cp1251'
+
+    buffer.seek(0)
+    return io.TextIOWrapper(buffer, encoding=encoding, newline='')
+
+
+def _read_header(stream):
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(stream, dialect)
+    header = [cell.strip().lower() for cell in next(reader, [])]
+    if 'sku' not in header or 'name' not in header:
+        return reader, None
+    columns = {name: header.index(name) for name in ('sku', 'name', 'description') if name in header}
+    return reader, columns
+
+
+def _cell(cells, columns, name):
+    index = columns.get(name)
+    if index is None or index >= len(cells):
+        return ''
+    return cells[index].strip()
+
+
+def _apply_batch(session, batch, result, now, keep_description):
+    existing = {
+        sku: (name, description)
+        for sku, name, description in session.execute(
+            select(_products.c.sku, _products.c.name, _products.c.description)
+            .where(_products.c.sku.in_(list(batch)))
+        )
+    }
+
+    new_rows, changed_rows = [], []
+    for sku, (name, description) in batch.items():
+        if keep_description and sku in existing:
+            # В файле нет колонки description: описание товара не трогаем
+            description = existing[sku][1]
+        if sku not in existing:
+            new_rows.append({'sku': sku, 'name': name, 'description': description, 'created_at': now})
+        elif existing[sku] != (name, description):
+            changed_rows.append({'key_sku': sku, 'new_name': name, 'new_description': description})
+        else:
+            result['unchanged'] += 1
+
+    if new_rows:
+        session.execute(insert(_products), new_rows)
+    if changed_rows:
+        session.execute(
+            update(_products)
+            .where(_products.c.sku == bindparam('key_sku'))
+            .values(name=bindparam('new_name'), description=bindparam('new_description')),
+            changed_rows
+        )
+    result['inserted'] += len(new_rows)
+    result['updated'] += len(changed_rows)
+
+
+def import_catalog(session, stream, batch_size=CATALOG_IMPORT_BATCH_SIZE):
+    """Добавляет новые и обновляет существующие товары из CSV с колонками sku, name, description.
+
+    Возвращает {'inserted', 'updated', 'unchanged', 'invalid', 'errors'}, где
+    errors - первые неверные строки [(номер строки, ключ текста ошибки, значение)].
+    """
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0, 'errors': []}
+
+    def reject(line_number, error_key, value=''):
+        result['invalid'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append((line_number, error_key, value))
+
+    reader, columns = _read_header(stream)
+    if columns is None:
+        reject(1, 'catalog_bad_header')
+        return result
+
+    now = datetime.utcnow()
+    keep_description = 'description' not in columns
+    seen = set()
+    batch = {}
+    for cells in reader:
+        if not any(cell.strip() for cell in cells):
+            continue
+
+        line_number = reader.line_num
+        sku = _cell(cells, columns, 'sku')
+        name = _cell(cells, columns, 'name')
+        description = _cell(cells, columns, 'description') or None
+
+        if not sku:
+            reject(line_number, 'catalog_missing_sku')
+        elif not name:
+            reject(line_number, 'catalog_missing_name', sku)
+        elif len(sku) > SKU_MAX_LENGTH or len(name) > NAME_MAX_LENGTH:
+            reject(line_number, 'catalog_value_too_long', sku[:SKU_MAX_LENGTH])
+        elif sku in seen:
+            reject(line_number, 'catalog_duplicate_sku', sku)
+        else:
+            seen.add(sku)
+            batch[sku] = (name, description)
+            if len(batch) >= batch_size:
+                _apply_batch(session, batch, result, now, keep_description)
+                batch = {}
+
+    if batch:
+        _apply_batch(session, batch, result, now, keep_description)
+    session.commit()
+
+    load_catalog(session)
+    return result
+
+
+# Копия товара в кэше; поля совпадают с колонками products
+CatalogProduct = namedtuple('CatalogProduct', ['id', 'sku', 'name', 'description'])
+
+
+_CatalogSnapshot = namedtuple('_CatalogSnapshot', ['products', 'by_id', 'by_sku', 'by_name', 'complete', 'loaded_at'])
+
+
+class CatalogCache:
+    """Товары каталога в памяти: поиск по id, артикулу и названию без запросов к БД"""
+
+    def __init__(self, max_products=CATALOG_CACHE_MAX_PRODUCTS, ttl=CATALOG_CACHE_TTL):
+        self.max_products = max_products
+        self.ttl = ttl
+        self._snapshot = _CatalogSnapshot((), {}, {}, {}, False, None)
+
+    def replace(self, products, complete):
+        """Подменяет содержимое кэша целиком: читатели видят либо старый, либо новый каталог"""
+        by_name = {}
+        for product in products:
+            # Как и запрос по названию, при совпадении названий берем товар с меньшим id
+            by_name.setdefault(product.name, product)
+
+        self._snapshot = _CatalogSnapshot(
+            tuple(products),
+            {product.id: product for product in products},
+            {product.sku: product for product in products},
+            by_name,
+            complete,
+            time.monotonic(),
+        )
+
+    def is_stale(self):
+        loaded_at = self._snapshot.loaded_at
+        if loaded_at is None:
+            return True
+        return self.ttl > 0 and time.monotonic() - loaded_at > self.ttl
+
+    @property
+    def complete(self):
+        """Весь ли каталог поместился в кэш: тогда промах означает, что товара нет"""
+        return self._snapshot.complete
+
+    def products(self):
+        return list(self._snapshot.products)
+
+    def get(self, product_id):
+        return self._snapshot.by_id.get(product_id)
+
+    def get_by_sku(self, sku):
+        return self._snapshot.by_sku.get(sku)
+
+    def get_by_name(self, name):
+        return self._snapshot.by_name.get(name)
+
+
+catalog_cache = CatalogCache()
+
+
+def _to_cached(product):
+    return CatalogProduct(product.id, product.sku, product.name, product.description)
+
+
+def load_catalog(session):
+    """Перечитывает кэш каталога одним запросом; возвращает число товаров в кэше"""
+    rows = session.execute(
+        select(_products.c.id, _products.c.sku, _products.c.name, _products.c.description)
+        .order_by(_products.c.id)
+        .limit(catalog_cache.max_products + 1)
+    ).all()
+    complete = len(rows) <= catalog_cache.max_products
+    catalog_cache.replace([CatalogProduct(*row) for row in rows[:catalog_cache.max_products]], complete)
+    return len(rows) if complete else catalog_cache.max_products
+
+
+async def ensure_catalog():
+    """Загружает кэш каталога, если он еще пуст или устарел"""
+    if catalog_cache.is_stale():
+        await run_in_session(load_catalog)
+
+
+def _find_product_by_name(session, name):
+    product = get_product_by_name(session, name)
+    return _to_cached(product) if product else None
+
+
+async def get_catalog_products():
+    """Товары каталога для клавиатур выбора"""
+    await ensure_catalog()
+    return catalog_cache.products()
+
+
+async def find_product_by_name(name):
+    """Товар по названию с кнопки; запрос к БД только если каталог не поместился в кэш"""
+    await ensure_catalog()
+    product = catalog_cache.get_by_name(name)
+    if product is None and not catalog_cache.complete:
+        product = await run_in_session(_find_product_by_name, name)
+    return product
+
+
+def get_catalog_product(session, product_id):
+    """Товар по id внутри уже открытой сессии: из кэша, а при промахе - из базы"""
+    product = catalog_cache.get(product_id)
+    if product is None:
+        product = session.query(Product).get(product_id)
+        product = _to_cached(product) if product else None
+    return product
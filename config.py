@@ -1,24 +1,103 @@
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не найден в .env файле!")
-
-ADMIN_IDS = []
-admin_ids_str = os.getenv('ADMIN_IDS', '')
-if admin_ids_str:
-    try:
-        ADMIN_IDS = list(map(int, admin_ids_str.split(',')))
-    except ValueError:
-        print("⚠️ Ошибка в формате ADMIN_IDS")
-
-DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///bot.db')
-DEFAULT_LANGUAGE = os.getenv('DEFAULT_LANGUAGE', 'uz')
-VITRINE_PASSWORD = os.getenv('VITRINE_PASSWORD', 'vitrine123')
-
-print(f"✅ BOT_TOKEN загружен")
-print(f"✅ ADMIN_IDS: {ADMIN_IDS}")
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+if not BOT_TOKEN:
+    raise ValueError("BOT_TOKEN не найден в .env файле!")
+
+ADMIN_IDS = []
+admin_ids_str = os.getenv('ADMIN_IDS', '')
+if admin_ids_str:
+    try:
+        ADMIN_IDS = list(map(int, admin_ids_str.split(',')))
+    except ValueError:
+        print("⚠️ Ошибка в формате ADMIN_IDS")
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///bot.db')
+if DATABASE_URL.startswith('postgres://'):
+    # SQLAlchemy 1.4 понимает только схему postgresql://
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', str(DB_POOL_SIZE)))
+# Маршрут только для чтения (отчеты, журнал, экспорт): реплика Postgres или та же база в отдельном пуле
+DATABASE_READ_URL = os.getenv('DATABASE_READ_URL', '')
+if DATABASE_READ_URL.startswith('postgres://'):
+    DATABASE_READ_URL = DATABASE_READ_URL.replace('postgres://', 'postgresql://', 1)
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', '2'))
+DB_READ_EXECUTOR_WORKERS = int(os.getenv('DB_READ_EXECUTOR_WORKERS', str(DB_READ_POOL_SIZE)))
+
+# Профиль PRAGMA, применяемый к каждому новому соединению SQLite
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+# Период обслуживания SQLite (wal_checkpoint и optimize) в секундах, 0 - отключено
+SQLITE_MAINTENANCE_INTERVAL = int(os.getenv('SQLITE_MAINTENANCE_INTERVAL', '3600'))
+# Завершенные операции старше стольких дней переносятся в помесячные архивы, 0 - не архивировать
+TRANSACTION_ARCHIVE_DAYS = int(os.getenv('TRANSACTION_ARCHIVE_DAYS', '180'))
+# Как часто бот проверяет, что пора архивировать, в секундах
+TRANSACTION_ARCHIVE_INTERVAL = int(os.getenv('TRANSACTION_ARCHIVE_INTERVAL', '86400'))
+# Сверка остатков с историей операций: период в секундах (0 - отключена), сколько секунд
+# выжидать перед учетом новых операций и исправлять ли расхождения автоматически
+RECONCILIATION_INTERVAL = int(os.getenv('RECONCILIATION_INTERVAL', '3600'))
+RECONCILIATION_LAG = int(os.getenv('RECONCILIATION_LAG', '60'))
+RECONCILIATION_AUTO_REPAIR = os.getenv('RECONCILIATION_AUTO_REPAIR', 'false').lower() in ('1', 'true', 'yes')
+# Период снимков остатков в секундах для отчета "остатки на дату", 0 - отключены
+BALANCE_SNAPSHOT_INTERVAL = int(os.getenv('BALANCE_SNAPSHOT_INTERVAL', '86400'))
+# Отправка уведомлений из outbox: период проверки в секундах, записей в пачке и число попыток
+OUTBOX_POLL_INTERVAL = int(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))
+# Сводка продаж: раз в сколько секунд присылать администраторам одно сообщение
+# вместо уведомления о каждой продаже (0 - уведомлять о каждой продаже)
+SALE_DIGEST_INTERVAL = int(os.getenv('SALE_DIGEST_INTERVAL', '0'))
+# Число операций на одной странице журнала
+JOURNAL_PAGE_SIZE = int(os.getenv('JOURNAL_PAGE_SIZE', '10'))
+# Наибольшее число строк в одной массовой выдаче и размер загружаемого файла в байтах
+BULK_GIVE_MAX_ROWS = int(os.getenv('BULK_GIVE_MAX_ROWS', '500'))
+BULK_GIVE_MAX_FILE_SIZE = int(os.getenv('BULK_GIVE_MAX_FILE_SIZE', str(256 * 1024)))
+# Импорт каталога: строк в одной пачке записи и размер файла (Bot API отдает файлы до 20 МБ)
+CATALOG_IMPORT_BATCH_SIZE = int(os.getenv('CATALOG_IMPORT_BATCH_SIZE', '500'))
+CATALOG_IMPORT_MAX_FILE_SIZE = int(os.getenv('CATALOG_IMPORT_MAX_FILE_SIZE', str(20 * 1024 * 1024)))
+# Кэш каталога в памяти: наибольшее число товаров и период перечитывания в секундах (0 - только при импорте)
+CATALOG_CACHE_MAX_PRODUCTS = int(os.getenv('CATALOG_CACHE_MAX_PRODUCTS', '20000'))
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))
+# Кэш пользователей в памяти: число записей и время жизни записи в секундах (0 - без кэша)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+# Сколько секунд не пытаться писать в чат, заблокировавший бота или не найденный (0 - не запоминать)
+CHAT_UNREACHABLE_TTL = int(os.getenv('CHAT_UNREACHABLE_TTL', '3600'))
+# В сколько чатов одновременно отправлять уведомления
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '8'))
+# Очередь отправки: сообщений в секунду на всех и в один чат, всплеск в один чат,
+# повторов после RetryAfter и период вывода глубины очереди в секундах (0 - не выводить)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', '5'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+OUTBOUND_METRICS_INTERVAL = int(os.getenv('OUTBOUND_METRICS_INTERVAL', '60'))
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Webhook: публичный адрес (пусто - не регистрировать в Telegram), путь, адрес и порт сервера,
+# секретный токен и сколько секунд дожидаться принятых обновлений при остановке
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv('WEBHOOK_SHUTDOWN_TIMEOUT', '30'))
+DEFAULT_LANGUAGE = os.getenv('DEFAULT_LANGUAGE', 'uz')
+VITRINE_PASSWORD = os.getenv('VITRINE_PASSWORD', 'vitrine123')
+
+print(f"✅ BOT_TOKEN загружен")
+print(f"✅ ADMIN_IDS: {ADMIN_IDS}")
 print(f"✅ DEFAULT_LANGUAGE: {DEFAULT_LANGUAGE}")
\ No newline at end of file
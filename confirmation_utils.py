@@ -1,287 +1,466 @@
-from aiogram import types
-from database import Database, Transaction, Balance, User
-from keyboards import get_confirmation_reply_keyboard
-from utils import safe_send_message, get_text
-from config import ADMIN_IDS
-from logger import log_operation, log_error
-
-db = Database('sqlite:///bot.db')
-
-
-def get_session():
-    return db.get_session()
-
-
-async def update_balances(transaction, session):
-    """Обновляет балансы после подтверждения операции"""
-    try:
-        if transaction.type == 'give':
-            # Обновляем баланс получателя
-            balance = session.query(Balance).filter_by(
-                vitrine_id=transaction.to_vitrine_id,
-                product_id=transaction.product_id
-            ).first()
-
-            if not balance:
-                balance = Balance(
-                    vitrine_id=transaction.to_vitrine_id,
-                    product_id=transaction.product_id,
-                    quantity=transaction.quantity
-                )
-                session.add(balance)
-            else:
-                balance.quantity += transaction.quantity
-
-        elif transaction.type == 'return':
-            # Уменьшаем баланс витрины
-            balance = session.query(Balance).filter_by(
-                vitrine_id=transaction.from_vitrine_id,
-                product_id=transaction.product_id
-            ).first()
-
-            if balance and balance.quantity >= transaction.quantity:
-                balance.quantity -= transaction.quantity
-            else:
-                raise Exception(get_text('not_enough_products', 'en'))
-
-        elif transaction.type == 'transfer':
-            # Уменьшаем баланс отправителя, увеличиваем баланс получателя
-            from_balance = session.query(Balance).filter_by(
-                vitrine_id=transaction.from_vitrine_id,
-                product_id=transaction.product_id
-            ).first()
-
-            if not from_balance or from_balance.quantity < transaction.quantity:
-                raise Exception(get_text('not_enough_products', 'en'))
-
-            from_balance.quantity -= transaction.quantity
-
-            to_balance = session.query(Balance).filter_by(
-                vitrine_id=transaction.to_vitrine_id,
-                product_id=transaction.product_id
-            ).first()
-
-            if not to_balance:
-                to_balance = Balance(
-                    vitrine_id=transaction.to_vitrine_id,
-                    product_id=transaction.product_id,
-                    quantity=transaction.quantity
-                )
-                session.add(to_balance)
-            else:
-                to_balance.quantity += transaction.quantity
-
-        session.commit()
-
-    except Exception as e:
-        session.rollback()
-        raise e
-
-
-async def send_confirmation_request(transaction_id, bot):
-    """Отправляет запрос на подтверждение операции с reply-кнопками"""
-    session = get_session()
-    try:
-        transaction = session.query(Transaction).get(transaction_id)
-        if not transaction:
-            print(f"❌ {get_text('transaction_not_found', 'en')} {transaction_id}")
-            return False
-
-        # Определяем кому отправлять подтверждение
-        if transaction.type == 'give':
-            target_user = transaction.to_vitrine
-        elif transaction.type == 'return':
-            # Для возврата ищем администратора
-            if transaction.admin_id:
-                target_user = session.query(User).get(transaction.admin_id)
-            else:
-                # Если admin_id не установлен, ищем первого активного админа
-                target_user = session.query(User).filter_by(role='admin').first()
-                if target_user:
-                    transaction.admin_id = target_user.id
-                    session.commit()
-        elif transaction.type == 'transfer':
-            target_user = transaction.to_vitrine
-        else:
-            return True
-
-        if not target_user:
-            print(f"❌ {get_text('target_user_not_found', 'en')} {transaction_id}")
-            return False
-
-        message_text = format_confirmation_message(transaction, target_user.language)
-
-        # Используем безопасную отправку с динамической клавиатурой
-        success = await safe_send_message(
-            bot,
-            target_user.telegram_id,
-            message_text,
-            reply_markup=get_confirmation_reply_keyboard(transaction_id, target_user.language)
-        )
-
-        if success:
-            transaction.needs_confirmation = True
-            session.commit()
-            print(
-                f"✅ {get_text('confirmation_request_sent', 'en')} {target_user.username} (ID: {target_user.telegram_id})")
-            return True
-        else:
-            print(f"❌ {get_text('confirmation_send_error', 'en')} {target_user.telegram_id}")
-            return False
-
-    except Exception as e:
-        print(f"❌ {get_text('confirmation_error', 'en')}: {e}")
-        session.rollback()
-        return False
-    finally:
-        session.close()
-
-
-def format_confirmation_message(transaction, language='en'):
-    """Форматирует сообщение для подтверждения"""
-    product = transaction.product
-
-    if transaction.type == 'give':
-        from_user = transaction.admin
-        message = (
-            f"📦 {get_text('give_request_title', language)}\n\n"
-            f"{get_text('admin', language)} {from_user.username} {get_text('sending_product', language)}:\n"
-            f"📦 {get_text('product', language)}: {product.name}\n"
-            f"🔢 {get_text('quantity', language)}: {transaction.quantity} {get_text('pcs', language)}\n\n"
-            f"{get_text('confirm_receipt', language)}:"
-        )
-
-    elif transaction.type == 'return':
-        from_user = transaction.from_vitrine
-        message = (
-            f"🔄 {get_text('return_request_title', language)}\n\n"
-            f"{get_text('vitrines', language)} {from_user.username} {get_text('returning_product', language)}:\n"
-            f"📦 {get_text('product', language)}: {product.name}\n"
-            f"🔢 {get_text('quantity', language)}: {transaction.quantity} {get_text('pcs', language)}\n\n"
-            f"{get_text('confirm_return', language)}:"
-        )
-
-    elif transaction.type == 'transfer':
-        from_user = transaction.from_vitrine
-        message = (
-            f"🔄 {get_text('transfer_request_title', language)}\n\n"
-            f"{get_text('product_transfer_from', language)} {from_user.username} {get_text('to_you', language)}:\n"
-            f"📦 {get_text('product', language)}: {product.name}\n"
-            f"🔢 {get_text('quantity', language)}: {transaction.quantity} {get_text('pcs', language)}\n\n"
-            f"{get_text('confirm_receipt', language)}:"
-        )
-
-    return message
-
-
-async def process_confirmation_reply(message: types.Message, confirm: bool, transaction_id: int = None):
-    """Обрабатывает подтверждение/отклонение операции из reply-кнопок"""
-    session = get_session()
-    try:
-        # Если transaction_id не передан, пытаемся извлечь из текста
-        if transaction_id is None:
-            text = message.text
-            # Пытаемся извлечь ID из текста (последний элемент после разделения по _)
-            try:
-                transaction_id = int(text.split("_")[-1])
-            except (IndexError, ValueError):
-                print(f"❌ Не удалось извлечь ID транзакции из текста: {text}")
-                return False
-
-        transaction = session.query(Transaction).get(transaction_id)
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        user_language = user.language if user else 'en'
-
-        if not transaction or transaction.status != 'pending':
-            await message.answer(get_text('already_processed', user_language))
-            return True
-
-        if confirm:
-            transaction.status = 'confirmed'
-            transaction.confirmed_by = user.id
-            await update_balances(transaction, session)
-            await send_confirmation_notification(transaction, True, message.bot)
-
-            # Логируем подтверждение
-            log_operation(transaction.id, f'{transaction.type}_confirmed',
-                          f"{get_text('confirmed_by_user', 'en')} {user.username}")
-
-            await message.answer(get_text('operation_confirmed', user_language),
-                                 reply_markup=types.ReplyKeyboardRemove())
-        else:
-            transaction.status = 'rejected'
-            await send_confirmation_notification(transaction, False, message.bot)
-
-            # Логируем отклонение
-            log_operation(transaction.id, f'{transaction.type}_rejected',
-                          f"{get_text('rejected_by_user', 'en')} {user.username}")
-
-            await message.answer(get_text('operation_rejected', user_language),
-                                 reply_markup=types.ReplyKeyboardRemove())
-
-        session.commit()
-        return True
-
-    except Exception as e:
-        log_error('confirmation_processing', str(e), message.from_user.id)
-        print(f"❌ {get_text('confirmation_processing_error', 'en')}: {e}")
-        session.rollback()
-        await message.answer(get_text('error_occurred', 'en'), reply_markup=types.ReplyKeyboardRemove())
-        return False
-    finally:
-        session.close()
-
-
-async def send_confirmation_notification(transaction, confirmed, bot):
-    """Отправляет уведомление о результате подтверждения с полной динамической локализацией"""
-    try:
-        session = get_session()
-
-        # Определяем целевого пользователя и тип сообщения
-        if transaction.type == 'give':
-            target_user = transaction.admin
-            if confirmed:
-                message_key = 'give_confirmed_notification'
-            else:
-                message_key = 'give_rejected_notification'
-
-        elif transaction.type == 'return':
-            target_user = transaction.from_vitrine
-            if confirmed:
-                message_key = 'return_confirmed_notification'
-            else:
-                message_key = 'return_rejected_notification'
-
-        elif transaction.type == 'transfer':
-            target_user = transaction.from_vitrine
-            if confirmed:
-                message_key = 'transfer_confirmed_notification'
-            else:
-                message_key = 'transfer_rejected_notification'
-        else:
-            session.close()
-            return
-
-        if target_user:
-            # Получаем язык пользователя
-            user_language = target_user.language if target_user.language else 'en'
-
-            # Формируем сообщение с динамической локализацией
-            product_info = f"\n📦 {transaction.product.name} - {transaction.quantity} {get_text('pcs', user_language)}"
-
-            if confirmed:
-                status_emoji = "✅"
-                base_message = get_text(message_key, user_language)
-            else:
-                status_emoji = "❌"
-                base_message = get_text(message_key, user_language)
-
-            message = f"{status_emoji} {base_message}{product_info}"
-
-            # Используем безопасную отправку
-            await safe_send_message(bot, target_user.telegram_id, message)
-
-        session.close()
-
-    except Exception as e:
-        print(f"❌ {get_text('notification_send_error', 'en')}: {e}")
\ No newline at end of file
+from datetime import datetime
+from aiogram import types
+from sqlalchemy.orm import joinedload
+from database import Transaction, User, GiveBatch, run_in_session
+from repository import get_user_by_telegram_id, get_transaction_details
+from balance_utils import increase_balance, decrease_balance, lock_balances, record_movements
+from rollup_utils import move_rollup_status
+from bulk_give_utils import get_batch_transactions
+from keyboards import get_confirmation_reply_keyboard, get_batch_confirmation_reply_keyboard
+from utils import safe_send_message, fan_out_messages, get_text
+from config import ADMIN_IDS
+from logger import log_operation, log_batch_operation, log_error
+from outbox_utils import enqueue_message, notify_outbox
+from outbound_utils import send_priority, PRIORITY_CONFIRMATION
+
+# Сколько строк выдачи показывать в одном сообщении
+BATCH_MESSAGE_ITEMS = 50
+
+
+def apply_balance_changes(transaction, session):
+    """Меняет остатки и итоги движений по подтвержденной операции, не завершая транзакцию"""
+    if transaction.type == 'give':
+        # Обновляем баланс получателя
+        increase_balance(session, transaction.to_vitrine_id, transaction.product_id, transaction.quantity)
+
+    elif transaction.type == 'return':
+        # Уменьшаем баланс витрины
+        if not decrease_balance(session, transaction.from_vitrine_id, transaction.product_id,
+                                transaction.quantity):
+            raise Exception(get_text('not_enough_products', 'en'))
+
+    elif transaction.type == 'transfer':
+        # Уменьшаем баланс отправителя, увеличиваем баланс получателя
+        lock_balances(session, [(transaction.from_vitrine_id, transaction.product_id),
+                                (transaction.to_vitrine_id, transaction.product_id)])
+        if not decrease_balance(session, transaction.from_vitrine_id, transaction.product_id,
+                                transaction.quantity):
+            raise Exception(get_text('not_enough_products', 'en'))
+
+        increase_balance(session, transaction.to_vitrine_id, transaction.product_id, transaction.quantity)
+
+    # Итоги для отчетов меняются в той же транзакции, что и остатки
+    record_movements(session, transaction)
+
+
+def update_balances(transaction, session):
+    """Обновляет балансы после подтверждения операции"""
+    try:
+        apply_balance_changes(transaction, session)
+        session.commit()
+
+    except Exception as e:
+        session.rollback()
+        raise e
+
+
+def _prepare_confirmation_request(session, transaction_id):
+    """Находит получателя запроса и готовит текст; возвращает None, если отправлять некому"""
+    transaction = get_transaction_details(session, transaction_id)
+    if not transaction:
+        print(f"❌ {get_text('transaction_not_found', 'en')} {transaction_id}")
+        return None
+
+    # Определяем кому отправлять подтверждение
+    if transaction.type == 'give':
+        target_user = transaction.to_vitrine
+    elif transaction.type == 'return':
+        # Для возврата ищем администратора
+        if transaction.admin_id:
+            target_user = session.query(User).get(transaction.admin_id)
+        else:
+            # Если admin_id не установлен, ищем первого активного админа
+            target_user = session.query(User).filter_by(role='admin').first()
+            if target_user:
+                transaction.admin_id = target_user.id
+                session.commit()
+    elif transaction.type == 'transfer':
+        target_user = transaction.to_vitrine
+    else:
+        return None
+
+    if not target_user:
+        print(f"❌ {get_text('target_user_not_found', 'en')} {transaction_id}")
+        return None
+
+    message_text = format_confirmation_message(transaction, target_user.language)
+    return target_user.telegram_id, target_user.username, target_user.language, message_text
+
+
+def _mark_needs_confirmation(session, transaction_id):
+    transaction = session.query(Transaction).get(transaction_id)
+    if transaction:
+        transaction.needs_confirmation = True
+        session.commit()
+
+
+async def send_confirmation_request(transaction_id, bot):
+    """Отправляет запрос на подтверждение операции с reply-кнопками"""
+    try:
+        request = await run_in_session(_prepare_confirmation_request, transaction_id)
+        if request is None:
+            return False
+
+        target_telegram_id, target_username, target_language, message_text = request
+
+        # Используем безопасную отправку с динамической клавиатурой
+        with send_priority(PRIORITY_CONFIRMATION):
+            success = await safe_send_message(
+                bot,
+                target_telegram_id,
+                message_text,
+                reply_markup=get_confirmation_reply_keyboard(transaction_id, target_language)
+            )
+
+        if success:
+            await run_in_session(_mark_needs_confirmation, transaction_id)
+            print(
+                f"✅ {get_text('confirmation_request_sent', 'en')} {target_username} (ID: {target_telegram_id})")
+            return True
+        else:
+            print(f"❌ {get_text('confirmation_send_error', 'en')} {target_telegram_id}")
+            return False
+
+    except Exception as e:
+        print(f"❌ {get_text('confirmation_error', 'en')}: {e}")
+        return False
+
+
+def _assign_return_admin(session, transaction_id, admin_id):
+    transaction = session.query(Transaction).get(transaction_id)
+    if transaction:
+        transaction.admin_id = admin_id
+        transaction.needs_confirmation = True
+        session.commit()
+
+
+async def send_return_confirmation_requests(transaction_id, admins, bot):
+    """Отправляет запрос на возврат всем администраторам сразу; возвращает тех, кому он доставлен.
+
+    Возврат подтверждает первый ответивший администратор, а admin_id
+    операции получает первый из admins, кому запрос дошел.
+    """
+    try:
+        transaction = await run_in_session(get_transaction_details, transaction_id)
+        if not transaction or not admins:
+            return []
+
+        with send_priority(PRIORITY_CONFIRMATION):
+            results = await fan_out_messages(bot, [
+                (admin.telegram_id, format_confirmation_message(transaction, admin.language),
+                 get_confirmation_reply_keyboard(transaction_id, admin.language))
+                for admin in admins
+            ])
+        delivered = [admin for admin, reason in zip(admins, results) if reason is None]
+        for admin, reason in zip(admins, results):
+            if reason is not None:
+                print(f"❌ {get_text('confirmation_send_error', 'en')} {admin.telegram_id} ({reason})")
+
+        if delivered:
+            await run_in_session(_assign_return_admin, transaction_id, delivered[0].id)
+            print(f"✅ {get_text('confirmation_request_sent', 'en')} "
+                  f"{', '.join(admin.username for admin in delivered)}")
+        return delivered
+
+    except Exception as e:
+        print(f"❌ {get_text('confirmation_error', 'en')}: {e}")
+        return []
+
+
+def _format_batch_items(transactions, language):
+    lines = [f"📦 {transaction.product.name} - {transaction.quantity} {get_text('pcs', language)}"
+             for transaction in transactions[:BATCH_MESSAGE_ITEMS]]
+    if len(transactions) > BATCH_MESSAGE_ITEMS:
+        lines.append(get_text('and_more', language, count=len(transactions) - BATCH_MESSAGE_ITEMS))
+    return "\n".join(lines)
+
+
+def format_batch_confirmation_message(batch, transactions, language='en'):
+    """Одно сообщение на всю массовую выдачу витрине"""
+    return (
+        f"📦 {get_text('give_request_title', language)}\n\n"
+        f"{get_text('admin', language)} {batch.admin.username} {get_text('sending_product', language)}:\n"
+        f"{_format_batch_items(transactions, language)}\n"
+        f"🔢 {get_text('bulk_give_total', language)}: {batch.quantity} {get_text('pcs', language)}\n\n"
+        f"{get_text('confirm_receipt', language)}:"
+    )
+
+
+def _prepare_batch_confirmation_request(session, batch_id):
+    batch = session.query(GiveBatch).options(
+        joinedload(GiveBatch.admin), joinedload(GiveBatch.vitrine)
+    ).filter(GiveBatch.id == batch_id).first()
+    if not batch or not batch.vitrine:
+        print(f"❌ {get_text('target_user_not_found', 'en')} B{batch_id}")
+        return None
+
+    target_user = batch.vitrine
+    message_text = format_batch_confirmation_message(
+        batch, get_batch_transactions(session, batch_id), target_user.language
+    )
+    return target_user.telegram_id, target_user.username, target_user.language, message_text
+
+
+async def send_batch_confirmation_request(batch_id, bot):
+    """Отправляет витрине один запрос на подтверждение всей выдачи"""
+    try:
+        request = await run_in_session(_prepare_batch_confirmation_request, batch_id)
+        if request is None:
+            return False
+
+        target_telegram_id, target_username, target_language, message_text = request
+        with send_priority(PRIORITY_CONFIRMATION):
+            success = await safe_send_message(
+                bot,
+                target_telegram_id,
+                message_text,
+                reply_markup=get_batch_confirmation_reply_keyboard(batch_id, target_language)
+            )
+
+        if success:
+            print(
+                f"✅ {get_text('confirmation_request_sent', 'en')} {target_username} (ID: {target_telegram_id})")
+        else:
+            print(f"❌ {get_text('confirmation_send_error', 'en')} {target_telegram_id}")
+        return success
+
+    except Exception as e:
+        print(f"❌ {get_text('confirmation_error', 'en')}: {e}")
+        return False
+
+
+def format_confirmation_message(transaction, language='en'):
+    """Форматирует сообщение для подтверждения"""
+    product = transaction.product
+
+    if transaction.type == 'give':
+        from_user = transaction.admin
+        message = (
+            f"📦 {get_text('give_request_title', language)}\n\n"
+            f"{get_text('admin', language)} {from_user.username} {get_text('sending_product', language)}:\n"
+            f"📦 {get_text('product', language)}: {product.name}\n"
+            f"🔢 {get_text('quantity', language)}: {transaction.quantity} {get_text('pcs', language)}\n\n"
+            f"{get_text('confirm_receipt', language)}:"
+        )
+
+    elif transaction.type == 'return':
+        from_user = transaction.from_vitrine
+        message = (
+            f"🔄 {get_text('return_request_title', language)}\n\n"
+            f"{get_text('vitrines', language)} {from_user.username} {get_text('returning_product', language)}:\n"
+            f"📦 {get_text('product', language)}: {product.name}\n"
+            f"🔢 {get_text('quantity', language)}: {transaction.quantity} {get_text('pcs', language)}\n\n"
+            f"{get_text('confirm_return', language)}:"
+        )
+
+    elif transaction.type == 'transfer':
+        from_user = transaction.from_vitrine
+        message = (
+            f"🔄 {get_text('transfer_request_title', language)}\n\n"
+            f"{get_text('product_transfer_from', language)} {from_user.username} {get_text('to_you', language)}:\n"
+            f"📦 {get_text('product', language)}: {product.name}\n"
+            f"🔢 {get_text('quantity', language)}: {transaction.quantity} {get_text('pcs', language)}\n\n"
+            f"{get_text('confirm_receipt', language)}:"
+        )
+
+    return message
+
+
+def _enqueue_notification(session, notification):
+    """Записывает уведомление (chat_id, текст) в outbox той же транзакции"""
+    if notification:
+        enqueue_message(session, *notification)
+
+
+def _apply_confirmation(session, transaction_id, telegram_id, confirm):
+    """Меняет статус операции и балансы вместе с уведомлением; возвращает (язык пользователя, обработана ли)"""
+    transaction = get_transaction_details(session, transaction_id)
+    user = get_user_by_telegram_id(session, telegram_id)
+    user_language = user.language if user else 'en'
+
+    if not transaction or transaction.status != 'pending':
+        return user_language, False
+
+    # Атомарно забираем операцию: повторное или одновременное нажатие кнопки
+    # дождется блокировки строки и не найдет ее в статусе pending
+    new_values = {'status': 'confirmed', 'confirmed_by': user.id, 'confirmed_at': datetime.utcnow()} \
+        if confirm else {'status': 'rejected'}
+    claimed = session.query(Transaction).filter_by(id=transaction_id, status='pending').update(new_values)
+    if not claimed:
+        session.rollback()
+        return user_language, False
+
+    move_rollup_status(session, transaction, 'pending', new_values['status'])
+    _enqueue_notification(session, format_confirmation_notification(transaction, confirm))
+
+    if confirm:
+        update_balances(transaction, session)
+
+        # Логируем подтверждение
+        log_operation(transaction.id, f'{transaction.type}_confirmed',
+                      f"{get_text('confirmed_by_user', 'en')} {user.username}")
+    else:
+        session.commit()
+
+        # Логируем отклонение
+        log_operation(transaction.id, f'{transaction.type}_rejected',
+                      f"{get_text('rejected_by_user', 'en')} {user.username}")
+
+    return user_language, True
+
+
+def _apply_batch_confirmation(session, batch_id, telegram_id, confirm):
+    """Подтверждает или отклоняет все операции массовой выдачи в одной транзакции"""
+    user = get_user_by_telegram_id(session, telegram_id)
+    user_language = user.language if user else 'en'
+
+    # Как и для одной операции: выдачу забирает только первое нажатие
+    new_values = {'status': 'confirmed', 'confirmed_by': user.id} if confirm else {'status': 'rejected'}
+    claimed = session.query(GiveBatch).filter_by(id=batch_id, status='pending').update(new_values)
+    if not claimed:
+        session.rollback()
+        return user_language, False
+
+    batch = session.query(GiveBatch).options(
+        joinedload(GiveBatch.admin), joinedload(GiveBatch.vitrine)
+    ).filter(GiveBatch.id == batch_id).one()
+    transactions = get_batch_transactions(session, batch_id, status='pending')
+    transaction_values = {**new_values, 'confirmed_at': datetime.utcnow()} if confirm else new_values
+    session.query(Transaction).filter_by(batch_id=batch_id, status='pending').update(
+        transaction_values, synchronize_session=False
+    )
+
+    try:
+        for transaction in transactions:
+            move_rollup_status(session, transaction, 'pending', new_values['status'])
+            if confirm:
+                apply_balance_changes(transaction, session)
+        _enqueue_notification(session, format_batch_confirmation_notification(batch, transactions, confirm))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    if confirm:
+        log_batch_operation(batch_id, 'bulk_give_confirmed', len(transactions), batch.quantity,
+                            f"{get_text('confirmed_by_user', 'en')} {user.username}")
+    else:
+        log_batch_operation(batch_id, 'bulk_give_rejected', len(transactions), batch.quantity,
+                            f"{get_text('rejected_by_user', 'en')} {user.username}")
+
+    return user_language, True
+
+
+async def process_confirmation_reply(message: types.Message, confirm: bool, transaction_id: int = None,
+                                     batch_id: int = None):
+    """Обрабатывает подтверждение/отклонение операции или массовой выдачи из reply-кнопок"""
+    try:
+        # Если transaction_id не передан, пытаемся извлечь из текста
+        if transaction_id is None and batch_id is None:
+            text = message.text
+            # Пытаемся извлечь ID из текста (последний элемент после разделения по _)
+            try:
+                transaction_id = int(text.split("_")[-1])
+            except (IndexError, ValueError):
+                print(f"❌ Не удалось извлечь ID транзакции из текста: {text}")
+                return False
+
+        if batch_id is not None:
+            user_language, processed = await run_in_session(
+                _apply_batch_confirmation, batch_id, message.from_user.id, confirm
+            )
+        else:
+            user_language, processed = await run_in_session(
+                _apply_confirmation, transaction_id, message.from_user.id, confirm
+            )
+
+        if not processed:
+            await message.answer(get_text('already_processed', user_language))
+            return True
+
+        notify_outbox()
+
+        if confirm:
+            await message.answer(get_text('operation_confirmed', user_language),
+                                 reply_markup=types.ReplyKeyboardRemove())
+        else:
+            await message.answer(get_text('operation_rejected', user_language),
+                                 reply_markup=types.ReplyKeyboardRemove())
+
+        return True
+
+    except Exception as e:
+        log_error('confirmation_processing', str(e), message.from_user.id)
+        print(f"❌ {get_text('confirmation_processing_error', 'en')}: {e}")
+        await message.answer(get_text('error_occurred', 'en'), reply_markup=types.ReplyKeyboardRemove())
+        return False
+
+
+def format_confirmation_notification(transaction, confirmed):
+    """Готовит уведомление о результате подтверждения: (chat_id, текст) или None"""
+    try:
+        # Определяем целевого пользователя и тип сообщения
+        if transaction.type == 'give':
+            target_user = transaction.admin
+            if confirmed:
+                message_key = 'give_confirmed_notification'
+            else:
+                message_key = 'give_rejected_notification'
+
+        elif transaction.type == 'return':
+            target_user = transaction.from_vitrine
+            if confirmed:
+                message_key = 'return_confirmed_notification'
+            else:
+                message_key = 'return_rejected_notification'
+
+        elif transaction.type == 'transfer':
+            target_user = transaction.from_vitrine
+            if confirmed:
+                message_key = 'transfer_confirmed_notification'
+            else:
+                message_key = 'transfer_rejected_notification'
+        else:
+            return None
+
+        if not target_user:
+            return None
+
+        # Получаем язык пользователя
+        user_language = target_user.language if target_user.language else 'en'
+
+        # Формируем сообщение с динамической локализацией
+        product_info = f"\n📦 {transaction.product.name} - {transaction.quantity} {get_text('pcs', user_language)}"
+
+        if confirmed:
+            status_emoji = "✅"
+            base_message = get_text(message_key, user_language)
+        else:
+            status_emoji = "❌"
+            base_message = get_text(message_key, user_language)
+
+        return target_user.telegram_id, f"{status_emoji} {base_message}{product_info}"
+
+    except Exception as e:
+        print(f"❌ {get_text('notification_send_error', 'en')}: {e}")
+        return None
+
+
+def format_batch_confirmation_notification(batch, transactions, confirmed):
+    """Уведомление администратору о результате массовой выдачи: (chat_id, текст) или None"""
+    target_user = batch.admin
+    if not target_user:
+        return None
+
+    user_language = target_user.language if target_user.language else 'en'
+    if confirmed:
+        status_emoji = "✅"
+        base_message = get_text('give_confirmed_notification', user_language)
+    else:
+        status_emoji = "❌"
+        base_message = get_text('give_rejected_notification', user_language)
+
+    return target_user.telegram_id, (
+        f"{status_emoji} {base_message}\n🏪 {batch.vitrine.username}\n"
+        f"{_format_batch_items(transactions, user_language)}"
+    )
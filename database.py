@@ -1,133 +1,530 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text, Boolean, inspect
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
-from config import ADMIN_IDS
-
-Base = declarative_base()
-
-class User(Base):
-    __tablename__ = 'users'
-    id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
-    username = Column(String(100))
-    role = Column(String(20), nullable=False)
-    language = Column(String(5), default='ru')
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-
-class Product(Base):
-    __tablename__ = 'products'
-    id = Column(Integer, primary_key=True)
-    sku = Column(String(50), unique=True, nullable=False)
-    name = Column(String(200), nullable=False)
-    description = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-
-class Transaction(Base):
-    __tablename__ = 'transactions'
-    id = Column(Integer, primary_key=True)
-    type = Column(String(20), nullable=False)
-    product_id = Column(Integer, ForeignKey('products.id'))
-    quantity = Column(Integer, nullable=False)
-    from_vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=True)
-    to_vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=True)
-    admin_id = Column(Integer, ForeignKey('users.id'), nullable=True)
-    status = Column(String(20), default='pending')
-    needs_confirmation = Column(Boolean, default=False)
-    confirmed_by = Column(Integer, ForeignKey('users.id'), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    product = relationship('Product')
-    from_vitrine = relationship('User', foreign_keys=[from_vitrine_id])
-    to_vitrine = relationship('User', foreign_keys=[to_vitrine_id])
-    admin = relationship('User', foreign_keys=[admin_id])
-    confirmer = relationship('User', foreign_keys=[confirmed_by])
-
-
-class Balance(Base):
-    __tablename__ = 'balances'
-    id = Column(Integer, primary_key=True)
-    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
-    quantity = Column(Integer, default=0)
-    updated_at = Column(DateTime, default=datetime.utcnow)
-
-    vitrine = relationship('User')
-    product = relationship('Product')
-
-
-class Database:
-    def __init__(self, database_url):
-        self.engine = create_engine(database_url)
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-
-    def init_db(self):
-        # Создаем таблицы если они не существуют
-        Base.metadata.create_all(bind=self.engine)
-        print("✅ Таблицы проверены/созданы")
-
-        # Добавляем тестовые данные только если таблицы пустые
-        self._add_sample_data()
-        self._add_admin_users()
-
-    def _add_sample_data(self):
-        """Добавляет тестовые товары только если таблица продуктов пустая"""
-        session = self.get_session()
-        try:
-            if session.query(Product).count() == 0:
-                products = [
-                    Product(sku="SKU-001", name="Смартфон Samsung", description="Флагманский смартфон"),
-                    Product(sku="SKU-002", name="Ноутбук HP", description="Игровой ноутбук"),
-                    Product(sku="SKU-003", name="Наушники Sony", description="Беспроводные наушники"),
-                ]
-                session.add_all(products)
-                session.commit()
-                print("✅ Тестовые товары добавлены")
-            else:
-                print("✅ Товары уже есть в базе")
-        except Exception as e:
-            print(f"⚠️ Ошибка добавления товаров: {e}")
-            session.rollback()
-        finally:
-            session.close()
-
-    def _add_admin_users(self):
-        """Добавляет администраторов из config.py в базу данных если их нет"""
-        session = self.get_session()
-        try:
-            admins_added = 0
-            for admin_id in ADMIN_IDS:
-                # Проверяем, существует ли уже администратор
-                existing_admin = session.query(User).filter_by(telegram_id=admin_id).first()
-                if not existing_admin:
-                    admin_user = User(
-                        telegram_id=admin_id,
-                        username=f"admin_{admin_id}",
-                        role='admin',
-                        language='ru'
-                    )
-                    session.add(admin_user)
-                    admins_added += 1
-                    print(f"✅ Добавлен администратор с ID: {admin_id}")
-                else:
-                    # Обновляем роль на admin, если пользователь уже существует но с другой ролью
-                    if existing_admin.role != 'admin':
-                        existing_admin.role = 'admin'
-                        print(f"✅ Обновлена роль пользователя {existing_admin.username} на администратора")
-
-            session.commit()
-            if admins_added > 0:
-                print(f"✅ Добавлено {admins_added} администраторов в базу данных")
-            else:
-                print("✅ Администраторы уже есть в базе")
-
-        except Exception as e:
-            print(f"⚠️ Ошибка добавления администраторов: {e}")
-            session.rollback()
-        finally:
-            session.close()
-
-    def get_session(self):
-        return self.SessionLocal()
\ No newline at end of file
+import asyncio
+import functools
+import os
+import sqlite3
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, text, Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Text, Boolean, Index, inspect
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
+from datetime import datetime
+from migrations import run_migrations
+from config import (ADMIN_IDS, DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING,
+                    DB_POOL_RECYCLE, DB_EXECUTOR_WORKERS, DATABASE_READ_URL, DB_READ_POOL_SIZE,
+                    DB_READ_EXECUTOR_WORKERS, SQLITE_PRAGMAS, SQLITE_MAINTENANCE_INTERVAL)
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(BigInteger, unique=True, nullable=False)
+    username = Column(String(100))
+    role = Column(String(20), nullable=False)
+    language = Column(String(5), default='ru')
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_users_role', 'role'),
+    )
+
+
+class Product(Base):
+    __tablename__ = 'products'
+    id = Column(Integer, primary_key=True)
+    sku = Column(String(50), unique=True, nullable=False)
+    name = Column(String(200), nullable=False)
+    description = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_products_name', 'name'),
+    )
+
+
+class Transaction(Base):
+    __tablename__ = 'transactions'
+    id = Column(Integer, primary_key=True)
+    type = Column(String(20), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'))
+    quantity = Column(Integer, nullable=False)
+    from_vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    to_vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    admin_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    status = Column(String(20), default='pending')
+    needs_confirmation = Column(Boolean, default=False)
+    confirmed_by = Column(Integer, ForeignKey('users.id'), nullable=True)
+    batch_id = Column(Integer, ForeignKey('give_batches.id'), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Когда операция изменила остатки: при подтверждении, а продажа и изъятие - сразу
+    confirmed_at = Column(DateTime, nullable=True)
+
+    product = relationship('Product')
+    from_vitrine = relationship('User', foreign_keys=[from_vitrine_id])
+    to_vitrine = relationship('User', foreign_keys=[to_vitrine_id])
+    admin = relationship('User', foreign_keys=[admin_id])
+    confirmer = relationship('User', foreign_keys=[confirmed_by])
+
+    # Индексы совпадают с migrations.py: новые базы получают их через create_all
+    __table_args__ = (
+        Index('ix_transactions_created_at', 'created_at', 'id'),
+        Index('ix_transactions_from_vitrine', 'from_vitrine_id', 'created_at'),
+        Index('ix_transactions_to_vitrine', 'to_vitrine_id', 'created_at'),
+        Index('ix_transactions_status_type', 'status', 'type'),
+        Index('ix_transactions_type_created_at', 'type', 'created_at'),
+        Index('ix_transactions_batch', 'batch_id'),
+        Index('ix_transactions_confirmed_at', 'confirmed_at'),
+    )
+
+
+class GiveBatch(Base):
+    """Массовая выдача одной витрине: все ее операции подтверждаются одним нажатием"""
+    __tablename__ = 'give_batches'
+    id = Column(Integer, primary_key=True)
+    admin_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    status = Column(String(20), default='pending')
+    items = Column(Integer, default=0)
+    quantity = Column(Integer, default=0)
+    confirmed_by = Column(Integer, ForeignKey('users.id'), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    admin = relationship('User', foreign_keys=[admin_id])
+    vitrine = relationship('User', foreign_keys=[vitrine_id])
+
+
+class Balance(Base):
+    __tablename__ = 'balances'
+    id = Column(Integer, primary_key=True)
+    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    quantity = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    vitrine = relationship('User')
+    product = relationship('Product')
+
+    __table_args__ = (
+        Index('uq_balances_vitrine_product', 'vitrine_id', 'product_id', unique=True),
+    )
+
+
+class VitrineMovement(Base):
+    """Сумма подтвержденных движений товара по витрине и типу операции"""
+    __tablename__ = 'vitrine_movements'
+    id = Column(Integer, primary_key=True)
+    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    type = Column(String(20), nullable=False)
+    quantity = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('uq_vitrine_movements_key', 'vitrine_id', 'product_id', 'type', unique=True),
+    )
+
+
+class DailyRollup(Base):
+    """Количество операций и сумма товара за день по витрине, товару, типу и статусу"""
+    __tablename__ = 'daily_rollups'
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    type = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False)
+    operations = Column(Integer, default=0)
+    quantity = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('uq_daily_rollups_key', 'day', 'vitrine_id', 'product_id', 'type', 'status', unique=True),
+    )
+
+
+class BalanceSnapshot(Base):
+    """Снимок остатков всех витрин на момент taken_at"""
+    __tablename__ = 'balance_snapshots'
+    id = Column(Integer, primary_key=True)
+    taken_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_balance_snapshots_taken_at', 'taken_at'),
+    )
+
+
+class BalanceSnapshotItem(Base):
+    """Остаток витрины по товару в снимке; нулевые остатки не хранятся"""
+    __tablename__ = 'balance_snapshot_items'
+    id = Column(Integer, primary_key=True)
+    snapshot_id = Column(Integer, ForeignKey('balance_snapshots.id'), nullable=False)
+    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    quantity = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index('ix_balance_snapshot_items_key', 'snapshot_id', 'vitrine_id', 'product_id'),
+    )
+
+
+class ExpectedBalance(Base):
+    """Остаток по подтвержденным операциям до контрольной точки сверки"""
+    __tablename__ = 'expected_balances'
+    id = Column(Integer, primary_key=True)
+    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    quantity = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('uq_expected_balances_key', 'vitrine_id', 'product_id', unique=True),
+    )
+
+
+class ReconciliationState(Base):
+    """Контрольная точка сверки остатков: последняя учтенная операция"""
+    __tablename__ = 'reconciliation_state'
+    id = Column(Integer, primary_key=True)
+    last_transaction_id = Column(Integer, default=0)
+    last_created_at = Column(DateTime)
+    discrepancies = Column(Integer, default=0)
+    last_run_at = Column(DateTime)
+
+
+class ReconciliationPending(Base):
+    """Операции до контрольной точки, которые на момент сверки еще ждали подтверждения"""
+    __tablename__ = 'reconciliation_pending'
+    transaction_id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime)
+
+
+class OutboxMessage(Base):
+    """Уведомление, записанное вместе с операцией и еще не отправленное в Telegram"""
+    __tablename__ = 'outbox'
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    status = Column(String(20), default='pending')
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+
+class SaleDigestItem(Base):
+    """Продажа, которая ждет сводного уведомления администраторам"""
+    __tablename__ = 'sale_digest_items'
+    id = Column(Integer, primary_key=True)
+    vitrine_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TransactionArchive(Base):
+    """Реестр помесячных архивов операций (таблицы transactions_archive_YYYYMM)"""
+    __tablename__ = 'transaction_archives'
+    id = Column(Integer, primary_key=True)
+    month = Column(String(6), unique=True, nullable=False)
+    table_name = Column(String(64), nullable=False)
+    first_created_at = Column(DateTime)
+    last_created_at = Column(DateTime)
+    last_confirmed_at = Column(DateTime)
+    rows = Column(Integer, default=0)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+# PRAGMA, которые меняют файл базы: соединение только для чтения их не выполняет
+_SQLITE_WRITE_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+class Database:
+    def __init__(self, database_url, pool_size=None, max_overflow=None, pool_pre_ping=False,
+                 pool_recycle=-1, sqlite_pragmas=None, read_url=None, read_pool_size=None):
+        engine_kwargs = {'pool_pre_ping': pool_pre_ping, 'pool_recycle': pool_recycle}
+        is_sqlite = database_url.startswith('sqlite')
+        is_memory = is_sqlite and (database_url in ('sqlite://', 'sqlite:///:memory:'))
+
+        if pool_size is not None and not is_memory:
+            # Для файловой SQLite SQLAlchemy по умолчанию не держит пул,
+            # поэтому явно включаем QueuePool, чтобы его размер настраивался из config.py
+            engine_kwargs['poolclass'] = QueuePool
+            engine_kwargs['pool_size'] = pool_size
+            engine_kwargs['max_overflow'] = max_overflow if max_overflow is not None else 0
+
+        if is_sqlite:
+            # Соединения из пула могут использоваться разными потоками
+            engine_kwargs['connect_args'] = {'check_same_thread': False}
+
+        self.engine = create_engine(database_url, **engine_kwargs)
+        self.is_sqlite = is_sqlite and not is_memory
+
+        if self.is_sqlite and sqlite_pragmas:
+            self._install_sqlite_pragmas(self.engine, sqlite_pragmas)
+        # expire_on_commit=False: объекты остаются читаемыми после выхода из потока БД
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                         bind=self.engine)
+
+        self.read_engine = self._create_read_engine(database_url, read_url, is_memory, read_pool_size,
+                                                    pool_pre_ping, pool_recycle, sqlite_pragmas)
+        self.ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                             bind=self.read_engine)
+
+    def _create_read_engine(self, database_url, read_url, is_memory, pool_size, pool_pre_ping, pool_recycle,
+                            sqlite_pragmas):
+        """Отдельный engine со своим пулом для отчетов, журнала и экспорта.
+
+        Для Postgres это реплика из read_url (или та же база), а каждое
+        соединение открывает только читающие транзакции. Для файловой SQLite -
+        соединения по URI с mode=ro: в режиме WAL читатели не ждут писателей и
+        не мешают им. База в памяти отдельных соединений не допускает, поэтому
+        для нее чтение идет через основной engine.
+        """
+        if is_memory:
+            return self.engine
+
+        engine_kwargs = {'pool_pre_ping': pool_pre_ping, 'pool_recycle': pool_recycle}
+        if pool_size is not None:
+            engine_kwargs['poolclass'] = QueuePool
+            engine_kwargs['pool_size'] = pool_size
+            engine_kwargs['max_overflow'] = 0
+
+        if self.is_sqlite:
+            path = os.path.abspath(make_url(database_url).database)
+
+            def connect():
+                return sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, check_same_thread=False)
+
+            engine = create_engine('sqlite://', creator=connect, **engine_kwargs)
+            if sqlite_pragmas:
+                self._install_sqlite_pragmas(engine, {
+                    name: value for name, value in sqlite_pragmas.items() if name not in _SQLITE_WRITE_PRAGMAS
+                })
+            return engine
+
+        engine = create_engine(read_url or database_url, **engine_kwargs)
+        if engine.dialect.name == 'postgresql':
+            @event.listens_for(engine, 'connect')
+            def set_read_only(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                try:
+                    cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+                finally:
+                    cursor.close()
+                dbapi_connection.commit()
+        return engine
+
+    @staticmethod
+    def _install_sqlite_pragmas(engine, pragmas):
+        """Применяет профиль PRAGMA к каждому новому соединению из пула"""
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    if value is not None and value != '':
+                        cursor.execute(f"PRAGMA {name}={value}")
+            finally:
+                cursor.close()
+
+    def run_sqlite_maintenance(self):
+        """Сбрасывает WAL в основной файл и обновляет статистику планировщика"""
+        if not self.is_sqlite:
+            return
+        with self.engine.connect() as connection:
+            connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            connection.execute(text("PRAGMA optimize"))
+
+    def init_db(self):
+        # Создаем таблицы если они не существуют
+        Base.metadata.create_all(bind=self.engine)
+        print("✅ Таблицы проверены/созданы")
+
+        # Доводим схему существующих баз до актуальной версии
+        run_migrations(self.engine)
+
+        # Добавляем тестовые данные только если таблицы пустые
+        self._add_sample_data()
+        self._add_admin_users()
+
+    def _add_sample_data(self):
+        """Добавляет тестовые товары только если таблица продуктов пустая"""
+        session = self.get_session()
+        try:
+            if session.query(Product).count() == 0:
+                products = [
+                    Product(sku="SKU-001", name="Смартфон Samsung", description="Флагманский смартфон"),
+                    Product(sku="SKU-002", name="Ноутбук HP", description="Игровой ноутбук"),
+                    Product(sku="SKU-003", name="Наушники Sony", description="Беспроводные наушники"),
+                ]
+                session.add_all(products)
+                session.commit()
+                print("✅ Тестовые товары добавлены")
+            else:
+                print("✅ Товары уже есть в базе")
+        except Exception as e:
+            print(f"⚠️ Ошибка добавления товаров: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def _add_admin_users(self):
+        """Добавляет администраторов из config.py в базу данных если их нет"""
+        session = self.get_session()
+        try:
+            admins_added = 0
+            for admin_id in ADMIN_IDS:
+                # Проверяем, существует ли уже администратор
+                existing_admin = session.query(User).filter_by(telegram_id=admin_id).first()
+                if not existing_admin:
+                    admin_user = User(
+                        telegram_id=admin_id,
+                        username=f"admin_{admin_id}",
+                        role='admin',
+                        language='ru'
+                    )
+                    session.add(admin_user)
+                    admins_added += 1
+                    print(f"✅ Добавлен администратор с ID: {admin_id}")
+                else:
+                    # Обновляем роль на admin, если пользователь уже существует но с другой ролью
+                    if existing_admin.role != 'admin':
+                        existing_admin.role = 'admin'
+                        print(f"✅ Обновлена роль пользователя {existing_admin.username} на администратора")
+
+            session.commit()
+
+            # Роли администраторов могли измениться: кэш пользователей читает их заново
+            from user_utils import user_cache
+            for admin_id in ADMIN_IDS:
+                user_cache.invalidate(admin_id)
+
+            if admins_added > 0:
+                print(f"✅ Добавлено {admins_added} администраторов в базу данных")
+            else:
+                print("✅ Администраторы уже есть в базе")
+
+        except Exception as e:
+            print(f"⚠️ Ошибка добавления администраторов: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def get_session(self):
+        return self.SessionLocal()
+
+    def get_read_session(self):
+        return self.ReadSessionLocal()
+
+
+_database = None
+
+
+def get_database():
+    """Возвращает общий для всего процесса экземпляр Database (один engine и пул соединений)"""
+    global _database
+    if _database is None:
+        _database = Database(
+            DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            pool_recycle=DB_POOL_RECYCLE,
+            sqlite_pragmas=SQLITE_PRAGMAS,
+            read_url=DATABASE_READ_URL or None,
+            read_pool_size=DB_READ_POOL_SIZE
+        )
+    return _database
+
+
+def get_session():
+    """Создает сессию из общей фабрики сессий"""
+    return get_database().get_session()
+
+
+def get_read_session():
+    """Создает сессию только для чтения (реплика или отдельный пул соединений)"""
+    return get_database().get_read_session()
+
+
+_executor = None
+_read_executor = None
+
+
+def get_db_executor():
+    """Ограниченный пул потоков, в котором выполняется вся работа с БД"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db')
+    return _executor
+
+
+def get_db_read_executor():
+    """Отдельный пул потоков для долгих чтений: отчеты не занимают потоки операций"""
+    global _read_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(max_workers=DB_READ_EXECUTOR_WORKERS, thread_name_prefix='db-read')
+    return _read_executor
+
+
+async def run_sync(func, *args, **kwargs):
+    """Выполняет блокирующую функцию в пуле потоков БД, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_read_sync(func, *args, **kwargs):
+    """Как run_sync, но в пуле потоков для чтения"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_read_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _call_with_session(func, *args, session_factory=get_session, **kwargs):
+    session = session_factory()
+    try:
+        return func(session, *args, **kwargs)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+async def run_in_session(func, *args, **kwargs):
+    """Выполняет func(session, *args, **kwargs) в отдельной сессии в пуле потоков БД.
+
+    func должна сама делать commit и возвращать данные, которые можно читать
+    после закрытия сессии (значения колонок или заранее загруженные связи).
+    """
+    return await run_sync(_call_with_session, func, *args, **kwargs)
+
+
+async def run_in_read_session(func, *args, **kwargs):
+    """Выполняет func(session, *args, **kwargs) в сессии только для чтения.
+
+    Для отчетов, журнала и экспорта: у них свои соединения и потоки, поэтому
+    долгие выборки не стоят в очереди с продажами и подтверждениями. Данные
+    реплики могут немного отставать от основной базы.
+    """
+    return await run_read_sync(_call_with_session, func, *args, session_factory=get_read_session, **kwargs)
+
+
+async def sqlite_maintenance_loop(interval=SQLITE_MAINTENANCE_INTERVAL):
+    """Периодически выполняет обслуживание SQLite в пуле потоков БД"""
+    database = get_database()
+    if not database.is_sqlite or interval <= 0:
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_sync(database.run_sqlite_maintenance)
+            print("✅ Обслуживание SQLite выполнено (wal_checkpoint, optimize)")
+        except Exception as e:
+            print(f"⚠️ Ошибка обслуживания SQLite: {e}")
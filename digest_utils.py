@@ -0,0 +1,100 @@
+"""
+Сводка продаж для администраторов.
+
+При SALE_DIGEST_INTERVAL > 0 продажа не порождает отдельные уведомления:
+в той же транзакции она записывается в sale_digest_items. Раз в интервал
+sale_digest_loop собирает накопленные продажи в одно сообщение на каждого
+администратора (итоги по витринам и товарам на его языке) и кладет его в
+outbox, удаляя учтенные строки в той же транзакции. Запросы подтверждения
+возвратов сводкой не задерживаются: они по-прежнему уходят сразу.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, delete, func
+from database import User, SaleDigestItem, run_in_session
+from catalog_utils import get_catalog_product
+from outbox_utils import enqueue_message, notify_outbox
+from utils import get_text
+from config import ADMIN_IDS, SALE_DIGEST_INTERVAL
+
+
+def digest_enabled():
+    return SALE_DIGEST_INTERVAL > 0
+
+
+def buffer_sale(session, transaction):
+    """Откладывает продажу до следующей сводки; коммитится вместе с продажей"""
+    session.add(SaleDigestItem(vitrine_id=transaction.from_vitrine_id, product_id=transaction.product_id,
+                               quantity=transaction.quantity, created_at=datetime.utcnow()))
+
+
+def _format_digest(totals, vitrines, products, start, end, language):
+    lines = [get_text('sale_digest_title', language, start=f"{start:%d.%m %H:%M}", end=f"{end:%d.%m %H:%M}")]
+    total_quantity = total_sales = 0
+    for vitrine_id, items in totals:
+        lines.append(f"🏪 {vitrines.get(vitrine_id, vitrine_id)}")
+        for product_id, quantity, sales in items:
+            product = products.get(product_id)
+            lines.append(get_text('sale_digest_line', language, product=product.name if product else product_id,
+                                  quantity=quantity, sales=sales))
+            total_quantity += quantity
+            total_sales += sales
+    lines.append(get_text('sale_digest_total', language, quantity=total_quantity, sales=total_sales))
+    return "\n".join(lines)
+
+
+def flush_sale_digest(session, now=None):
+    """Превращает накопленные продажи в сводки администраторам в outbox; возвращает число продаж"""
+    now = now or datetime.utcnow()
+    items = SaleDigestItem
+    last_id = session.execute(select(func.max(items.id))).scalar()
+    if last_id is None:
+        return 0
+
+    rows = session.execute(
+        select(items.vitrine_id, items.product_id, func.sum(items.quantity), func.count(items.id),
+               func.min(items.created_at))
+        .where(items.id <= last_id)
+        .group_by(items.vitrine_id, items.product_id)
+        .order_by(items.vitrine_id, items.product_id)
+    ).all()
+    sales_count = sum(sales for _, _, _, sales, _ in rows)
+    # Удаляем ровно учтенные строки; если параллельная сводка забрала их раньше
+    # или между запросами закоммитилась еще одна продажа, откатываемся до следующего раза
+    if session.execute(delete(items).where(items.id <= last_id)).rowcount != sales_count:
+        session.rollback()
+        return 0
+
+    totals = defaultdict(list)
+    for vitrine_id, product_id, quantity, sales, _ in rows:
+        totals[vitrine_id].append((product_id, quantity, sales))
+    start = min(first_sale for *_, first_sale in rows)
+    vitrines = dict(session.query(User.id, User.username).filter(User.id.in_(totals)))
+    products = {product_id: get_catalog_product(session, product_id) for _, product_id, *_ in rows}
+    admin_languages = dict(session.query(User.telegram_id, User.language).filter(
+        User.telegram_id.in_(ADMIN_IDS), User.role == 'admin'
+    ))
+
+    for admin_id in ADMIN_IDS:
+        language = admin_languages.get(admin_id) or 'en'
+        enqueue_message(session, admin_id, _format_digest(sorted(totals.items()), vitrines, products, start, now,
+                                                          language))
+    session.commit()
+    return sales_count
+
+
+async def sale_digest_loop(interval=SALE_DIGEST_INTERVAL):
+    """Раз в interval секунд отправляет администраторам сводку продаж"""
+    if interval <= 0:
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            sales = await run_in_session(flush_sale_digest)
+            if sales:
+                notify_outbox()
+                print(f"✅ Сводка продаж: учтено продаж {sales}")
+        except Exception as e:
+            print(f"⚠️ Ошибка сводки продаж: {e}")
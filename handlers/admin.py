@@ -1,847 +1,1071 @@
-from aiogram import Dispatcher, types
-from aiogram.dispatcher import FSMContext
-from database import Database, User, Product, Transaction, Balance
-from keyboards import (get_products_keyboard, get_vitrines_keyboard,
-                       get_quantity_input_keyboard, get_main_keyboard,
-                       get_operations_period_keyboard)
-from states import AdminStates
-from utils import get_text, format_report, split_message, safe_send_message
-from confirmation_utils import send_confirmation_request
-from export_utils import export_operations_to_csv
-from datetime import datetime, timedelta
-import io
-from logger import log_operation, log_error
-
-db = Database('sqlite:///bot.db')
-
-
-def get_session():
-    return db.get_session()
-
-
-# 📦 ТОВАРЫ
-async def admin_products_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        products = session.query(Product).all()
-
-        await message.answer(
-            get_text('products_list', user.language),
-            reply_markup=get_products_keyboard(products, user.language)
-        )
-
-    except Exception as e:
-        print(f"❌ Ошибка в admin_products_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-# 🏪 ВИТРИНЫ
-async def admin_vitrines_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        vitrines = session.query(User).filter_by(role='vitrine').all()
-
-        await message.answer(
-            get_text('vitrines_list', user.language),
-            reply_markup=get_vitrines_keyboard(vitrines, user.language)
-        )
-        await AdminStates.select_vitrine.set()
-
-    except Exception as e:
-        print(f"❌ Ошибка в admin_vitrines_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-# 1. 📦 ОТДАЧА ТОВАРА (требует подтверждения витриной)
-async def select_vitrine_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        vitrine_name = message.text.replace("🏪 ", "")
-        vitrine = session.query(User).filter_by(username=vitrine_name, role='vitrine').first()
-
-        if vitrine:
-            await state.update_data(selected_vitrine_id=vitrine.id)
-            products = session.query(Product).all()
-
-            await message.answer(
-                get_text('select_product', user.language),
-                reply_markup=get_products_keyboard(products, user.language)
-            )
-            await AdminStates.select_product.set()
-        else:
-            await message.answer(get_text('vitrine_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в select_vitrine_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def select_product_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        product_name = message.text.replace("📦 ", "")
-        product = session.query(Product).filter_by(name=product_name).first()
-
-        if product:
-            await state.update_data(selected_product_id=product.id)
-            await message.answer(
-                get_text('enter_quantity', user.language),
-                reply_markup=get_quantity_input_keyboard(user.language)
-            )
-            await AdminStates.enter_quantity.set()
-        else:
-            await message.answer(get_text('product_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в select_product_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def enter_quantity_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        try:
-            quantity = int(message.text)
-        except ValueError:
-            await message.answer(get_text('quantity_error', user.language))
-            return
-
-        if quantity <= 0:
-            await message.answer(get_text('quantity_positive_error', user.language))
-            return
-
-        if quantity > 10000:
-            await message.answer(get_text('quantity_max_error', user.language))
-            return
-
-        data = await state.get_data()
-
-        transaction = Transaction(
-            type='give',
-            product_id=data['selected_product_id'],
-            quantity=quantity,
-            to_vitrine_id=data['selected_vitrine_id'],
-            admin_id=user.id,
-            status='pending',
-            needs_confirmation=True
-        )
-        session.add(transaction)
-        session.commit()
-
-        vitrine = session.query(User).get(data['selected_vitrine_id'])
-        product = session.query(Product).get(data['selected_product_id'])
-
-        confirmation_sent = await send_confirmation_request(transaction.id, message.bot)
-
-        if confirmation_sent:
-            await message.answer(
-                get_text('give_request_sent', user.language),
-                reply_markup=get_main_keyboard('admin', user.language)
-            )
-            log_operation(transaction.id, 'give_created',
-                          f"Админ {user.username} отдает товар витрине {vitrine.username}")
-        else:
-            await message.answer(
-                get_text('confirmation_error', user.language),
-                reply_markup=get_main_keyboard('admin', user.language)
-            )
-
-        await AdminStates.menu.set()
-
-    except Exception as e:
-        print(f"❌ Ошибка в enter_quantity_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-        session.rollback()
-    finally:
-        session.close()
-
-
-# 3. 📤 ЗАБОР ТОВАРА (не требует подтверждения)
-async def admin_take_product_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        vitrines = session.query(User).filter_by(role='vitrine').all()
-
-        await message.answer(
-            get_text('select_vitrine_for_take', user.language),
-            reply_markup=get_vitrines_keyboard(vitrines, user.language)
-        )
-        await AdminStates.take_select_vitrine.set()
-
-    except Exception as e:
-        print(f"❌ Ошибка в admin_take_product_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def take_select_vitrine_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        vitrine_name = message.text.replace("🏪 ", "")
-        vitrine = session.query(User).filter_by(username=vitrine_name, role='vitrine').first()
-
-        if vitrine:
-            await state.update_data(take_vitrine_id=vitrine.id)
-            balances = session.query(Balance).filter_by(vitrine_id=vitrine.id).filter(Balance.quantity > 0).all()
-            products = [balance.product for balance in balances]
-
-            if products:
-                await message.answer(
-                    f"📦 {get_text('products', user.language)} {get_text('vitrines', user.language)} {vitrine.username}:",
-                    reply_markup=get_products_keyboard(products, user.language)
-                )
-                await AdminStates.take_select_product.set()
-            else:
-                await message.answer(get_text('no_products', user.language))
-                await AdminStates.menu.set()
-        else:
-            await message.answer(get_text('vitrine_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в take_select_vitrine_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def take_select_product_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        product_name = message.text.replace("📦 ", "")
-        product = session.query(Product).filter_by(name=product_name).first()
-
-        if product:
-            await state.update_data(take_product_id=product.id)
-            await message.answer(
-                get_text('enter_quantity', user.language),
-                reply_markup=get_quantity_input_keyboard(user.language)
-            )
-            await AdminStates.take_enter_quantity.set()
-        else:
-            await message.answer(get_text('product_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в take_select_product_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def take_enter_quantity_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        try:
-            quantity = int(message.text)
-        except ValueError:
-            await message.answer(get_text('quantity_error', user.language))
-            return
-
-        if quantity <= 0:
-            await message.answer(get_text('quantity_positive_error', user.language))
-            return
-
-        if quantity > 10000:
-            await message.answer(get_text('quantity_max_error', user.language))
-            return
-
-        data = await state.get_data()
-
-        balance = session.query(Balance).filter_by(
-            vitrine_id=data['take_vitrine_id'],
-            product_id=data['take_product_id']
-        ).first()
-
-        if balance and balance.quantity >= quantity:
-            transaction = Transaction(
-                type='take',
-                product_id=data['take_product_id'],
-                quantity=quantity,
-                from_vitrine_id=data['take_vitrine_id'],
-                admin_id=user.id,
-                status='confirmed'
-            )
-            session.add(transaction)
-            balance.quantity -= quantity
-            session.commit()
-
-            vitrine = session.query(User).get(data['take_vitrine_id'])
-            product = session.query(Product).get(data['take_product_id'])
-
-            await message.answer(
-                f"✅ {get_text('take_completed', user.language)}\n"
-                f"🏪 {get_text('vitrines', user.language)}: {vitrine.username}\n"
-                f"📦 {get_text('products', user.language)}: {product.name}\n"
-                f"🔢 {get_text('quantity', user.language)}: {quantity} {get_text('pcs', user.language)}\n"
-                f"📊 {get_text('new_balance', user.language)}: {balance.quantity} {get_text('pcs', user.language)}",
-                reply_markup=get_main_keyboard('admin', user.language)
-            )
-
-            # ДИНАМИЧЕСКАЯ ЛОКАЛИЗАЦИЯ УВЕДОМЛЕНИЯ ДЛЯ ВИТРИНЫ
-            vitrine_language = vitrine.language if vitrine.language else 'en'
-
-            notification_message = (
-                f"📤 {get_text('admin_took_product_title', vitrine_language)}\n"
-                f"👤 {get_text('admin', vitrine_language)}: {user.username}\n"
-                f"📦 {get_text('product', vitrine_language)}: {product.name}\n"
-                f"🔢 {get_text('quantity', vitrine_language)}: {quantity} {get_text('pcs', vitrine_language)}\n"
-                f"📊 {get_text('new_balance', vitrine_language)}: {balance.quantity} {get_text('pcs', vitrine_language)}"
-            )
-
-            # Безопасная отправка уведомления витрине
-            await safe_send_message(
-                message.bot,
-                vitrine.telegram_id,
-                notification_message
-            )
-
-            log_operation(transaction.id, 'take_completed',
-                          f"Админ {user.username} забрал товар у витрины {vitrine.username}")
-
-            await AdminStates.menu.set()
-        else:
-            await message.answer(get_text('not_enough_products', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в take_enter_quantity_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-        session.rollback()
-    finally:
-        session.close()
-
-
-# 5. 🔄 ПЕРЕМЕЩЕНИЕ МЕЖДУ ВИТРИНАМИ (требует подтверждения получателем)
-async def admin_transfer_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        vitrines = session.query(User).filter_by(role='vitrine').all()
-
-        await message.answer(
-            get_text('select_sender_vitrine', user.language),
-            reply_markup=get_vitrines_keyboard(vitrines, user.language)
-        )
-        await AdminStates.transfer_select_from_vitrine.set()
-
-    except Exception as e:
-        print(f"❌ Ошибка в admin_transfer_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def transfer_select_from_vitrine_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        vitrine_name = message.text.replace("🏪 ", "")
-        vitrine = session.query(User).filter_by(username=vitrine_name, role='vitrine').first()
-
-        if vitrine:
-            await state.update_data(transfer_from_vitrine_id=vitrine.id)
-            balances = session.query(Balance).filter_by(vitrine_id=vitrine.id).filter(Balance.quantity > 0).all()
-            products = [balance.product for balance in balances]
-
-            if products:
-                await message.answer(
-                    f"📦 {get_text('products', user.language)} {get_text('vitrines', user.language)} {vitrine.username}:",
-                    reply_markup=get_products_keyboard(products, user.language)
-                )
-                await AdminStates.transfer_select_product.set()
-            else:
-                await message.answer(get_text('no_products_for_transfer', user.language))
-                await AdminStates.menu.set()
-        else:
-            await message.answer(get_text('vitrine_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в transfer_select_from_vitrine_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def transfer_select_product_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        product_name = message.text.replace("📦 ", "")
-        product = session.query(Product).filter_by(name=product_name).first()
-
-        if product:
-            await state.update_data(transfer_product_id=product.id)
-            data = await state.get_data()
-
-            vitrines = session.query(User).filter_by(role='vitrine').filter(
-                User.id != data['transfer_from_vitrine_id']).all()
-
-            if vitrines:
-                await message.answer(
-                    get_text('select_receiver_vitrine', user.language),
-                    reply_markup=get_vitrines_keyboard(vitrines, user.language)
-                )
-                await AdminStates.transfer_select_to_vitrine.set()
-            else:
-                await message.answer(get_text('no_other_vitrines', user.language))
-                await AdminStates.menu.set()
-        else:
-            await message.answer(get_text('product_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в transfer_select_product_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def transfer_select_to_vitrine_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        vitrine_name = message.text.replace("🏪 ", "")
-        vitrine = session.query(User).filter_by(username=vitrine_name, role='vitrine').first()
-
-        if vitrine:
-            await state.update_data(transfer_to_vitrine_id=vitrine.id)
-            await message.answer(
-                get_text('enter_transfer_quantity', user.language),
-                reply_markup=get_quantity_input_keyboard(user.language)
-            )
-            await AdminStates.transfer_enter_quantity.set()
-        else:
-            await message.answer(get_text('vitrine_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в transfer_select_to_vitrine_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def transfer_enter_quantity_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        try:
-            quantity = int(message.text)
-        except ValueError:
-            await message.answer(get_text('quantity_error', user.language))
-            return
-
-        if quantity <= 0:
-            await message.answer(get_text('quantity_positive_error', user.language))
-            return
-
-        if quantity > 10000:
-            await message.answer(get_text('quantity_max_error', user.language))
-            return
-
-        data = await state.get_data()
-
-        from_balance = session.query(Balance).filter_by(
-            vitrine_id=data['transfer_from_vitrine_id'],
-            product_id=data['transfer_product_id']
-        ).first()
-
-        if from_balance and from_balance.quantity >= quantity:
-            transaction = Transaction(
-                type='transfer',
-                product_id=data['transfer_product_id'],
-                quantity=quantity,
-                from_vitrine_id=data['transfer_from_vitrine_id'],
-                to_vitrine_id=data['transfer_to_vitrine_id'],
-                admin_id=user.id,
-                status='pending',
-                needs_confirmation=True
-            )
-            session.add(transaction)
-            session.commit()
-
-            from_vitrine = session.query(User).get(data['transfer_from_vitrine_id'])
-            to_vitrine = session.query(User).get(data['transfer_to_vitrine_id'])
-            product = session.query(Product).get(data['transfer_product_id'])
-
-            confirmation_sent = await send_confirmation_request(transaction.id, message.bot)
-
-            if confirmation_sent:
-                await message.answer(
-                    get_text('transfer_request_sent', user.language),
-                    reply_markup=get_main_keyboard('admin', user.language)
-                )
-                log_operation(transaction.id, 'transfer_created',
-                              f"Админ {user.username} перемещает товар от {from_vitrine.username} к {to_vitrine.username}")
-            else:
-                await message.answer(
-                    get_text('confirmation_error', user.language),
-                    reply_markup=get_main_keyboard('admin', user.language)
-                )
-
-            await AdminStates.menu.set()
-        else:
-            await message.answer(get_text('not_enough_products', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в transfer_enter_quantity_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-        session.rollback()
-    finally:
-        session.close()
-
-
-# 📊 ОТЧЕТЫ
-async def admin_reports_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        vitrines = session.query(User).filter_by(role='vitrine').all()
-
-        for vitrine in vitrines:
-            balances = session.query(Balance).filter_by(vitrine_id=vitrine.id).all()
-            transactions = session.query(Transaction).filter(
-                (Transaction.from_vitrine_id == vitrine.id) |
-                (Transaction.to_vitrine_id == vitrine.id)
-            ).all()
-
-            report = format_report(vitrine, balances, transactions, language=user.language)
-            await message.answer(report)
-
-    except Exception as e:
-        print(f"❌ Ошибка в admin_reports_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-# 📋 ЖУРНАЛ ОПЕРАЦИЙ
-async def admin_operations_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        await message.answer(
-            f"{get_text('operations_journal', user.language)}\n\n"
-            f"{get_text('select_period', user.language)}:",
-            reply_markup=get_operations_period_keyboard(user.language)
-        )
-        await AdminStates.operations_menu.set()
-
-    except Exception as e:
-        print(f"❌ Ошибка в admin_operations_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def operations_menu_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        if not user:
-            await message.answer("❌ Пользователь не найден")
-            return
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('admin', user.language))
-            await AdminStates.menu.set()
-            return
-
-        if message.text == get_text('all_operations', user.language):
-            start_date = None
-            end_date = None
-            period_text = get_text('all_time', user.language)
-        elif message.text == get_text('today', user.language):
-            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = datetime.now()
-            period_text = get_text('today', user.language)
-        elif message.text == get_text('week', user.language):
-            start_date = datetime.now() - timedelta(days=7)
-            end_date = datetime.now()
-            period_text = get_text('week', user.language)
-        elif message.text == get_text('month', user.language):
-            start_date = datetime.now() - timedelta(days=30)
-            end_date = datetime.now()
-            period_text = get_text('month', user.language)
-        elif message.text == get_text('export_csv', user.language):
-            await export_operations_csv(message, state)
-            return
-        else:
-            await message.answer(get_text('select_period_from_list', user.language))
-            return
-
-        query = session.query(Transaction).order_by(Transaction.created_at.desc())
-        if start_date:
-            query = query.filter(Transaction.created_at >= start_date)
-        if end_date:
-            query = query.filter(Transaction.created_at <= end_date)
-
-        transactions = query.limit(100).all()
-
-        if not transactions:
-            await message.answer(
-                f"📭 {get_text('operations_not_found', user.language)} {period_text}",
-                reply_markup=get_main_keyboard('admin', user.language)
-            )
-            await AdminStates.menu.set()
-            return
-
-        report = f"{get_text('operations_journal', user.language)} ({period_text})\n\n"
-        report += f"{get_text('total_operations', user.language)}: {len(transactions)}\n\n"
-
-        for i, transaction in enumerate(transactions, 1):
-            product = transaction.product
-            emoji = get_transaction_emoji(transaction.type)
-            type_text = get_transaction_type_text(transaction.type, user.language)
-
-            report += f"{i}. {emoji} {type_text}\n"
-            report += f"   📦 {get_text('products', user.language)}: {product.name} ({product.sku})\n"
-            report += f"   🔢 {get_text('quantity', user.language)}: {transaction.quantity} шт.\n"
-
-            if transaction.type == 'give' and transaction.to_vitrine:
-                report += f"   🏪 {get_text('vitrines', user.language)}: {transaction.to_vitrine.username}\n"
-            elif transaction.type in ['return', 'sale', 'take'] and transaction.from_vitrine:
-                report += f"   🏪 {get_text('vitrines', user.language)}: {transaction.from_vitrine.username}\n"
-            elif transaction.type == 'transfer':
-                if transaction.from_vitrine:
-                    report += f"   📤 {get_text('from', user.language)}: {transaction.from_vitrine.username}\n"
-                if transaction.to_vitrine:
-                    report += f"   📥 {get_text('to', user.language)}: {transaction.to_vitrine.username}\n"
-
-            report += f"   ⏰ {get_text('date', user.language)}: {transaction.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-            report += f"   ✅ {get_text('status', user.language)}: {transaction.status}\n"
-
-            if i < len(transactions):
-                report += "\n"
-
-        if len(report) > 4000:
-            parts = split_message(report)
-            for part in parts:
-                await message.answer(part)
-        else:
-            await message.answer(report)
-
-        stats = get_operations_statistics(transactions)
-        stats_report = f"{get_text('operations_statistics', user.language)} {period_text}:\n\n"
-        stats_report += f"📦 {get_text('given', user.language)}: {stats['given']} шт.\n"
-        stats_report += f"🔄 {get_text('returned', user.language)}: {stats['returned']} шт.\n"
-        stats_report += f"💰 {get_text('sold', user.language)}: {stats['sold']} шт.\n"
-        stats_report += f"📤 {get_text('taken', user.language)}: {stats['taken']} шт.\n"
-        stats_report += f"🔄 {get_text('transferred', user.language)}: {stats['transferred']} шт.\n"
-
-        await message.answer(stats_report)
-        await message.answer(get_text('main_menu', user.language),
-                             reply_markup=get_main_keyboard('admin', user.language))
-        await AdminStates.menu.set()
-
-    except Exception as e:
-        print(f"❌ Ошибка в operations_menu_handler: {e}")
-        user_lang = user.language if user else 'uz'
-        await message.answer(get_text('error_occurred', user_lang))
-    finally:
-        session.close()
-
-async def export_operations_csv(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        if not user:
-            await message.answer("❌ Пользователь не найден")
-            return
-
-        csv_data = export_operations_to_csv()
-
-        if not csv_data:
-            await message.answer(get_text('csv_export_error', user.language))
-            return
-
-        csv_file = io.BytesIO()
-        csv_file.write(csv_data.encode('utf-8-sig'))
-        csv_file.seek(0)
-
-        await message.bot.send_document(
-            chat_id=message.chat.id,
-            document=types.InputFile(
-                csv_file,
-                filename=f"operations_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-            ),
-            caption=get_text('export_csv', user.language)
-        )
-
-        await message.answer(get_text('main_menu', user.language),
-                             reply_markup=get_main_keyboard('admin', user.language))
-        await AdminStates.menu.set()
-
-    except Exception as e:
-        print(f"❌ Ошибка экспорта CSV: {e}")
-        user_lang = user.language if user else 'uz'
-        await message.answer(get_text('csv_export_error', user_lang))
-    finally:
-        session.close()
-
-def get_transaction_emoji(transaction_type):
-    emoji_map = {
-        'give': '📤',
-        'return': '🔄',
-        'sale': '💰',
-        'take': '📥',
-        'transfer': '🔄'
-    }
-    return emoji_map.get(transaction_type, '📋')
-
-def get_transaction_type_text(transaction_type, language='uz'):
-    type_map = {
-        'ru': {
-            'give': 'Отдача товара',
-            'return': 'Возврат товара',
-            'sale': 'Продажа товара',
-            'take': 'Забор товара',
-            'transfer': 'Перемещение товара'
-        },
-        'uz': {
-            'give': 'Mahsulot berish',
-            'return': 'Mahsulot qaytarish',
-            'sale': 'Mahsulot sotish',
-            'take': 'Mahsulot olish',
-            'transfer': 'Mahsulot ko\'chirish'
-        },
-        'en': {
-            'give': 'Product Give',
-            'return': 'Product Return',
-            'sale': 'Product Sale',
-            'take': 'Product Take',
-            'transfer': 'Product Transfer'
-        }
-    }
-    texts = type_map.get(language, type_map['en'])
-    return texts.get(transaction_type, 'Unknown operation')
-
-def get_operations_statistics(transactions):
-    stats = {
-        'given': 0,
-        'returned': 0,
-        'sold': 0,
-        'taken': 0,
-        'transferred': 0
-    }
-
-    for transaction in transactions:
-        if transaction.type == 'give':
-            stats['given'] += transaction.quantity
-        elif transaction.type == 'return':
-            stats['returned'] += transaction.quantity
-        elif transaction.type == 'sale':
-            stats['sold'] += transaction.quantity
-        elif transaction.type == 'take':
-            stats['taken'] += transaction.quantity
-        elif transaction.type == 'transfer':
-            stats['transferred'] += transaction.quantity
-
-    return stats
-
-
-__all__ = [
-    'admin_products_handler',
-    'admin_vitrines_handler',
-    'admin_reports_handler',
-    'admin_operations_handler',
-    'admin_take_product_handler',
-    'admin_transfer_handler',
-    'select_vitrine_handler',
-    'select_product_handler',
-    'enter_quantity_handler',
-    'take_select_vitrine_handler',
-    'take_select_product_handler',
-    'take_enter_quantity_handler',
-    'transfer_select_from_vitrine_handler',
-    'transfer_select_product_handler',
-    'transfer_select_to_vitrine_handler',
-    'transfer_enter_quantity_handler',
-    'operations_menu_handler'
+from aiogram import Dispatcher, types
+from aiogram.dispatcher import FSMContext
+from aiogram.utils.exceptions import MessageNotModified
+from database import User, Transaction, Balance, run_in_session, run_in_read_session, run_sync, run_read_sync
+from repository import get_vitrine_products, get_vitrine_report_data, get_journal_page
+from keyboards import (get_products_keyboard, get_vitrines_keyboard,
+                       get_quantity_input_keyboard, get_main_keyboard,
+                       get_operations_period_keyboard, get_journal_navigation_keyboard,
+                       parse_journal_callback)
+from states import AdminStates
+from utils import get_text, format_report
+from config import (ADMIN_IDS, JOURNAL_PAGE_SIZE, BULK_GIVE_MAX_ROWS, BULK_GIVE_MAX_FILE_SIZE,
+                    CATALOG_IMPORT_MAX_FILE_SIZE)
+from confirmation_utils import send_confirmation_request, send_batch_confirmation_request
+from outbox_utils import enqueue_message, notify_outbox
+from outbound_utils import send_priority, PRIORITY_REPORT
+from export_utils import export_operations_to_csv
+from datetime import datetime, timedelta, time
+import io
+from logger import log_operation, log_batch_operation, log_error
+from balance_utils import decrease_balance, get_balance_quantity, record_movements
+from rollup_utils import add_to_rollup
+from statistics_utils import get_period_statistics
+from bulk_give_utils import parse_give_matrix, decode_give_file, create_bulk_give
+from catalog_utils import (open_catalog_file, import_catalog, get_catalog_products, find_product_by_name,
+                           get_catalog_product)
+from snapshot_utils import get_balances_as_of_report
+
+
+def _get_vitrines(session, exclude_id=None):
+    query = session.query(User).filter_by(role='vitrine')
+    if exclude_id is not None:
+        query = query.filter(User.id != exclude_id)
+    return query.all()
+
+
+def _get_vitrine_by_username(session, username):
+    return session.query(User).filter_by(username=username, role='vitrine').first()
+
+
+# 📦 ТОВАРЫ
+async def admin_products_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        products = await get_catalog_products()
+
+        await message.answer(
+            get_text('products_list', user.language),
+            reply_markup=get_products_keyboard(products, user.language)
+        )
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_products_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 🏪 ВИТРИНЫ
+async def admin_vitrines_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        vitrines = await run_in_session(_get_vitrines)
+
+        await message.answer(
+            get_text('vitrines_list', user.language),
+            reply_markup=get_vitrines_keyboard(vitrines, user.language)
+        )
+        await AdminStates.select_vitrine.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_vitrines_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 1. 📦 ОТДАЧА ТОВАРА (требует подтверждения витриной)
+async def select_vitrine_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        vitrine_name = message.text.replace("🏪 ", "")
+        vitrine = await run_in_session(_get_vitrine_by_username, vitrine_name)
+
+        if vitrine:
+            await state.update_data(selected_vitrine_id=vitrine.id)
+            products = await get_catalog_products()
+
+            await message.answer(
+                get_text('select_product', user.language),
+                reply_markup=get_products_keyboard(products, user.language)
+            )
+            await AdminStates.select_product.set()
+        else:
+            await message.answer(get_text('vitrine_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в select_vitrine_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def select_product_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        product_name = message.text.replace("📦 ", "")
+        product = await find_product_by_name(product_name)
+
+        if product:
+            await state.update_data(selected_product_id=product.id)
+            await message.answer(
+                get_text('enter_quantity', user.language),
+                reply_markup=get_quantity_input_keyboard(user.language)
+            )
+            await AdminStates.enter_quantity.set()
+        else:
+            await message.answer(get_text('product_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в select_product_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+def _create_give_transaction(session, admin_id, vitrine_id, product_id, quantity):
+    transaction = Transaction(
+        type='give',
+        product_id=product_id,
+        quantity=quantity,
+        to_vitrine_id=vitrine_id,
+        admin_id=admin_id,
+        status='pending',
+        needs_confirmation=True
+    )
+    session.add(transaction)
+    add_to_rollup(session, transaction)
+    session.commit()
+
+    vitrine = session.query(User).get(vitrine_id)
+    return transaction, vitrine
+
+
+async def enter_quantity_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        try:
+            quantity = int(message.text)
+        except ValueError:
+            await message.answer(get_text('quantity_error', user.language))
+            return
+
+        if quantity <= 0:
+            await message.answer(get_text('quantity_positive_error', user.language))
+            return
+
+        if quantity > 10000:
+            await message.answer(get_text('quantity_max_error', user.language))
+            return
+
+        data = await state.get_data()
+
+        transaction, vitrine = await run_in_session(
+            _create_give_transaction, user.id, data['selected_vitrine_id'], data['selected_product_id'], quantity
+        )
+
+        confirmation_sent = await send_confirmation_request(transaction.id, message.bot)
+
+        if confirmation_sent:
+            await message.answer(
+                get_text('give_request_sent', user.language),
+                reply_markup=get_main_keyboard('admin', user.language)
+            )
+            await run_sync(log_operation, transaction.id, 'give_created',
+                           f"Админ {user.username} отдает товар витрине {vitrine.username}")
+        else:
+            await message.answer(
+                get_text('confirmation_error', user.language),
+                reply_markup=get_main_keyboard('admin', user.language)
+            )
+
+        await AdminStates.menu.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в enter_quantity_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 3. 📤 ЗАБОР ТОВАРА (не требует подтверждения)
+async def admin_take_product_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        vitrines = await run_in_session(_get_vitrines)
+
+        await message.answer(
+            get_text('select_vitrine_for_take', user.language),
+            reply_markup=get_vitrines_keyboard(vitrines, user.language)
+        )
+        await AdminStates.take_select_vitrine.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_take_product_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def take_select_vitrine_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        vitrine_name = message.text.replace("🏪 ", "")
+        vitrine = await run_in_session(_get_vitrine_by_username, vitrine_name)
+
+        if vitrine:
+            await state.update_data(take_vitrine_id=vitrine.id)
+            products = await run_in_session(get_vitrine_products, vitrine.id)
+
+            if products:
+                await message.answer(
+                    f"📦 {get_text('products', user.language)} {get_text('vitrines', user.language)} {vitrine.username}:",
+                    reply_markup=get_products_keyboard(products, user.language)
+                )
+                await AdminStates.take_select_product.set()
+            else:
+                await message.answer(get_text('no_products', user.language))
+                await AdminStates.menu.set()
+        else:
+            await message.answer(get_text('vitrine_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в take_select_vitrine_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def take_select_product_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        product_name = message.text.replace("📦 ", "")
+        product = await find_product_by_name(product_name)
+
+        if product:
+            await state.update_data(take_product_id=product.id)
+            await message.answer(
+                get_text('enter_quantity', user.language),
+                reply_markup=get_quantity_input_keyboard(user.language)
+            )
+            await AdminStates.take_enter_quantity.set()
+        else:
+            await message.answer(get_text('product_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в take_select_product_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+def _take_product(session, admin_id, admin_name, vitrine_id, product_id, quantity):
+    """Списывает товар с витрины вместе с уведомлением витрине; возвращает None, если товара недостаточно"""
+    if not decrease_balance(session, vitrine_id, product_id, quantity):
+        return None
+
+    transaction = Transaction(
+        type='take',
+        product_id=product_id,
+        quantity=quantity,
+        from_vitrine_id=vitrine_id,
+        admin_id=admin_id,
+        status='confirmed',
+        confirmed_at=datetime.utcnow()
+    )
+    session.add(transaction)
+    record_movements(session, transaction)
+    add_to_rollup(session, transaction)
+
+    new_quantity = get_balance_quantity(session, vitrine_id, product_id)
+    vitrine = session.query(User).get(vitrine_id)
+    product = get_catalog_product(session, product_id)
+
+    # Уведомление коммитится вместе с изъятием и уходит из outbox после ответа админу
+    vitrine_language = vitrine.language if vitrine.language else 'en'
+    enqueue_message(session, vitrine.telegram_id, (
+        f"📤 {get_text('admin_took_product_title', vitrine_language)}\n"
+        f"👤 {get_text('admin', vitrine_language)}: {admin_name}\n"
+        f"📦 {get_text('product', vitrine_language)}: {product.name}\n"
+        f"🔢 {get_text('quantity', vitrine_language)}: {quantity} {get_text('pcs', vitrine_language)}\n"
+        f"📊 {get_text('new_balance', vitrine_language)}: {new_quantity} {get_text('pcs', vitrine_language)}"
+    ))
+    session.commit()
+    return transaction, new_quantity, vitrine, product
+
+
+async def take_enter_quantity_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        try:
+            quantity = int(message.text)
+        except ValueError:
+            await message.answer(get_text('quantity_error', user.language))
+            return
+
+        if quantity <= 0:
+            await message.answer(get_text('quantity_positive_error', user.language))
+            return
+
+        if quantity > 10000:
+            await message.answer(get_text('quantity_max_error', user.language))
+            return
+
+        data = await state.get_data()
+
+        take = await run_in_session(
+            _take_product, user.id, user.username, data['take_vitrine_id'], data['take_product_id'], quantity
+        )
+
+        if take:
+            transaction, new_quantity, vitrine, product = take
+
+            await message.answer(
+                f"✅ {get_text('take_completed', user.language)}\n"
+                f"🏪 {get_text('vitrines', user.language)}: {vitrine.username}\n"
+                f"📦 {get_text('products', user.language)}: {product.name}\n"
+                f"🔢 {get_text('quantity', user.language)}: {quantity} {get_text('pcs', user.language)}\n"
+                f"📊 {get_text('new_balance', user.language)}: {new_quantity} {get_text('pcs', user.language)}",
+                reply_markup=get_main_keyboard('admin', user.language)
+            )
+            notify_outbox()
+
+            await run_sync(log_operation, transaction.id, 'take_completed',
+                           f"Админ {user.username} забрал товар у витрины {vitrine.username}")
+
+            await AdminStates.menu.set()
+        else:
+            await message.answer(get_text('not_enough_products', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в take_enter_quantity_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 5. 🔄 ПЕРЕМЕЩЕНИЕ МЕЖДУ ВИТРИНАМИ (требует подтверждения получателем)
+async def admin_transfer_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        vitrines = await run_in_session(_get_vitrines)
+
+        await message.answer(
+            get_text('select_sender_vitrine', user.language),
+            reply_markup=get_vitrines_keyboard(vitrines, user.language)
+        )
+        await AdminStates.transfer_select_from_vitrine.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_transfer_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def transfer_select_from_vitrine_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        vitrine_name = message.text.replace("🏪 ", "")
+        vitrine = await run_in_session(_get_vitrine_by_username, vitrine_name)
+
+        if vitrine:
+            await state.update_data(transfer_from_vitrine_id=vitrine.id)
+            products = await run_in_session(get_vitrine_products, vitrine.id)
+
+            if products:
+                await message.answer(
+                    f"📦 {get_text('products', user.language)} {get_text('vitrines', user.language)} {vitrine.username}:",
+                    reply_markup=get_products_keyboard(products, user.language)
+                )
+                await AdminStates.transfer_select_product.set()
+            else:
+                await message.answer(get_text('no_products_for_transfer', user.language))
+                await AdminStates.menu.set()
+        else:
+            await message.answer(get_text('vitrine_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в transfer_select_from_vitrine_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def transfer_select_product_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        product_name = message.text.replace("📦 ", "")
+        product = await find_product_by_name(product_name)
+
+        if product:
+            await state.update_data(transfer_product_id=product.id)
+            data = await state.get_data()
+
+            vitrines = await run_in_session(_get_vitrines, exclude_id=data['transfer_from_vitrine_id'])
+
+            if vitrines:
+                await message.answer(
+                    get_text('select_receiver_vitrine', user.language),
+                    reply_markup=get_vitrines_keyboard(vitrines, user.language)
+                )
+                await AdminStates.transfer_select_to_vitrine.set()
+            else:
+                await message.answer(get_text('no_other_vitrines', user.language))
+                await AdminStates.menu.set()
+        else:
+            await message.answer(get_text('product_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в transfer_select_product_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def transfer_select_to_vitrine_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        vitrine_name = message.text.replace("🏪 ", "")
+        vitrine = await run_in_session(_get_vitrine_by_username, vitrine_name)
+
+        if vitrine:
+            await state.update_data(transfer_to_vitrine_id=vitrine.id)
+            await message.answer(
+                get_text('enter_transfer_quantity', user.language),
+                reply_markup=get_quantity_input_keyboard(user.language)
+            )
+            await AdminStates.transfer_enter_quantity.set()
+        else:
+            await message.answer(get_text('vitrine_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в transfer_select_to_vitrine_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+def _create_transfer_transaction(session, admin_id, from_vitrine_id, to_vitrine_id, product_id, quantity):
+    """Создает запрос на перемещение; возвращает None, если у отправителя недостаточно товара"""
+    from_balance = session.query(Balance).filter_by(
+        vitrine_id=from_vitrine_id,
+        product_id=product_id
+    ).first()
+
+    if not from_balance or from_balance.quantity < quantity:
+        return None
+
+    transaction = Transaction(
+        type='transfer',
+        product_id=product_id,
+        quantity=quantity,
+        from_vitrine_id=from_vitrine_id,
+        to_vitrine_id=to_vitrine_id,
+        admin_id=admin_id,
+        status='pending',
+        needs_confirmation=True
+    )
+    session.add(transaction)
+    add_to_rollup(session, transaction)
+    session.commit()
+
+    from_vitrine = session.query(User).get(from_vitrine_id)
+    to_vitrine = session.query(User).get(to_vitrine_id)
+    return transaction, from_vitrine, to_vitrine
+
+
+async def transfer_enter_quantity_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        try:
+            quantity = int(message.text)
+        except ValueError:
+            await message.answer(get_text('quantity_error', user.language))
+            return
+
+        if quantity <= 0:
+            await message.answer(get_text('quantity_positive_error', user.language))
+            return
+
+        if quantity > 10000:
+            await message.answer(get_text('quantity_max_error', user.language))
+            return
+
+        data = await state.get_data()
+
+        transfer = await run_in_session(
+            _create_transfer_transaction, user.id, data['transfer_from_vitrine_id'],
+            data['transfer_to_vitrine_id'], data['transfer_product_id'], quantity
+        )
+
+        if transfer:
+            transaction, from_vitrine, to_vitrine = transfer
+
+            confirmation_sent = await send_confirmation_request(transaction.id, message.bot)
+
+            if confirmation_sent:
+                await message.answer(
+                    get_text('transfer_request_sent', user.language),
+                    reply_markup=get_main_keyboard('admin', user.language)
+                )
+                await run_sync(log_operation, transaction.id, 'transfer_created',
+                               f"Админ {user.username} перемещает товар от {from_vitrine.username} к {to_vitrine.username}")
+            else:
+                await message.answer(
+                    get_text('confirmation_error', user.language),
+                    reply_markup=get_main_keyboard('admin', user.language)
+                )
+
+            await AdminStates.menu.set()
+        else:
+            await message.answer(get_text('not_enough_products', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в transfer_enter_quantity_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 📦 МАССОВАЯ ВЫДАЧА (одно подтверждение на витрину)
+SHOWN_TABLE_ERRORS = 20
+
+
+def _format_table_errors(title, errors, language, total=None):
+    """Список ошибок загруженной таблицы: (номер строки, ключ текста, значение)"""
+    lines = [title]
+    for line_number, error_key, value in errors[:SHOWN_TABLE_ERRORS]:
+        error_text = get_text(error_key, language, limit=BULK_GIVE_MAX_ROWS)
+        if line_number:
+            error_text = f"{get_text('table_line', language, line=line_number)}: {error_text}"
+        if value:
+            error_text = f"{error_text} ({value})"
+        lines.append(error_text)
+
+    hidden = (total if total is not None else len(errors)) - min(len(errors), SHOWN_TABLE_ERRORS)
+    if hidden > 0:
+        lines.append(get_text('and_more', language, count=hidden))
+    return "\n".join(lines)
+
+
+async def admin_bulk_give_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        await message.answer(
+            get_text('bulk_give_prompt', user.language, limit=BULK_GIVE_MAX_ROWS),
+            reply_markup=get_quantity_input_keyboard(user.language)
+        )
+        await AdminStates.bulk_give_input.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_bulk_give_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def _process_bulk_give(message, user, text):
+    rows, errors = parse_give_matrix(text)
+    batches = []
+    if rows:
+        # Витрины и артикулы сверяются с базой даже при ошибках разбора, чтобы показать все сразу
+        batches, errors = await run_in_session(create_bulk_give, user.id, rows, errors)
+
+    if errors:
+        # Ничего не создано: администратор может сразу прислать исправленную таблицу
+        await message.answer(_format_table_errors(get_text('bulk_give_errors', user.language), errors,
+                                                    user.language))
+        return
+
+    sent = 0
+    for batch in batches:
+        if await send_batch_confirmation_request(batch.id, message.bot):
+            sent += 1
+        await run_sync(log_batch_operation, batch.id, 'bulk_give_created', batch.items, batch.quantity,
+                       f"Админ {user.username} отдает товар витрине {batch.vitrine.username}")
+
+    await message.answer(
+        get_text('bulk_give_created', user.language, sent=sent, vitrines=len(batches),
+                 items=sum(batch.items for batch in batches),
+                 quantity=sum(batch.quantity for batch in batches)),
+        reply_markup=get_main_keyboard('admin', user.language)
+    )
+    await AdminStates.menu.set()
+
+
+async def bulk_give_input_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        await _process_bulk_give(message, user, message.text)
+
+    except Exception as e:
+        print(f"❌ Ошибка в bulk_give_input_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def bulk_give_document_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if not user or user.role != 'admin':
+            return
+
+        if message.document.file_size and message.document.file_size > BULK_GIVE_MAX_FILE_SIZE:
+            await message.answer(get_text('file_too_large', user.language))
+            return
+
+        data = await message.bot.download_file_by_id(message.document.file_id)
+        await _process_bulk_give(message, user, decode_give_file(data.getvalue()))
+
+    except Exception as e:
+        print(f"❌ Ошибка в bulk_give_document_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 📥 ИМПОРТ КАТАЛОГА
+async def admin_import_catalog_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        await message.answer(
+            get_text('catalog_import_prompt', user.language),
+            reply_markup=get_quantity_input_keyboard(user.language)
+        )
+        await AdminStates.catalog_import.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_import_catalog_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def catalog_import_input_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        # Каталог принимается только файлом
+        await message.answer(get_text('catalog_import_prompt', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в catalog_import_input_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def catalog_import_document_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if not user or user.role != 'admin':
+            return
+
+        if message.document.file_size and message.document.file_size > CATALOG_IMPORT_MAX_FILE_SIZE:
+            await message.answer(get_text('file_too_large', user.language))
+            return
+
+        data = await message.bot.download_file_by_id(message.document.file_id)
+        stream = await run_sync(open_catalog_file, data)
+        result = await run_in_session(import_catalog, stream)
+
+        report = get_text('catalog_import_result', user.language, inserted=result['inserted'],
+                          updated=result['updated'], unchanged=result['unchanged'], invalid=result['invalid'])
+        if result['errors']:
+            report = _format_table_errors(report, result['errors'], user.language, total=result['invalid'])
+
+        await message.answer(report, reply_markup=get_main_keyboard('admin', user.language))
+        await AdminStates.menu.set()
+        print(f"✅ Импорт каталога: добавлено {result['inserted']}, обновлено {result['updated']}, "
+              f"пропущено {result['invalid']}")
+
+    except Exception as e:
+        log_error('catalog_import', str(e), message.from_user.id)
+        print(f"❌ Ошибка в catalog_import_document_handler: {e}")
+        await message.answer(get_text('catalog_import_error', user.language))
+
+
+# 📊 ОТЧЕТЫ
+def _build_vitrine_reports(session, language):
+    return [
+        format_report(vitrine, balances, movements, language=language)
+        for vitrine, balances, movements in get_vitrine_report_data(session)
+    ]
+
+
+async def admin_reports_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        reports = await run_in_read_session(_build_vitrine_reports, user.language)
+
+        # Пачка отчетов не должна задерживать запросы подтверждения
+        with send_priority(PRIORITY_REPORT):
+            for report in reports:
+                await message.answer(report)
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_reports_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 🕰 ОСТАТКИ НА ДАТУ
+def _build_balances_as_of(session, moment, language):
+    """Сообщения отчета: по одному на витрину с ненулевыми остатками на конец дня moment"""
+    date_text = moment.strftime('%d.%m.%Y')
+    pcs = get_text('pcs', language)
+    reports = []
+    for vitrine, items in get_balances_as_of_report(session, moment):
+        report = f"{get_text('balances_as_of_title', language, date=date_text)}\n"
+        report += f"🏪 {vitrine.username}\n\n"
+        for product, quantity in items:
+            name = f"{product.sku} - {product.name}" if product else "?"
+            report += f"📦 {name}: {quantity} {pcs}\n"
+        reports.append(report)
+    return reports
+
+
+async def admin_balances_as_of_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        await message.answer(
+            get_text('balances_as_of_prompt', user.language),
+            reply_markup=get_quantity_input_keyboard(user.language)
+        )
+        await AdminStates.balances_as_of.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_balances_as_of_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def balances_as_of_input_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        try:
+            day = datetime.strptime(message.text.strip(), '%d.%m.%Y').date()
+        except ValueError:
+            await message.answer(get_text('balances_as_of_date_error', user.language))
+            return
+
+        # Остатки на конец выбранного дня
+        reports = await run_in_read_session(_build_balances_as_of, datetime.combine(day, time.max), user.language)
+        if not reports:
+            await message.answer(get_text('balances_as_of_empty', user.language, date=day.strftime('%d.%m.%Y')))
+
+        with send_priority(PRIORITY_REPORT):
+            for report in reports:
+                await message.answer(report)
+
+        await message.answer(get_text('main_menu', user.language),
+                             reply_markup=get_main_keyboard('admin', user.language))
+        await AdminStates.menu.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в balances_as_of_input_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 📋 ЖУРНАЛ ОПЕРАЦИЙ
+async def admin_operations_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        await message.answer(
+            f"{get_text('operations_journal', user.language)}\n\n"
+            f"{get_text('select_period', user.language)}:",
+            reply_markup=get_operations_period_keyboard(user.language)
+        )
+        await AdminStates.operations_menu.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в admin_operations_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+def _journal_period_start(period):
+    """Начало периода журнала в UTC, как created_at операций; None - за все время"""
+    now = datetime.utcnow()
+    if period == 'today':
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        return now - timedelta(days=7)
+    if period == 'month':
+        return now - timedelta(days=30)
+    return None
+
+
+def _journal_period_text(period, language):
+    return get_text('all_time' if period == 'all' else period, language)
+
+
+def _format_journal_page(transactions, period_text, language, total=None):
+    report = f"{get_text('operations_journal', language)} ({period_text})\n\n"
+    if total is not None:
+        report += f"{get_text('total_operations', language)}: {total}\n\n"
+
+    for i, transaction in enumerate(transactions, 1):
+        product = transaction.product
+        emoji = get_transaction_emoji(transaction.type)
+        type_text = get_transaction_type_text(transaction.type, language)
+
+        report += f"{i}. {emoji} {type_text}\n"
+        report += f"   📦 {get_text('products', language)}: {product.name} ({product.sku})\n"
+        report += f"   🔢 {get_text('quantity', language)}: {transaction.quantity} шт.\n"
+
+        if transaction.type == 'give' and transaction.to_vitrine:
+            report += f"   🏪 {get_text('vitrines', language)}: {transaction.to_vitrine.username}\n"
+        elif transaction.type in ['return', 'sale', 'take'] and transaction.from_vitrine:
+            report += f"   🏪 {get_text('vitrines', language)}: {transaction.from_vitrine.username}\n"
+        elif transaction.type == 'transfer':
+            if transaction.from_vitrine:
+                report += f"   📤 {get_text('from', language)}: {transaction.from_vitrine.username}\n"
+            if transaction.to_vitrine:
+                report += f"   📥 {get_text('to', language)}: {transaction.to_vitrine.username}\n"
+
+        report += f"   ⏰ {get_text('date', language)}: {transaction.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+        report += f"   ✅ {get_text('status', language)}: {transaction.status}\n"
+
+        if i < len(transactions):
+            report += "\n"
+
+    return report
+
+
+def _build_journal_page(session, period, language, cursor=None, older=True, total=None):
+    """Страница журнала: (текст, inline-клавиатура) или None, если операций нет"""
+    transactions, has_more = get_journal_page(session, _journal_period_start(period), cursor, older,
+                                              limit=JOURNAL_PAGE_SIZE)
+    if not transactions:
+        return None
+
+    # Кнопка есть, только если в эту сторону еще остались операции
+    has_newer = has_more if not older else cursor is not None
+    has_older = has_more if older else True
+    newest, oldest = transactions[0], transactions[-1]
+    keyboard = get_journal_navigation_keyboard(
+        language, period,
+        newer_cursor=(newest.created_at, newest.id) if has_newer else None,
+        older_cursor=(oldest.created_at, oldest.id) if has_older else None
+    )
+    report = _format_journal_page(transactions, _journal_period_text(period, language), language, total)
+    return report, keyboard
+
+
+def _build_operations_journal(session, period, language):
+    """Первая страница журнала и точная статистика за весь период"""
+    statistics = get_period_statistics(session, _journal_period_start(period))
+    page = _build_journal_page(session, period, language, total=statistics['operations'])
+    if not page:
+        return None
+
+    report, keyboard = page
+    return report, keyboard, statistics
+
+
+async def operations_menu_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if not user:
+            await message.answer("❌ Пользователь не найден")
+            return
+
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('admin', user.language))
+            await AdminStates.menu.set()
+            return
+
+        if message.text == get_text('all_operations', user.language):
+            period = 'all'
+        elif message.text == get_text('today', user.language):
+            period = 'today'
+        elif message.text == get_text('week', user.language):
+            period = 'week'
+        elif message.text == get_text('month', user.language):
+            period = 'month'
+        elif message.text == get_text('export_csv', user.language):
+            await export_operations_csv(message, state, user)
+            return
+        else:
+            await message.answer(get_text('select_period_from_list', user.language))
+            return
+
+        period_text = _journal_period_text(period, user.language)
+        journal = await run_in_read_session(_build_operations_journal, period, user.language)
+
+        if not journal:
+            await message.answer(
+                f"📭 {get_text('operations_not_found', user.language)} {period_text}",
+                reply_markup=get_main_keyboard('admin', user.language)
+            )
+            await AdminStates.menu.set()
+            return
+
+        report, keyboard, stats = journal
+        with send_priority(PRIORITY_REPORT):
+            await message.answer(report, reply_markup=keyboard)
+
+        stats_report = f"{get_text('operations_statistics', user.language)} {period_text}:\n\n"
+        stats_report += f"📦 {get_text('given', user.language)}: {stats['given']} шт.\n"
+        stats_report += f"🔄 {get_text('returned', user.language)}: {stats['returned']} шт.\n"
+        stats_report += f"💰 {get_text('sold', user.language)}: {stats['sold']} шт.\n"
+        stats_report += f"📤 {get_text('taken', user.language)}: {stats['taken']} шт.\n"
+        stats_report += f"🔄 {get_text('transferred', user.language)}: {stats['transferred']} шт.\n"
+        stats_report += f"\n⏳ {get_text('pending_operations', user.language)}: {stats['pending']}\n"
+        stats_report += f"❌ {get_text('rejected_operations', user.language)}: {stats['rejected']}\n"
+
+        with send_priority(PRIORITY_REPORT):
+            await message.answer(stats_report)
+        await message.answer(get_text('main_menu', user.language),
+                             reply_markup=get_main_keyboard('admin', user.language))
+        await AdminStates.menu.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка в operations_menu_handler: {e}")
+        user_lang = user.language if user else 'uz'
+        await message.answer(get_text('error_occurred', user_lang))
+
+
+async def journal_page_callback(call: types.CallbackQuery):
+    """Листает журнал операций inline-кнопками, редактируя то же сообщение"""
+    parsed = parse_journal_callback(call.data)
+    if not parsed or call.from_user.id not in ADMIN_IDS:
+        await call.answer()
+        return
+
+    language, period, older, cursor = parsed
+    try:
+        page = await run_in_read_session(_build_journal_page, period, language, cursor, older)
+        if not page:
+            await call.answer(get_text('operations_not_found', language), show_alert=True)
+            return
+
+        report, keyboard = page
+        try:
+            with send_priority(PRIORITY_REPORT):
+                await call.message.edit_text(report, reply_markup=keyboard)
+        except MessageNotModified:
+            pass
+        await call.answer()
+
+    except Exception as e:
+        print(f"❌ Ошибка в journal_page_callback: {e}")
+        await call.answer(get_text('error_occurred', language), show_alert=True)
+
+async def export_operations_csv(message: types.Message, state: FSMContext, user: User):
+    try:
+        if not user:
+            await message.answer("❌ Пользователь не найден")
+            return
+
+        csv_data = await run_read_sync(export_operations_to_csv)
+
+        if not csv_data:
+            await message.answer(get_text('csv_export_error', user.language))
+            return
+
+        csv_file = io.BytesIO()
+        csv_file.write(csv_data.encode('utf-8-sig'))
+        csv_file.seek(0)
+
+        with send_priority(PRIORITY_REPORT):
+            await message.bot.send_document(
+                chat_id=message.chat.id,
+                document=types.InputFile(
+                    csv_file,
+                    filename=f"operations_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+                ),
+                caption=get_text('export_csv', user.language)
+            )
+
+        await message.answer(get_text('main_menu', user.language),
+                             reply_markup=get_main_keyboard('admin', user.language))
+        await AdminStates.menu.set()
+
+    except Exception as e:
+        print(f"❌ Ошибка экспорта CSV: {e}")
+        user_lang = user.language if user else 'uz'
+        await message.answer(get_text('csv_export_error', user_lang))
+
+def get_transaction_emoji(transaction_type):
+    emoji_map = {
+        'give': '📤',
+        'return': '🔄',
+        'sale': '💰',
+        'take': '📥',
+        'transfer': '🔄'
+    }
+    return emoji_map.get(transaction_type, '📋')
+
+def get_transaction_type_text(transaction_type, language='uz'):
+    type_map = {
+        'ru': {
+            'give': 'Отдача товара',
+            'return': 'Возврат товара',
+            'sale': 'Продажа товара',
+            'take': 'Забор товара',
+            'transfer': 'Перемещение товара'
+        },
+        'uz': {
+            'give': 'Mahsulot berish',
+            'return': 'Mahsulot qaytarish',
+            'sale': 'Mahsulot sotish',
+            'take': 'Mahsulot olish',
+            'transfer': 'Mahsulot ko\'chirish'
+        },
+        'en': {
+            'give': 'Product Give',
+            'return': 'Product Return',
+            'sale': 'Product Sale',
+            'take': 'Product Take',
+            'transfer': 'Product Transfer'
+        }
+    }
+    texts = type_map.get(language, type_map['en'])
+    return texts.get(transaction_type, 'Unknown operation')
+
+
+__all__ = [
+    'admin_products_handler',
+    'admin_vitrines_handler',
+    'admin_reports_handler',
+    'admin_operations_handler',
+    'admin_take_product_handler',
+    'admin_transfer_handler',
+    'select_vitrine_handler',
+    'select_product_handler',
+    'enter_quantity_handler',
+    'take_select_vitrine_handler',
+    'take_select_product_handler',
+    'take_enter_quantity_handler',
+    'transfer_select_from_vitrine_handler',
+    'transfer_select_product_handler',
+    'transfer_select_to_vitrine_handler',
+    'transfer_enter_quantity_handler',
+    'operations_menu_handler',
+    'journal_page_callback',
+    'admin_bulk_give_handler',
+    'bulk_give_input_handler',
+    'bulk_give_document_handler',
+    'admin_import_catalog_handler',
+    'catalog_import_input_handler',
+    'catalog_import_document_handler',
+    'admin_balances_as_of_handler',
+    'balances_as_of_input_handler'
 ]
\ No newline at end of file
@@ -1,437 +1,434 @@
-from aiogram import Dispatcher, types
-from aiogram.dispatcher import FSMContext
-from database import Database, User, Product, Transaction, Balance
-from keyboards import get_products_keyboard, get_main_keyboard, get_quantity_input_keyboard
-from states import VitrineStates
-from utils import get_text, format_report, safe_send_message
-from confirmation_utils import send_confirmation_request
-from config import ADMIN_IDS
-from datetime import datetime, timedelta
-from logger import log_operation, log_error
-
-db = Database('sqlite:///bot.db')
-
-
-def get_session():
-    return db.get_session()
-
-
-# 📦 ТОВАРЫ ВИТРИНЫ
-async def vitrine_products_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        balances = session.query(Balance).filter_by(vitrine_id=user.id).all()
-
-        if balances:
-            text = get_text('my_products', user.language)
-            for balance in balances:
-                text += f"📦 {balance.product.name}\n"
-                text += f"  🔢 {get_text('available', user.language)}: {balance.quantity} {get_text('pcs', user.language)}\n"
-                text += f"  🆔 SKU: {balance.product.sku}\n\n"
-            await message.answer(text)
-        else:
-            await message.answer(get_text('no_products', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в vitrine_products_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-# 2. 🔄 ВОЗВРАТ ТОВАРА (требует подтверждения админом)
-async def vitrine_returns_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        balances = session.query(Balance).filter_by(vitrine_id=user.id).filter(Balance.quantity > 0).all()
-
-        if balances:
-            products = [balance.product for balance in balances]
-            await message.answer(
-                get_text('start_return', user.language),
-                reply_markup=get_products_keyboard(products, user.language)
-            )
-            await VitrineStates.select_return_product.set()
-        else:
-            await message.answer(get_text('no_products_for_return', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в vitrine_returns_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def select_return_product_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('vitrine', user.language))
-            await VitrineStates.menu.set()
-            return
-
-        product_name = message.text.replace("📦 ", "")
-        product = session.query(Product).filter_by(name=product_name).first()
-
-        if product:
-            await state.update_data(return_product_id=product.id)
-
-            # Показываем текущий остаток
-            balance = session.query(Balance).filter_by(
-                vitrine_id=user.id,
-                product_id=product.id
-            ).first()
-            current_quantity = balance.quantity if balance else 0
-
-            await message.answer(
-                f"🔄 {get_text('returns', user.language)}: {product.name}\n"
-                f"📊 {get_text('available', user.language)}: {current_quantity} {get_text('pcs', user.language)}\n\n"
-                f"{get_text('return_quantity', user.language)} (1 {get_text('from_date', user.language)} {current_quantity}):",
-                reply_markup=get_quantity_input_keyboard(user.language)
-            )
-            await VitrineStates.enter_return_quantity.set()
-        else:
-            await message.answer(get_text('product_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в select_return_product_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def enter_return_quantity_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('vitrine', user.language))
-            await VitrineStates.menu.set()
-            return
-
-        try:
-            quantity = int(message.text)
-        except ValueError:
-            await message.answer(get_text('quantity_error', user.language))
-            return
-
-        if quantity <= 0:
-            await message.answer(get_text('quantity_positive_error', user.language))
-            return
-
-        if quantity > 10000:
-            await message.answer(get_text('quantity_max_error', user.language))
-            return
-
-        data = await state.get_data()
-        balance = session.query(Balance).filter_by(
-            vitrine_id=user.id,
-            product_id=data['return_product_id']
-        ).first()
-
-        if not balance:
-            await message.answer(get_text('product_not_found', user.language))
-            return
-
-        if balance.quantity < quantity:
-            await message.answer(
-                f"❌ {get_text('not_enough_products', user.language)}!\n"
-                f"📦 {get_text('products', user.language)}: {balance.product.name}\n"
-                f"📊 {get_text('available', user.language)}: {balance.quantity} {get_text('pcs', user.language)}\n"
-                f"🔄 {get_text('requested', user.language)}: {quantity} {get_text('pcs', user.language)}\n\n"
-                f"{get_text('enter_quantity', user.language)}:"
-            )
-            return
-
-        # Создаем транзакцию возврата
-        transaction = Transaction(
-            type='return',
-            product_id=data['return_product_id'],
-            quantity=quantity,
-            from_vitrine_id=user.id,
-            status='pending',
-            needs_confirmation=True
-        )
-        session.add(transaction)
-        session.commit()
-
-        product = session.query(Product).get(data['return_product_id'])
-
-        # Логируем создание возврата
-        log_operation(transaction.id, 'return_created',
-                      f"Витрина {user.username} создала запрос на возврат")
-
-        # Находим активных администраторов
-        active_admins = []
-        for admin_id in ADMIN_IDS:
-            admin_user = session.query(User).filter_by(telegram_id=admin_id, role='admin').first()
-            if admin_user:
-                active_admins.append(admin_user)
-
-        # Если нет активных админов в базе, создаем временную запись
-        if not active_admins:
-            for admin_id in ADMIN_IDS:
-                temp_admin = User(
-                    telegram_id=admin_id,
-                    username=f"admin_{admin_id}",
-                    role='admin',
-                    language='ru'
-                )
-                try:
-                    session.add(temp_admin)
-                    session.commit()
-                    active_admins.append(temp_admin)
-                    print(f"✅ Создан временный администратор для ID {admin_id}")
-                except Exception as e:
-                    session.rollback()
-                    print(f"⚠️ Не удалось создать временного администратора для ID {admin_id}: {e}")
-
-        # Отправляем запрос подтверждения первому доступному администратору
-        confirmation_sent = False
-        for admin in active_admins:
-            transaction.admin_id = admin.id
-            session.commit()
-
-            confirmation_sent = await send_confirmation_request(transaction.id, message.bot)
-            if confirmation_sent:
-                log_operation(transaction.id, 'return_request_sent',
-                              f"Запрос отправлен администратору {admin.username}")
-                break
-
-        if confirmation_sent:
-            await message.answer(
-                f"🔄 {get_text('confirmation_request_sent', user.language)}\n"
-                f"📦 {get_text('products', user.language)}: {product.name}\n"
-                f"🔢 {get_text('quantity', user.language)}: {quantity} {get_text('pcs', user.language)}\n\n"
-                f"⏳ {get_text('waiting_confirmation', user.language)}",
-                reply_markup=get_main_keyboard('vitrine', user.language)
-            )
-        else:
-            session.delete(transaction)
-            session.commit()
-            log_error('return_creation', 'Не удалось отправить запрос подтверждения', user.telegram_id)
-            await message.answer(
-                get_text('admins_unavailable', user.language),
-                reply_markup=get_main_keyboard('vitrine', user.language)
-            )
-
-        await VitrineStates.menu.set()
-
-    except Exception as e:
-        log_error('return_creation', str(e), message.from_user.id)
-        print(f"❌ Ошибка в enter_return_quantity_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-        session.rollback()
-    finally:
-        session.close()
-
-
-# 4. 💰 ПРОДАЖА ТОВАРА (не требует подтверждения)
-async def vitrine_sales_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        balances = session.query(Balance).filter_by(vitrine_id=user.id).filter(Balance.quantity > 0).all()
-
-        if balances:
-            products = [balance.product for balance in balances]
-            await message.answer(
-                get_text('sales', user.language),
-                reply_markup=get_products_keyboard(products, user.language)
-            )
-            await VitrineStates.select_sale_product.set()
-        else:
-            await message.answer(get_text('no_products_for_sale', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в vitrine_sales_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def select_sale_product_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('vitrine', user.language))
-            await VitrineStates.menu.set()
-            return
-
-        product_name = message.text.replace("📦 ", "")
-        product = session.query(Product).filter_by(name=product_name).first()
-
-        if product:
-            await state.update_data(sale_product_id=product.id)
-
-            balance = session.query(Balance).filter_by(
-                vitrine_id=user.id,
-                product_id=product.id
-            ).first()
-            current_quantity = balance.quantity if balance else 0
-
-            await message.answer(
-                f"💰 {get_text('sales', user.language)}: {product.name}\n"
-                f"📊 {get_text('available', user.language)}: {current_quantity} {get_text('pcs', user.language)}\n\n"
-                f"{get_text('enter_quantity', user.language)} (1 {get_text('from_date', user.language)} {current_quantity}):",
-                reply_markup=get_quantity_input_keyboard(user.language)
-            )
-            await VitrineStates.enter_sale_quantity.set()
-        else:
-            await message.answer(get_text('product_not_found', user.language))
-
-    except Exception as e:
-        print(f"❌ Ошибка в select_sale_product_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-async def enter_sale_quantity_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-
-        if get_text('back_to_main', user.language) in message.text:
-            await message.answer(get_text('main_menu', user.language),
-                                 reply_markup=get_main_keyboard('vitrine', user.language))
-            await VitrineStates.menu.set()
-            return
-
-        try:
-            quantity = int(message.text)
-        except ValueError:
-            await message.answer(get_text('quantity_error', user.language))
-            return
-
-        if quantity <= 0:
-            await message.answer(get_text('quantity_positive_error', user.language))
-            return
-
-        if quantity > 10000:
-            await message.answer(get_text('quantity_max_error', user.language))
-            return
-
-        data = await state.get_data()
-        balance = session.query(Balance).filter_by(
-            vitrine_id=user.id,
-            product_id=data['sale_product_id']
-        ).first()
-
-        if not balance:
-            await message.answer(get_text('product_not_found', user.language))
-            return
-
-        if balance.quantity < quantity:
-            await message.answer(
-                f"❌ {get_text('not_enough_products', user.language)}!\n"
-                f"📦 {get_text('products', user.language)}: {balance.product.name}\n"
-                f"📊 {get_text('available', user.language)}: {balance.quantity} {get_text('pcs', user.language)}\n"
-                f"🔄 {get_text('requested', user.language)}: {quantity} {get_text('pcs', user.language)}\n\n"
-                f"{get_text('enter_quantity', user.language)}:"
-            )
-            return
-
-        transaction = Transaction(
-            type='sale',
-            product_id=data['sale_product_id'],
-            quantity=quantity,
-            from_vitrine_id=user.id,
-            status='confirmed'
-        )
-        session.add(transaction)
-        balance.quantity -= quantity
-        session.commit()
-
-        product = session.query(Product).get(data['sale_product_id'])
-
-        # Логируем продажу
-        log_operation(transaction.id, 'sale_completed',
-                      f"Витрина {user.username} продала товар")
-
-        await message.answer(
-            f"✅ {get_text('sale_registered', user.language)}\n"
-            f"📦 {get_text('products', user.language)}: {product.name}\n"
-            f"💰 {get_text('sold', user.language)}: {quantity} {get_text('pcs', user.language)}\n"
-            f"📊 {get_text('new_balance', user.language)}: {balance.quantity} {get_text('pcs', user.language)}",
-            reply_markup=get_main_keyboard('vitrine', user.language)
-        )
-
-        # ДИНАМИЧЕСКАЯ ЛОКАЛИЗАЦИЯ УВЕДОМЛЕНИЙ ДЛЯ АДМИНИСТРАТОРОВ
-        notification_sent = False
-        for admin_id in ADMIN_IDS:
-            # Получаем язык администратора из базы данных
-            admin_user = session.query(User).filter_by(telegram_id=admin_id, role='admin').first()
-            admin_language = admin_user.language if admin_user and admin_user.language else 'en'
-
-            notification_message = (
-                f"💰 {get_text('vitrine_sold_product_title', admin_language)}\n"
-                f"🏪 {get_text('vitrines', admin_language)}: {user.username}\n"
-                f"📦 {get_text('product', admin_language)}: {product.name}\n"
-                f"🔢 {get_text('quantity', admin_language)}: {quantity} {get_text('pcs', admin_language)}\n"
-                f"📊 {get_text('balance', admin_language)} {get_text('on_vitrine', admin_language)}: {balance.quantity} {get_text('pcs', admin_language)}"
-            )
-
-            success = await safe_send_message(
-                message.bot,
-                admin_id,
-                notification_message
-            )
-            if success:
-                notification_sent = True
-
-        if not notification_sent:
-            log_error('sale_notification', 'Не удалось отправить уведомления администраторам', user.telegram_id)
-
-        await VitrineStates.menu.set()
-
-    except Exception as e:
-        log_error('sale_creation', str(e), message.from_user.id)
-        print(f"❌ Ошибка в enter_sale_quantity_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-        session.rollback()
-    finally:
-        session.close()
-
-
-# 📊 ОТЧЕТЫ ВИТРИНЫ
-async def vitrine_reports_handler(message: types.Message, state: FSMContext):
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
-        balances = session.query(Balance).filter_by(vitrine_id=user.id).all()
-        transactions = session.query(Transaction).filter(
-            (Transaction.from_vitrine_id == user.id) |
-            (Transaction.to_vitrine_id == user.id)
-        ).all()
-
-        report = format_report(user, balances, transactions, language=user.language)
-        await message.answer(report)
-
-    except Exception as e:
-        print(f"❌ Ошибка в vitrine_reports_handler: {e}")
-        await message.answer(get_text('error_occurred', user.language))
-    finally:
-        session.close()
-
-
-__all__ = [
-    'vitrine_products_handler',
-    'vitrine_returns_handler',
-    'vitrine_sales_handler',
-    'vitrine_reports_handler',
-    'select_return_product_handler',
-    'enter_return_quantity_handler',
-    'select_sale_product_handler',
-    'enter_sale_quantity_handler'
+from aiogram import Dispatcher, types
+from aiogram.dispatcher import FSMContext
+from database import User, Transaction, Balance, run_in_session, run_in_read_session, run_sync
+from repository import get_vitrine_products, get_vitrine_movements, get_vitrine_balances
+from keyboards import get_products_keyboard, get_main_keyboard, get_quantity_input_keyboard
+from states import VitrineStates
+from utils import get_text, format_report
+from confirmation_utils import send_return_confirmation_requests
+from outbox_utils import enqueue_message, notify_outbox
+from outbound_utils import send_priority, PRIORITY_REPORT
+from digest_utils import digest_enabled, buffer_sale
+from config import ADMIN_IDS
+from datetime import datetime, timedelta
+from logger import log_operation, log_error
+from balance_utils import decrease_balance, get_balance_quantity, record_movements
+from rollup_utils import add_to_rollup
+from catalog_utils import find_product_by_name, get_catalog_product
+
+def _get_balance(session, vitrine_id, product_id):
+    return session.query(Balance).filter_by(
+        vitrine_id=vitrine_id,
+        product_id=product_id
+    ).first()
+
+
+# 📦 ТОВАРЫ ВИТРИНЫ
+def _get_balances_with_products(session, vitrine_id):
+    return [(balance, balance.product) for balance in get_vitrine_balances(session, vitrine_id)]
+
+
+async def vitrine_products_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        balances = await run_in_session(_get_balances_with_products, user.id)
+
+        if balances:
+            text = get_text('my_products', user.language)
+            for balance, product in balances:
+                text += f"📦 {product.name}\n"
+                text += f"  🔢 {get_text('available', user.language)}: {balance.quantity} {get_text('pcs', user.language)}\n"
+                text += f"  🆔 SKU: {product.sku}\n\n"
+            await message.answer(text)
+        else:
+            await message.answer(get_text('no_products', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в vitrine_products_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 2. 🔄 ВОЗВРАТ ТОВАРА (требует подтверждения админом)
+async def vitrine_returns_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        products = await run_in_session(get_vitrine_products, user.id)
+
+        if products:
+            await message.answer(
+                get_text('start_return', user.language),
+                reply_markup=get_products_keyboard(products, user.language)
+            )
+            await VitrineStates.select_return_product.set()
+        else:
+            await message.answer(get_text('no_products_for_return', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в vitrine_returns_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def select_return_product_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('vitrine', user.language))
+            await VitrineStates.menu.set()
+            return
+
+        product_name = message.text.replace("📦 ", "")
+        product = await find_product_by_name(product_name)
+
+        if product:
+            await state.update_data(return_product_id=product.id)
+
+            # Показываем текущий остаток
+            balance = await run_in_session(_get_balance, user.id, product.id)
+            current_quantity = balance.quantity if balance else 0
+
+            await message.answer(
+                f"🔄 {get_text('returns', user.language)}: {product.name}\n"
+                f"📊 {get_text('available', user.language)}: {current_quantity} {get_text('pcs', user.language)}\n\n"
+                f"{get_text('return_quantity', user.language)} (1 {get_text('from_date', user.language)} {current_quantity}):",
+                reply_markup=get_quantity_input_keyboard(user.language)
+            )
+            await VitrineStates.enter_return_quantity.set()
+        else:
+            await message.answer(get_text('product_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в select_return_product_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+def _create_return_transaction(session, vitrine_id, product_id, quantity):
+    """Создает запрос на возврат; возвращает (статус, транзакция, товар, остаток)"""
+    balance = session.query(Balance).filter_by(
+        vitrine_id=vitrine_id,
+        product_id=product_id
+    ).first()
+
+    if not balance:
+        return 'not_found', None, None, 0
+
+    product = balance.product
+    if balance.quantity < quantity:
+        return 'not_enough', None, product, balance.quantity
+
+    # Создаем транзакцию возврата
+    transaction = Transaction(
+        type='return',
+        product_id=product_id,
+        quantity=quantity,
+        from_vitrine_id=vitrine_id,
+        status='pending',
+        needs_confirmation=True
+    )
+    session.add(transaction)
+    add_to_rollup(session, transaction)
+    session.commit()
+    return 'created', transaction, product, balance.quantity
+
+
+def _get_active_admins(session):
+    """Возвращает администраторов из ADMIN_IDS одним запросом, при необходимости создавая для них записи"""
+    admins = {admin.telegram_id: admin for admin in session.query(User).filter(
+        User.telegram_id.in_(ADMIN_IDS), User.role == 'admin'
+    )}
+    active_admins = [admins[admin_id] for admin_id in ADMIN_IDS if admin_id in admins]
+
+    # Если нет активных админов в базе, создаем временную запись
+    if not active_admins:
+        for admin_id in ADMIN_IDS:
+            temp_admin = User(
+                telegram_id=admin_id,
+                username=f"admin_{admin_id}",
+                role='admin',
+                language='ru'
+            )
+            try:
+                session.add(temp_admin)
+                session.commit()
+                active_admins.append(temp_admin)
+                print(f"✅ Создан временный администратор для ID {admin_id}")
+            except Exception as e:
+                session.rollback()
+                print(f"⚠️ Не удалось создать временного администратора для ID {admin_id}: {e}")
+
+    return active_admins
+
+
+def _delete_transaction(session, transaction_id):
+    transaction = session.query(Transaction).get(transaction_id)
+    if transaction:
+        add_to_rollup(session, transaction, -1)
+        session.delete(transaction)
+        session.commit()
+
+
+async def enter_return_quantity_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('vitrine', user.language))
+            await VitrineStates.menu.set()
+            return
+
+        try:
+            quantity = int(message.text)
+        except ValueError:
+            await message.answer(get_text('quantity_error', user.language))
+            return
+
+        if quantity <= 0:
+            await message.answer(get_text('quantity_positive_error', user.language))
+            return
+
+        if quantity > 10000:
+            await message.answer(get_text('quantity_max_error', user.language))
+            return
+
+        data = await state.get_data()
+        status, transaction, product, available = await run_in_session(
+            _create_return_transaction, user.id, data['return_product_id'], quantity
+        )
+
+        if status == 'not_found':
+            await message.answer(get_text('product_not_found', user.language))
+            return
+
+        if status == 'not_enough':
+            await message.answer(
+                f"❌ {get_text('not_enough_products', user.language)}!\n"
+                f"📦 {get_text('products', user.language)}: {product.name}\n"
+                f"📊 {get_text('available', user.language)}: {available} {get_text('pcs', user.language)}\n"
+                f"🔄 {get_text('requested', user.language)}: {quantity} {get_text('pcs', user.language)}\n\n"
+                f"{get_text('enter_quantity', user.language)}:"
+            )
+            return
+
+        # Логируем создание возврата
+        await run_sync(log_operation, transaction.id, 'return_created',
+                       f"Витрина {user.username} создала запрос на возврат")
+
+        # Находим активных администраторов
+        active_admins = await run_in_session(_get_active_admins)
+
+        # Запрос уходит всем администраторам параллельно, подтверждает первый ответивший
+        delivered = await send_return_confirmation_requests(transaction.id, active_admins, message.bot)
+        confirmation_sent = bool(delivered)
+        if confirmation_sent:
+            await run_sync(log_operation, transaction.id, 'return_request_sent',
+                           f"Запрос отправлен администраторам {', '.join(admin.username for admin in delivered)}")
+
+        if confirmation_sent:
+            await message.answer(
+                f"🔄 {get_text('confirmation_request_sent', user.language)}\n"
+                f"📦 {get_text('products', user.language)}: {product.name}\n"
+                f"🔢 {get_text('quantity', user.language)}: {quantity} {get_text('pcs', user.language)}\n\n"
+                f"⏳ {get_text('waiting_confirmation', user.language)}",
+                reply_markup=get_main_keyboard('vitrine', user.language)
+            )
+        else:
+            await run_in_session(_delete_transaction, transaction.id)
+            log_error('return_creation', 'Не удалось отправить запрос подтверждения', user.telegram_id)
+            await message.answer(
+                get_text('admins_unavailable', user.language),
+                reply_markup=get_main_keyboard('vitrine', user.language)
+            )
+
+        await VitrineStates.menu.set()
+
+    except Exception as e:
+        log_error('return_creation', str(e), message.from_user.id)
+        print(f"❌ Ошибка в enter_return_quantity_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 4. 💰 ПРОДАЖА ТОВАРА (не требует подтверждения)
+async def vitrine_sales_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        products = await run_in_session(get_vitrine_products, user.id)
+
+        if products:
+            await message.answer(
+                get_text('sales', user.language),
+                reply_markup=get_products_keyboard(products, user.language)
+            )
+            await VitrineStates.select_sale_product.set()
+        else:
+            await message.answer(get_text('no_products_for_sale', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в vitrine_sales_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+async def select_sale_product_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('vitrine', user.language))
+            await VitrineStates.menu.set()
+            return
+
+        product_name = message.text.replace("📦 ", "")
+        product = await find_product_by_name(product_name)
+
+        if product:
+            await state.update_data(sale_product_id=product.id)
+
+            balance = await run_in_session(_get_balance, user.id, product.id)
+            current_quantity = balance.quantity if balance else 0
+
+            await message.answer(
+                f"💰 {get_text('sales', user.language)}: {product.name}\n"
+                f"📊 {get_text('available', user.language)}: {current_quantity} {get_text('pcs', user.language)}\n\n"
+                f"{get_text('enter_quantity', user.language)} (1 {get_text('from_date', user.language)} {current_quantity}):",
+                reply_markup=get_quantity_input_keyboard(user.language)
+            )
+            await VitrineStates.enter_sale_quantity.set()
+        else:
+            await message.answer(get_text('product_not_found', user.language))
+
+    except Exception as e:
+        print(f"❌ Ошибка в select_sale_product_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+def _enqueue_sale_notifications(session, vitrine_name, product, quantity, balance_quantity):
+    """Записывает уведомления о продаже администраторам в outbox на их языках"""
+    admin_languages = dict(session.query(User.telegram_id, User.language).filter(
+        User.telegram_id.in_(ADMIN_IDS), User.role == 'admin'
+    ))
+    for admin_id in ADMIN_IDS:
+        admin_language = admin_languages.get(admin_id) or 'en'
+        enqueue_message(session, admin_id, (
+            f"💰 {get_text('vitrine_sold_product_title', admin_language)}\n"
+            f"🏪 {get_text('vitrines', admin_language)}: {vitrine_name}\n"
+            f"📦 {get_text('product', admin_language)}: {product.name}\n"
+            f"🔢 {get_text('quantity', admin_language)}: {quantity} {get_text('pcs', admin_language)}\n"
+            f"📊 {get_text('balance', admin_language)} {get_text('on_vitrine', admin_language)}: {balance_quantity} {get_text('pcs', admin_language)}"
+        ))
+
+
+def _register_sale(session, vitrine_id, vitrine_name, product_id, quantity):
+    """Регистрирует продажу вместе с уведомлениями администраторам; возвращает (статус, транзакция, товар, остаток)"""
+    if not decrease_balance(session, vitrine_id, product_id, quantity):
+        balance = _get_balance(session, vitrine_id, product_id)
+        if not balance:
+            return 'not_found', None, None, 0
+        return 'not_enough', None, balance.product, balance.quantity
+
+    transaction = Transaction(
+        type='sale',
+        product_id=product_id,
+        quantity=quantity,
+        from_vitrine_id=vitrine_id,
+        status='confirmed',
+        confirmed_at=datetime.utcnow()
+    )
+    session.add(transaction)
+    record_movements(session, transaction)
+    add_to_rollup(session, transaction)
+
+    product = get_catalog_product(session, product_id)
+    balance_quantity = get_balance_quantity(session, vitrine_id, product_id)
+    # Уведомления (или строка будущей сводки) коммитятся вместе с продажей
+    if digest_enabled():
+        buffer_sale(session, transaction)
+    else:
+        _enqueue_sale_notifications(session, vitrine_name, product, quantity, balance_quantity)
+    session.commit()
+    return 'sold', transaction, product, balance_quantity
+
+
+async def enter_sale_quantity_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        if get_text('back_to_main', user.language) in message.text:
+            await message.answer(get_text('main_menu', user.language),
+                                 reply_markup=get_main_keyboard('vitrine', user.language))
+            await VitrineStates.menu.set()
+            return
+
+        try:
+            quantity = int(message.text)
+        except ValueError:
+            await message.answer(get_text('quantity_error', user.language))
+            return
+
+        if quantity <= 0:
+            await message.answer(get_text('quantity_positive_error', user.language))
+            return
+
+        if quantity > 10000:
+            await message.answer(get_text('quantity_max_error', user.language))
+            return
+
+        data = await state.get_data()
+        status, transaction, product, balance_quantity = await run_in_session(
+            _register_sale, user.id, user.username, data['sale_product_id'], quantity
+        )
+
+        if status == 'not_found':
+            await message.answer(get_text('product_not_found', user.language))
+            return
+
+        if status == 'not_enough':
+            await message.answer(
+                f"❌ {get_text('not_enough_products', user.language)}!\n"
+                f"📦 {get_text('products', user.language)}: {product.name}\n"
+                f"📊 {get_text('available', user.language)}: {balance_quantity} {get_text('pcs', user.language)}\n"
+                f"🔄 {get_text('requested', user.language)}: {quantity} {get_text('pcs', user.language)}\n\n"
+                f"{get_text('enter_quantity', user.language)}:"
+            )
+            return
+
+        # Логируем продажу
+        await run_sync(log_operation, transaction.id, 'sale_completed',
+                       f"Витрина {user.username} продала товар")
+
+        await message.answer(
+            f"✅ {get_text('sale_registered', user.language)}\n"
+            f"📦 {get_text('products', user.language)}: {product.name}\n"
+            f"💰 {get_text('sold', user.language)}: {quantity} {get_text('pcs', user.language)}\n"
+            f"📊 {get_text('new_balance', user.language)}: {balance_quantity} {get_text('pcs', user.language)}",
+            reply_markup=get_main_keyboard('vitrine', user.language)
+        )
+        notify_outbox()
+
+        await VitrineStates.menu.set()
+
+    except Exception as e:
+        log_error('sale_creation', str(e), message.from_user.id)
+        print(f"❌ Ошибка в enter_sale_quantity_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+# 📊 ОТЧЕТЫ ВИТРИНЫ
+def _build_vitrine_report(session, vitrine):
+    balances = get_vitrine_balances(session, vitrine.id)
+    movements = get_vitrine_movements(session, vitrine.id)
+
+    return format_report(vitrine, balances, movements, language=vitrine.language)
+
+
+async def vitrine_reports_handler(message: types.Message, state: FSMContext, user: User):
+    try:
+        report = await run_in_read_session(_build_vitrine_report, user)
+        with send_priority(PRIORITY_REPORT):
+            await message.answer(report)
+
+    except Exception as e:
+        print(f"❌ Ошибка в vitrine_reports_handler: {e}")
+        await message.answer(get_text('error_occurred', user.language))
+
+
+__all__ = [
+    'vitrine_products_handler',
+    'vitrine_returns_handler',
+    'vitrine_sales_handler',
+    'vitrine_reports_handler',
+    'select_return_product_handler',
+    'enter_return_quantity_handler',
+    'select_sale_product_handler',
+    'enter_sale_quantity_handler'
 ]
\ No newline at end of file
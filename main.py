@@ -1,39 +1,83 @@
-import asyncio
-import os
-from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
-from config import BOT_TOKEN
-from database import Database
-from handlers import register_all_handlers
-from utils import load_all_locales  # Добавляем импорт
-
-
-async def main():
-    # Загружаем все локализации при запуске
-    load_all_locales()
-
-    # Инициализация БД
-    db = Database('sqlite:///bot.db')
-
-    # Инициализируем таблицы если их нет
-    try:
-        db.init_db()
-        print("✅ Database ready")
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
-        return
-
-    # Бот
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(bot, storage=MemoryStorage())
-
-    # Регистрация обработчиков
-    register_all_handlers(dp)
-    print("✅ Handlers registered")
-    print("🤖 Bot started!")
-
-    await dp.start_polling()
-
-
-if __name__ == '__main__':
+import asyncio
+import os
+from aiogram import Dispatcher
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from config import BOT_TOKEN, BOT_MODE
+from database import get_database, run_in_session, sqlite_maintenance_loop
+from archive_utils import archive_loop
+from catalog_utils import load_catalog
+from reconciliation_utils import reconciliation_loop
+from snapshot_utils import balance_snapshot_loop
+from outbox_utils import outbox_loop
+from outbound_utils import QueuedBot, outbound_queue, outbound_metrics_loop
+from digest_utils import sale_digest_loop
+from webhook_utils import run_webhook
+from handlers import register_all_handlers
+from middlewares import UserMiddleware
+from utils import load_all_locales  # Добавляем импорт
+
+
+async def main():
+    # Загружаем все локализации при запуске
+    load_all_locales()
+
+    # Инициализация БД
+    db = get_database()
+
+    # Инициализируем таблицы если их нет
+    try:
+        db.init_db()
+        print("✅ Database ready")
+    except Exception as e:
+        print(f"❌ Database initialization error: {e}")
+        return
+
+    # Каталог товаров в памяти для кнопок выбора товара
+    products_cached = await run_in_session(load_catalog)
+    print(f"✅ Catalog cached: {products_cached} products")
+
+    # Бот; все сообщения уходят через очередь с ограничением скорости
+    bot = QueuedBot(token=BOT_TOKEN)
+    dp = Dispatcher(bot, storage=MemoryStorage())
+
+    # Пользователь загружается один раз на апдейт и дальше берется из кэша
+    dp.middleware.setup(UserMiddleware())
+
+    # Регистрация обработчиков
+    register_all_handlers(dp)
+    print("✅ Handlers registered")
+
+    # Фоновое обслуживание SQLite (checkpoint WAL, optimize)
+    maintenance_task = asyncio.create_task(sqlite_maintenance_loop())
+    # Перенос старых завершенных операций в помесячные архивы
+    archive_task = asyncio.create_task(archive_loop())
+    # Сверка остатков с историей операций от контрольной точки
+    reconciliation_task = asyncio.create_task(reconciliation_loop(bot))
+    # Снимки остатков для отчета "остатки на дату"
+    snapshot_task = asyncio.create_task(balance_snapshot_loop())
+    # Отправка уведомлений, записанных в outbox вместе с операциями
+    outbox_task = asyncio.create_task(outbox_loop(bot))
+    # Глубина очереди отправки в логе
+    metrics_task = asyncio.create_task(outbound_metrics_loop())
+    # Сводки продаж администраторам (если включены)
+    digest_task = asyncio.create_task(sale_digest_loop())
+    print("🤖 Bot started!")
+
+    try:
+        if BOT_MODE == 'webhook':
+            await run_webhook(dp)
+        else:
+            await dp.start_polling()
+    finally:
+        maintenance_task.cancel()
+        archive_task.cancel()
+        reconciliation_task.cancel()
+        snapshot_task.cancel()
+        outbox_task.cancel()
+        metrics_task.cancel()
+        digest_task.cancel()
+        outbound_queue.stop()
+
+
+if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
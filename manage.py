@@ -0,0 +1,105 @@
+"""
+Служебные команды обслуживания базы данных.
+
+Примеры:
+    python manage.py backfill-rollups
+    python manage.py archive --days 180
+    python manage.py reconcile --repair
+    python manage.py snapshot-balances
+"""
+import argparse
+from database import Base, get_database
+from rollup_utils import rebuild_daily_rollups
+from archive_utils import archive_transactions
+from reconciliation_utils import reconcile_balances, repair_balances
+from logger import log_reconciliation
+from snapshot_utils import take_balance_snapshot
+from config import TRANSACTION_ARCHIVE_DAYS
+
+
+def backfill_rollups(args):
+    """Пересчитывает дневные итоги по существующим операциям"""
+    database = get_database()
+    Base.metadata.create_all(bind=database.engine)
+
+    with database.engine.begin() as connection:
+        rows = rebuild_daily_rollups(connection)
+    print(f"✅ Дневные итоги пересчитаны: {rows} строк")
+
+
+def archive(args):
+    """Переносит завершенные операции старше args.days дней в помесячные архивы"""
+    database = get_database()
+    Base.metadata.create_all(bind=database.engine)
+
+    moved = archive_transactions(database.engine, older_than_days=args.days)
+    print(f"✅ Архивировано операций: {sum(moved.values())}")
+
+
+def reconcile(args):
+    """Сверяет остатки с историей операций и при args.repair исправляет расхождения"""
+    database = get_database()
+    Base.metadata.create_all(bind=database.engine)
+
+    session = database.get_session()
+    try:
+        result = reconcile_balances(session, full=args.full)
+        discrepancies = result['discrepancies']
+        print(f"✅ Сверка остатков: учтено операций {result['processed']}, "
+              f"контрольная точка {result['checkpoint']}")
+
+        for discrepancy in discrepancies:
+            print(f"⚠️ Витрина {discrepancy.vitrine_id}, товар {discrepancy.product_id}: "
+                  f"остаток {discrepancy.actual}, по истории {discrepancy.expected}")
+        if not discrepancies:
+            print("✅ Расхождений нет")
+            return
+
+        if args.repair:
+            print(f"✅ Исправлено остатков: {repair_balances(session, discrepancies)}")
+        log_reconciliation(discrepancies, args.repair)
+    finally:
+        session.close()
+
+
+def snapshot_balances(args):
+    """Сохраняет снимок остатков всех витрин"""
+    database = get_database()
+    Base.metadata.create_all(bind=database.engine)
+
+    session = database.get_session()
+    try:
+        snapshot, rows = take_balance_snapshot(session)
+        print(f"✅ Снимок остатков на {snapshot.taken_at:%d.%m.%Y %H:%M}: {rows} строк")
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных бота")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backfill = subparsers.add_parser('backfill-rollups', help="Пересчитать дневные итоги операций")
+    backfill.set_defaults(func=backfill_rollups)
+
+    archive_parser = subparsers.add_parser('archive', help="Перенести старые операции в помесячные архивы")
+    archive_parser.add_argument('--days', type=int, default=TRANSACTION_ARCHIVE_DAYS,
+                                help="Архивировать операции старше стольких дней")
+    archive_parser.set_defaults(func=archive)
+
+    reconcile_parser = subparsers.add_parser('reconcile', help="Сверить остатки с историей операций")
+    reconcile_parser.add_argument('--full', action='store_true',
+                                  help="Пересчитать ожидаемые остатки по всей истории, а не от контрольной точки")
+    reconcile_parser.add_argument('--repair', action='store_true',
+                                  help="Исправить найденные расхождения")
+    reconcile_parser.set_defaults(func=reconcile)
+
+    snapshot_parser = subparsers.add_parser('snapshot-balances', help="Сохранить снимок остатков витрин")
+    snapshot_parser.set_defaults(func=snapshot_balances)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
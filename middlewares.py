@@ -0,0 +1,24 @@
+"""
+Промежуточные обработчики aiogram.
+"""
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from user_utils import get_current_user
+from utils import chat_reachability
+
+
+class UserMiddleware(BaseMiddleware):
+    """Загружает пользователя один раз на апдейт и передает его обработчикам как data['user'].
+
+    aiogram подставляет его в обработчики с аргументом user (None для
+    незарегистрированных), а динамические обработчики передают его дальше.
+    Пользователь, написавший боту, снова считается доступным для отправки.
+    """
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        chat_reachability.forget(message.from_user.id)
+        data['user'] = await get_current_user(message.from_user.id)
+
+    async def on_process_callback_query(self, call: types.CallbackQuery, data: dict):
+        chat_reachability.forget(call.from_user.id)
+        data['user'] = await get_current_user(call.from_user.id)
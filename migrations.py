@@ -0,0 +1,175 @@
+"""
+Версионированные миграции схемы базы данных.
+
+create_all() только создает отсутствующие таблицы и не трогает существующие,
+поэтому индексы и ограничения для уже работающих баз добавляются здесь.
+Каждая миграция выполняется один раз в отдельной транзакции, а ее номер
+записывается в таблицу schema_migrations.
+"""
+from datetime import datetime
+from sqlalchemy import text, inspect
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Регистрирует функцию migrate(connection) как миграцию с номером version"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200), "
+        "applied_at TIMESTAMP)"
+    ))
+
+
+def get_applied_versions(connection):
+    """Возвращает номера уже примененных миграций"""
+    _ensure_migrations_table(connection)
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine):
+    """Применяет все еще не примененные миграции по порядку номеров"""
+    with engine.begin() as connection:
+        applied = get_applied_versions(connection)
+
+    applied_count = 0
+    for version, description, func in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if version in applied:
+            continue
+
+        # Миграция и запись о ней коммитятся вместе: при ошибке откатится все
+        with engine.begin() as connection:
+            func(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+            )
+        applied_count += 1
+        print(f"✅ Миграция {version}: {description}")
+
+    if applied_count == 0:
+        print("✅ Схема базы данных актуальна")
+
+
+@migration(1, "Индексы для журнала, отчетов и выбора товаров")
+def _add_query_indexes(connection):
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_transactions_created_at ON transactions (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_from_vitrine ON transactions (from_vitrine_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_to_vitrine ON transactions (to_vitrine_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_status_type ON transactions (status, type)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_type_created_at ON transactions (type, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_products_name ON products (name)",
+        "CREATE INDEX IF NOT EXISTS ix_users_role ON users (role)",
+    ]
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+@migration(2, "Уникальный остаток на пару витрина/товар")
+def _add_unique_balance_index(connection):
+    # Старые базы могли накопить дубликаты: складываем их в самую раннюю запись
+    connection.execute(text(
+        "UPDATE balances SET quantity = ("
+        "SELECT COALESCE(SUM(b2.quantity), 0) FROM balances b2 "
+        "WHERE b2.vitrine_id = balances.vitrine_id AND b2.product_id = balances.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM balances GROUP BY vitrine_id, product_id HAVING COUNT(*) > 1)"
+    ))
+    connection.execute(text(
+        "DELETE FROM balances WHERE id NOT IN ("
+        "SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM balances GROUP BY vitrine_id, product_id) AS keep)"
+    ))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_balances_vitrine_product ON balances (vitrine_id, product_id)"
+    ))
+
+
+@migration(3, "BIGINT для users.telegram_id в PostgreSQL")
+def _widen_telegram_id(connection):
+    # Telegram ID не помещаются в 32-битный INTEGER; в SQLite INTEGER и так 64-битный
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT"))
+
+
+@migration(4, "Итоги движений по витринам для отчетов")
+def _backfill_vitrine_movements(connection):
+    # Таблицу создает create_all; заполняем ее по уже подтвержденной истории
+    connection.execute(text("DELETE FROM vitrine_movements"))
+    connection.execute(text(
+        "INSERT INTO vitrine_movements (vitrine_id, product_id, type, quantity, updated_at) "
+        "SELECT vitrine_id, product_id, type, SUM(quantity), :now FROM ("
+        "SELECT to_vitrine_id AS vitrine_id, product_id, type, quantity FROM transactions "
+        "WHERE status = 'confirmed' AND type = 'give' "
+        "UNION ALL "
+        "SELECT from_vitrine_id, product_id, type, quantity FROM transactions "
+        "WHERE status = 'confirmed' AND type IN ('return', 'take', 'sale') "
+        "UNION ALL "
+        "SELECT from_vitrine_id, product_id, 'transfer_out', quantity FROM transactions "
+        "WHERE status = 'confirmed' AND type = 'transfer' "
+        "UNION ALL "
+        "SELECT to_vitrine_id, product_id, 'transfer_in', quantity FROM transactions "
+        "WHERE status = 'confirmed' AND type = 'transfer'"
+        ") AS movements WHERE vitrine_id IS NOT NULL AND product_id IS NOT NULL "
+        "GROUP BY vitrine_id, product_id, type"
+    ), {'now': datetime.utcnow()})
+
+
+@migration(5, "Дневные итоги операций")
+def _backfill_daily_rollups(connection):
+    # Таблицу создает create_all; заполняем ее по уже существующим операциям
+    from rollup_utils import rebuild_daily_rollups
+    rebuild_daily_rollups(connection)
+
+
+@migration(6, "Связь операций с массовыми выдачами")
+def _add_transaction_batch(connection):
+    # Таблицу give_batches создает create_all; колонку добавляем и в архивы,
+    # потому что они читаются вместе с transactions через UNION ALL
+    tables = ['transactions'] + [row[0] for row in connection.execute(
+        text("SELECT table_name FROM transaction_archives"))]
+    inspector = inspect(connection)
+    for table in tables:
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'batch_id' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN batch_id INTEGER"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_batch ON transactions (batch_id)"))
+
+
+@migration(7, "Время подтверждения операций для остатков на дату")
+def _add_transaction_confirmed_at(connection):
+    # Для уже подтвержденных операций точного времени нет: берем время создания
+    tables = ['transactions'] + [row[0] for row in connection.execute(
+        text("SELECT table_name FROM transaction_archives"))]
+    inspector = inspect(connection)
+    for table in tables:
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'confirmed_at' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN confirmed_at TIMESTAMP"))
+        connection.execute(text(
+            f"UPDATE {table} SET confirmed_at = created_at WHERE status = 'confirmed' AND confirmed_at IS NULL"
+        ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_confirmed_at ON transactions (confirmed_at)"
+    ))
+
+
+@migration(8, "Время последнего подтверждения в реестре архивов операций")
+def _add_archive_confirmed_bound(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('transaction_archives')}
+    if 'last_confirmed_at' not in columns:
+        connection.execute(text("ALTER TABLE transaction_archives ADD COLUMN last_confirmed_at TIMESTAMP"))
+    for month, table in connection.execute(text("SELECT month, table_name FROM transaction_archives")).all():
+        connection.execute(
+            text(f"UPDATE transaction_archives SET last_confirmed_at = (SELECT MAX(confirmed_at) FROM {table}) "
+                 "WHERE month = :month"),
+            {'month': month}
+        )
@@ -0,0 +1,259 @@
+"""
+Очередь исходящих сообщений с ограничением скорости и приоритетами.
+
+Telegram ограничивает бота примерно 30 сообщениями в секунду на всех и
+примерно одним сообщением в секунду в один чат; при превышении он отвечает
+RetryAfter. QueuedBot пропускает send_message, send_document и
+edit_message_text через общую очередь, поэтому ответы обработчиков,
+уведомления и отчеты укладываются в лимиты без изменений в местах вызова.
+
+Очередь разбита на полосы по приоритету: запросы подтверждения уходят раньше
+обычных ответов, а отчеты, журнал и экспорт - в последнюю очередь. Приоритет
+задается для текущей задачи через with send_priority(...). Скорость
+ограничивают два ведра токенов: общее (OUTBOUND_GLOBAL_RATE в секунду) и
+отдельное на каждый чат (OUTBOUND_CHAT_RATE, всплеск до OUTBOUND_CHAT_BURST).
+После RetryAfter чат ставится на паузу на указанное время, а сообщение
+возвращается в начало своей полосы.
+"""
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import contextmanager
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+from config import (OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES,
+                    OUTBOUND_METRICS_INTERVAL)
+
+# Полосы очереди от более срочной к менее срочной
+PRIORITY_CONFIRMATION = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_REPORT = 2
+PRIORITY_NAMES = ('confirmation', 'default', 'report')
+
+# Сколько ведер простаивающих чатов держать, прежде чем удалять полные
+MAX_CHAT_BUCKETS = 10000
+
+_priority = contextvars.ContextVar('send_priority', default=PRIORITY_DEFAULT)
+
+
+@contextmanager
+def send_priority(priority):
+    """Отправлять сообщения внутри блока с приоритетом priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Через сколько секунд можно взять токен (0 - сейчас)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate <= 0:
+            return 0
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now):
+        return self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('chat_id', 'call', 'priority', 'future', 'retries')
+
+    def __init__(self, chat_id, call, priority, future):
+        self.chat_id = chat_id
+        self.call = call
+        self.priority = priority
+        self.future = future
+        self.retries = 0
+
+
+class OutboundQueue:
+    """Планировщик исходящих сообщений: полосы приоритетов, общее и чатовые ведра, повтор после RetryAfter"""
+
+    def __init__(self, rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 max_retries=OUTBOUND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(rate, rate)
+        self._chats = {}
+        self._lanes = [deque() for _ in PRIORITY_NAMES]
+        self._in_flight = 0
+        self._running = set()
+        self._counters = dict.fromkeys(['sent', 'retried', 'failed'], 0)
+        self._wakeup = None
+        self._task = None
+        self._loop = None
+
+    async def submit(self, chat_id, call, priority=None):
+        """Ставит вызов call() в очередь; возвращает его результат или пробрасывает его исключение"""
+        self._ensure_started()
+        priority = _priority.get() if priority is None else priority
+        job = _Job(chat_id, call, priority, self._loop.create_future())
+        self._lanes[priority].append(job)
+        self._wakeup.set()
+        return await job.future
+
+    def metrics(self):
+        """Глубина полос очереди и счетчики отправок"""
+        return {
+            'queued': {name: len(lane) for name, lane in zip(PRIORITY_NAMES, self._lanes)},
+            'in_flight': self._in_flight,
+            **self._counters,
+        }
+
+    def depth(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._dispatch())
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                for idle_chat in [chat for chat, chat_bucket in self._chats.items() if chat_bucket.is_idle(now)]:
+                    del self._chats[idle_chat]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next_job(self, now):
+        """Первое готовое сообщение из самой срочной полосы: (job, None) или (None, сколько ждать)"""
+        wait = self._global.delay(now)
+        if wait > 0:
+            return None, wait
+
+        wait = None
+        for lane in self._lanes:
+            for index, job in enumerate(lane):
+                if job.future.done():
+                    # Отправитель уже не ждет результата (например, отменен)
+                    del lane[index]
+                    return None, 0
+                chat_wait = self._chat_bucket(job.chat_id).delay(now) if job.chat_id is not None else 0
+                if chat_wait == 0:
+                    del lane[index]
+                    return job, None
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+        return None, wait
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            job, wait = self._next_job(now)
+            if job is None:
+                if wait == 0:
+                    continue
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.take(now)
+            if job.chat_id is not None:
+                self._chat_bucket(job.chat_id).take(now)
+            self._in_flight += 1
+            task = asyncio.ensure_future(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, job):
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            if job.chat_id is not None:
+                self._chat_bucket(job.chat_id).pause(e.timeout)
+            if job.retries < self.max_retries and not job.future.done():
+                job.retries += 1
+                self._counters['retried'] += 1
+                self._lanes[job.priority].appendleft(job)
+                self._wakeup.set()
+            else:
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self._counters['sent'] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight -= 1
+
+    def _fail(self, job, error):
+        self._counters['failed'] += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+
+outbound_queue = OutboundQueue()
+
+
+class QueuedBot(Bot):
+    """Bot, который отправляет сообщения через outbound_queue"""
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        return await outbound_queue.submit(chat_id, lambda: super(QueuedBot, self).send_message(
+            chat_id, text, *args, **kwargs
+        ))
+
+    async def send_document(self, chat_id, document, *args, **kwargs):
+        return await outbound_queue.submit(chat_id, lambda: super(QueuedBot, self).send_document(
+            chat_id, document, *args, **kwargs
+        ))
+
+    async def edit_message_text(self, text, chat_id=None, *args, **kwargs):
+        return await outbound_queue.submit(chat_id, lambda: super(QueuedBot, self).edit_message_text(
+            text, chat_id, *args, **kwargs
+        ))
+
+
+async def outbound_metrics_loop(interval=OUTBOUND_METRICS_INTERVAL):
+    """Периодически печатает глубину очереди отправки, пока в ней есть сообщения"""
+    if interval <= 0:
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+        if outbound_queue.depth():
+            metrics = outbound_queue.metrics()
+            queued = ", ".join(f"{name}={count}" for name, count in metrics['queued'].items())
+            print(f"📊 Очередь отправки: {queued}, в работе {metrics['in_flight']}, "
+                  f"отправлено {metrics['sent']}, повторов {metrics['retried']}, ошибок {metrics['failed']}")
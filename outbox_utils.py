@@ -0,0 +1,123 @@
+"""
+Исходящие уведомления через таблицу outbox.
+
+Обработчик записывает уведомление в outbox в той же транзакции, что и саму
+операцию, и сразу отвечает пользователю. Фоновый диспетчер (outbox_loop)
+забирает записи пачками и отправляет их; запись удаляется только после
+успешной отправки, поэтому падение бота между коммитом и отправкой не теряет
+уведомление, а доставка происходит хотя бы один раз.
+
+Забранная запись получает next_attempt_at в будущем (аренда): другой экземпляр
+бота ее не возьмет, а если отправитель упал, запись вернется в работу после
+окончания аренды. Неудачные отправки повторяются с растущей паузой, после
+OUTBOX_MAX_ATTEMPTS попыток запись остается со статусом failed.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete
+from database import OutboxMessage, run_in_session
+from utils import fan_out_messages
+from config import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS
+
+# Сколько забранная запись принадлежит диспетчеру
+LEASE = timedelta(minutes=5)
+# Пауза перед повтором: RETRY_DELAY * 2 ** (попытка - 1), но не больше MAX_RETRY_DELAY
+RETRY_DELAY = timedelta(seconds=10)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+_wakeup = None
+
+
+def enqueue_message(session, chat_id, text):
+    """Добавляет уведомление в outbox; оно уйдет после коммита сессии"""
+    now = datetime.utcnow()
+    session.add(OutboxMessage(chat_id=chat_id, text=text, status='pending', attempts=0,
+                              next_attempt_at=now, created_at=now))
+
+
+def _get_wakeup():
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def notify_outbox():
+    """Будит диспетчер после коммита, не дожидаясь OUTBOX_POLL_INTERVAL"""
+    _get_wakeup().set()
+
+
+def _claim_messages(session, limit, now):
+    """Забирает готовые к отправке записи: [(id, chat_id, text, attempts)]"""
+    ready = (OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now)
+    ids = session.execute(
+        select(OutboxMessage.id).where(*ready).order_by(OutboxMessage.id).limit(limit)
+    ).scalars().all()
+    if not ids:
+        return []
+
+    # Запись достается только тому, чей UPDATE ее изменил
+    lease_until = now + LEASE
+    session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(ids), *ready)
+        .values(next_attempt_at=lease_until, attempts=OutboxMessage.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return session.execute(
+        select(OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text, OutboxMessage.attempts)
+        .where(OutboxMessage.id.in_(ids), OutboxMessage.next_attempt_at == lease_until)
+        .order_by(OutboxMessage.id)
+    ).all()
+
+
+def _finish_messages(session, sent_ids, failed, now):
+    """Удаляет отправленные записи и назначает повтор (или статус failed) неотправленным"""
+    if sent_ids:
+        session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(sent_ids)))
+    for message_id, attempts in failed:
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            values = {'status': 'failed'}
+        else:
+            values = {'next_attempt_at': now + min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)}
+        session.execute(update(OutboxMessage).where(OutboxMessage.id == message_id).values(**values))
+    session.commit()
+
+
+async def deliver_outbox(bot, limit=OUTBOX_BATCH_SIZE):
+    """Отправляет одну пачку уведомлений; возвращает (забрано, отправлено)"""
+    messages = await run_in_session(_claim_messages, limit, datetime.utcnow())
+    if not messages:
+        return 0, 0
+
+    results = await fan_out_messages(bot, [(chat_id, text) for _, chat_id, text, _ in messages])
+    sent_ids, failed = [], []
+    for (message_id, _, _, attempts), reason in zip(messages, results):
+        if reason is None:
+            sent_ids.append(message_id)
+        else:
+            failed.append((message_id, attempts))
+
+    await run_in_session(_finish_messages, sent_ids, failed, datetime.utcnow())
+    if failed:
+        print(f"⚠️ Outbox: не отправлено уведомлений {len(failed)}, будет повтор")
+    return len(messages), len(sent_ids)
+
+
+async def outbox_loop(bot, interval=OUTBOX_POLL_INTERVAL):
+    """Фоновый диспетчер outbox: разбирает записи после коммитов и раз в interval секунд"""
+    wakeup = _get_wakeup()
+    while True:
+        wakeup.clear()
+        try:
+            # Полные пачки разбираем подряд, без паузы
+            while (await deliver_outbox(bot))[0] >= OUTBOX_BATCH_SIZE:
+                pass
+        except Exception as e:
+            print(f"⚠️ Ошибка отправки уведомлений из outbox: {e}")
+
+        try:
+            await asyncio.wait_for(wakeup.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,338 @@
+"""
+Сверка остатков витрин с историей операций.
+
+Остаток витрины должен равняться сумме ее подтвержденных операций: выдачи и
+входящие перемещения прибавляют товар, возвраты, продажи, изъятия и исходящие
+перемещения списывают. Ожидаемые остатки хранятся в expected_balances вместе
+с контрольной точкой (reconciliation_state) - последней учтенной операцией,
+поэтому каждая сверка читает только новые операции и те старые, что на
+прошлой сверке еще ждали подтверждения (reconciliation_pending).
+
+Полный пересчет - один агрегирующий INSERT ... SELECT по всем операциям,
+включая архивы. Операции моложе RECONCILIATION_LAG секунд в контрольную точку
+не попадают: операция с меньшим id могла еще не закоммититься. Расхождения
+исправляются разницей (quantity = quantity + delta), чтобы не затереть
+продажи, прошедшие во время сверки.
+"""
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, update, union_all, func, literal, and_, or_, tuple_
+from database import User, Product, Balance, ExpectedBalance, ReconciliationState, ReconciliationPending, run_in_session
+from balance_utils import upsert_increment, aggregate_balance_changes
+from archive_utils import transactions_source, ARCHIVED_STATUSES
+from utils import get_text, fan_out_messages
+from outbound_utils import send_priority, PRIORITY_REPORT
+from logger import log_reconciliation
+from config import ADMIN_IDS, RECONCILIATION_INTERVAL, RECONCILIATION_LAG, RECONCILIATION_AUTO_REPAIR
+
+# Сколько расхождений перечислять в уведомлении администраторам
+SHOWN_DISCREPANCIES = 20
+
+Discrepancy = namedtuple('Discrepancy', ['vitrine_id', 'product_id', 'expected', 'actual'])
+
+_STATE_ID = 1
+
+
+def _not_final(transactions):
+    c = transactions.c
+    return or_(c.status.is_(None), c.status.notin_(ARCHIVED_STATUSES))
+
+
+def _add_to_expected(session, rows):
+    for vitrine_id, product_id, quantity in rows:
+        if quantity:
+            upsert_increment(session, ExpectedBalance, {'vitrine_id': vitrine_id, 'product_id': product_id},
+                             {'quantity': quantity})
+
+
+def _settled_checkpoint(session, transactions, after_id, cutoff):
+    """Последняя операция не моложе cutoff после after_id: (id, created_at) или None"""
+    c = transactions.c
+    return session.execute(
+        select(c.id, c.created_at).where(c.id > after_id, c.created_at <= cutoff).order_by(c.id.desc()).limit(1)
+    ).first()
+
+
+def _begin_snapshot(session):
+    """Открывает читающую транзакцию: все запросы фазы чтения видят один снимок базы"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+    elif dialect == 'sqlite':
+        # pysqlite не начинает транзакцию перед SELECT; в режиме WAL читающая
+        # транзакция не блокирует писателей
+        session.connection().exec_driver_sql('BEGIN')
+
+
+def _claim_state(session, last_run_at, now):
+    """Забирает контрольную точку, если с фазы чтения ее не сдвинула другая сверка"""
+    return session.execute(
+        update(ReconciliationState)
+        .where(ReconciliationState.id == _STATE_ID, ReconciliationState.last_run_at == last_run_at)
+        .values(last_run_at=now)
+    ).rowcount
+
+
+def _add_changes(totals, rows):
+    for vitrine_id, product_id, quantity in rows:
+        totals[(vitrine_id, product_id)] = totals.get((vitrine_id, product_id), 0) + (quantity or 0)
+
+
+def _read_full(session, transactions, checkpoint_id):
+    """Фаза чтения полного пересчета: (ожидаемые остатки, ожидающие операции, учтено операций)"""
+    c = transactions.c
+    expected = session.execute(aggregate_balance_changes(transactions, c.id <= checkpoint_id)).all()
+    pending = session.execute(
+        select(c.id, c.created_at).where(c.id <= checkpoint_id, _not_final(transactions))
+    ).all()
+    processed = session.execute(select(func.count()).select_from(transactions).where(c.id <= checkpoint_id)).scalar()
+    return expected, pending, processed
+
+
+def _write_full(session, expected, pending, now):
+    """Заменяет ожидаемые остатки и ожидающие операции результатом полного пересчета"""
+    session.execute(delete(ExpectedBalance))
+    session.execute(delete(ReconciliationPending))
+    if expected:
+        session.execute(insert(ExpectedBalance), [
+            {'vitrine_id': vitrine_id, 'product_id': product_id, 'quantity': quantity, 'updated_at': now}
+            for vitrine_id, product_id, quantity in expected
+        ])
+    if pending:
+        session.execute(insert(ReconciliationPending), [
+            {'transaction_id': transaction_id, 'created_at': created_at} for transaction_id, created_at in pending
+        ])
+
+
+def _read_advance(session, transactions, last_id, checkpoint_id, pending):
+    """Фаза чтения для операций (last_id, checkpoint_id] и решенных с прошлой сверки ожидающих.
+
+    Возвращает (изменения ожидаемых остатков, новые ожидающие, решенные, учтено операций).
+    """
+    c = transactions.c
+    changes, new_pending, done, processed = {}, [], [], 0
+    if checkpoint_id > last_id:
+        new_rows = and_(c.id > last_id, c.id <= checkpoint_id)
+        _add_changes(changes, session.execute(aggregate_balance_changes(transactions, new_rows)))
+        new_pending = session.execute(select(c.id, c.created_at).where(new_rows, _not_final(transactions))).all()
+        processed = session.execute(select(func.count()).select_from(transactions).where(new_rows)).scalar()
+
+    if pending:
+        statuses = dict(session.execute(select(c.id, c.status).where(c.id.in_(pending))).all())
+        # Удаленные операции (например, не доставленный запрос возврата) больше не ждем
+        done = [transaction_id for transaction_id in pending
+                if transaction_id not in statuses or statuses[transaction_id] in ARCHIVED_STATUSES]
+        if done:
+            _add_changes(changes, session.execute(aggregate_balance_changes(transactions, c.id.in_(done))))
+            processed += len(done)
+
+    return changes, new_pending, done, processed
+
+
+def _write_advance(session, changes, new_pending, done):
+    """Применяет к ожидаемым остаткам результат фазы чтения _read_advance"""
+    _add_to_expected(session, [(*key, quantity) for key, quantity in changes.items()])
+    if new_pending:
+        session.execute(insert(ReconciliationPending), [
+            {'transaction_id': transaction_id, 'created_at': created_at} for transaction_id, created_at in new_pending
+        ])
+    if done:
+        session.execute(delete(ReconciliationPending).where(ReconciliationPending.transaction_id.in_(done)))
+
+
+def _find_discrepancies(session, recent):
+    """Расхождения остатков с ожидаемыми; recent - изменения от операций новее контрольной точки"""
+    expected, balances = ExpectedBalance, Balance
+    same_key = and_(balances.vitrine_id == expected.vitrine_id, balances.product_id == expected.product_id)
+    actual = func.coalesce(balances.quantity, 0)
+    mismatched = union_all(
+        select(expected.vitrine_id, expected.product_id, expected.quantity, actual)
+        .select_from(expected).outerjoin(balances, same_key)
+        .where(actual != expected.quantity),
+        select(balances.vitrine_id, balances.product_id, literal(0), actual)
+        .select_from(balances).outerjoin(expected, same_key)
+        .where(expected.id.is_(None), actual != 0),
+    )
+
+    found = {}
+    for vitrine_id, product_id, expected_quantity, actual_quantity in session.execute(mismatched):
+        if (vitrine_id, product_id) not in recent:
+            found[(vitrine_id, product_id)] = Discrepancy(vitrine_id, product_id, expected_quantity, actual_quantity)
+
+    if recent:
+        keys = list(recent)
+        known = {
+            (vitrine_id, product_id): quantity
+            for vitrine_id, product_id, quantity in session.execute(
+                select(expected.vitrine_id, expected.product_id, expected.quantity)
+                .where(tuple_(expected.vitrine_id, expected.product_id).in_(keys))
+            )
+        }
+        current = {
+            (vitrine_id, product_id): quantity
+            for vitrine_id, product_id, quantity in session.execute(
+                select(balances.vitrine_id, balances.product_id, balances.quantity)
+                .where(tuple_(balances.vitrine_id, balances.product_id).in_(keys))
+            )
+        }
+        for key, change in recent.items():
+            expected_quantity = (known.get(key) or 0) + change
+            actual_quantity = current.get(key) or 0
+            if expected_quantity != actual_quantity:
+                found[key] = Discrepancy(*key, expected_quantity, actual_quantity)
+
+    return sorted(found.values())
+
+
+def _compare_with_history(session, totals):
+    """Расхождения всех остатков с суммами по истории totals {(витрина, товар): количество}"""
+    actual = {
+        (vitrine_id, product_id): quantity
+        for vitrine_id, product_id, quantity in session.execute(
+            select(Balance.vitrine_id, Balance.product_id, Balance.quantity)
+        )
+    }
+    found = []
+    for key in totals.keys() | actual.keys():
+        expected_quantity, actual_quantity = totals.get(key) or 0, actual.get(key) or 0
+        if expected_quantity != actual_quantity:
+            found.append(Discrepancy(*key, expected_quantity, actual_quantity))
+    return sorted(found)
+
+
+def reconcile_balances(session, full=False, lag=RECONCILIATION_LAG):
+    """Сверяет остатки с историей операций от сохраненной контрольной точки.
+
+    full=True (и первая сверка) пересчитывает ожидаемые остатки по всей
+    истории. Возвращает {'full', 'processed', 'checkpoint', 'discrepancies'},
+    где discrepancies - [Discrepancy]; сами остатки не меняются.
+
+    Запросы по операциям и архивам выполняются в читающей транзакции и не
+    держат блокировку записи (в SQLite она общая на всю базу); ожидаемые
+    остатки и контрольная точка пишутся потом одной короткой транзакцией.
+    Если между ними сверку успел выполнить другой процесс, результат
+    отбрасывается и расхождений не возвращается.
+    """
+    _begin_snapshot(session)
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=lag)
+    state = session.get(ReconciliationState, _STATE_ID)
+    full = full or state is None
+
+    if full:
+        transactions = transactions_source(session)
+        checkpoint = _settled_checkpoint(session, transactions, 0, cutoff)
+        checkpoint_id = checkpoint.id if checkpoint else 0
+        expected, pending, processed = _read_full(session, transactions, checkpoint_id)
+    else:
+        pending = dict(session.execute(
+            select(ReconciliationPending.transaction_id, ReconciliationPending.created_at)
+        ).all())
+        # Архивы нужны, только если в них могли попасть непрочитанные операции
+        dates = [date for date in [state.last_created_at, *pending.values()] if date is not None]
+        transactions = transactions_source(session, min(dates) if dates else None)
+        checkpoint = _settled_checkpoint(session, transactions, state.last_transaction_id, cutoff)
+        checkpoint_id = checkpoint.id if checkpoint else state.last_transaction_id
+        changes, new_pending, done, processed = _read_advance(session, transactions, state.last_transaction_id,
+                                                              checkpoint_id, list(pending))
+
+    # Изменения от операций новее контрольной точки: в ожидаемые остатки они еще не входят
+    unaccounted = {}
+    recent = aggregate_balance_changes(transactions, transactions.c.id > checkpoint_id)
+    _add_changes(unaccounted, session.execute(recent))
+    if full:
+        _add_changes(unaccounted, expected)
+        discrepancies = _compare_with_history(session, unaccounted)
+    else:
+        _add_changes(unaccounted, [(*key, quantity) for key, quantity in changes.items()])
+        discrepancies = _find_discrepancies(session, unaccounted)
+    # Конец читающей транзакции: до этого места база не менялась
+    session.commit()
+
+    if state is None:
+        state = ReconciliationState(id=_STATE_ID, last_transaction_id=0, last_run_at=now)
+        session.add(state)
+        session.flush()
+    elif not _claim_state(session, state.last_run_at, now):
+        session.rollback()
+        print("⚠️ Сверка остатков пропущена: ее уже выполнил другой процесс")
+        return {'full': full, 'processed': 0, 'checkpoint': state.last_transaction_id, 'discrepancies': []}
+
+    if full:
+        _write_full(session, expected, pending, now)
+    else:
+        _write_advance(session, changes, new_pending, done)
+
+    if checkpoint is not None:
+        state.last_transaction_id, state.last_created_at = checkpoint.id, checkpoint.created_at
+    state.last_run_at = now
+    state.discrepancies = len(discrepancies)
+    session.commit()
+
+    return {'full': full, 'processed': processed, 'checkpoint': checkpoint_id, 'discrepancies': discrepancies}
+
+
+def repair_balances(session, discrepancies):
+    """Приводит остатки к истории операций, прибавляя разницу к текущему значению"""
+    for discrepancy in discrepancies:
+        upsert_increment(
+            session, Balance, {'vitrine_id': discrepancy.vitrine_id, 'product_id': discrepancy.product_id},
+            {'quantity': discrepancy.expected - discrepancy.actual}
+        )
+    session.commit()
+    return len(discrepancies)
+
+
+def _format_discrepancies(session, discrepancies, repaired):
+    """Тексты уведомления по языкам администраторов: {telegram_id: текст}"""
+    shown = discrepancies[:SHOWN_DISCREPANCIES]
+    vitrines = dict(session.query(User.id, User.username).filter(
+        User.id.in_({discrepancy.vitrine_id for discrepancy in shown})
+    ))
+    products = dict(session.query(Product.id, Product.name).filter(
+        Product.id.in_({discrepancy.product_id for discrepancy in shown})
+    ))
+    admins = session.query(User.telegram_id, User.language).filter(
+        User.role == 'admin', User.telegram_id.in_(ADMIN_IDS)
+    ).all()
+
+    texts = {}
+    for telegram_id, language in admins:
+        lines = [get_text('reconciliation_discrepancies', language, count=len(discrepancies))]
+        for discrepancy in shown:
+            lines.append(get_text(
+                'reconciliation_line', language,
+                vitrine=vitrines.get(discrepancy.vitrine_id, discrepancy.vitrine_id),
+                product=products.get(discrepancy.product_id, discrepancy.product_id),
+                actual=discrepancy.actual, expected=discrepancy.expected
+            ))
+        if len(discrepancies) > len(shown):
+            lines.append(get_text('and_more', language, count=len(discrepancies) - len(shown)))
+        lines.append(get_text('reconciliation_repaired' if repaired else 'reconciliation_not_repaired', language))
+        texts[telegram_id] = "\n".join(lines)
+    return texts
+
+
+async def reconciliation_loop(bot, interval=RECONCILIATION_INTERVAL, repair=RECONCILIATION_AUTO_REPAIR):
+    """Периодически сверяет остатки и сообщает администраторам о расхождениях"""
+    if interval <= 0:
+        return
+
+    while True:
+        try:
+            result = await run_in_session(reconcile_balances)
+            discrepancies = result['discrepancies']
+            print(f"✅ Сверка остатков: учтено операций {result['processed']}, "
+                  f"контрольная точка {result['checkpoint']}, расхождений {len(discrepancies)}")
+
+            if discrepancies:
+                if repair:
+                    await run_in_session(repair_balances, discrepancies)
+                log_reconciliation(discrepancies, repair)
+                texts = await run_in_session(_format_discrepancies, discrepancies, repair)
+                with send_priority(PRIORITY_REPORT):
+                    await fan_out_messages(bot, list(texts.items()))
+        except Exception as e:
+            print(f"⚠️ Ошибка сверки остатков: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,132 @@
+"""
+Запросы чтения для экранов бота.
+
+Каждая функция сразу загружает все связи, которые экран потом читает
+(joinedload для связей "многие к одному", selectinload для больших
+выборок), поэтому отрисовка списка не делает отдельный SELECT на каждую
+строку. Функции принимают сессию и вызываются через run_in_session.
+"""
+from collections import defaultdict
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, selectinload
+from database import User, Product, Transaction, Balance, VitrineMovement
+from archive_utils import transactions_entity
+
+
+def get_user_by_telegram_id(session, telegram_id):
+    """Возвращает пользователя по Telegram ID"""
+    return session.query(User).filter_by(telegram_id=telegram_id).first()
+
+
+def get_product_by_name(session, name):
+    """Возвращает товар по названию, как оно показано на кнопке"""
+    return session.query(Product).filter_by(name=name).order_by(Product.id).first()
+
+
+def get_transaction_details(session, transaction_id):
+    """Операция со всеми участниками и товаром (для логов, запросов и уведомлений)"""
+    return session.query(Transaction).options(
+        joinedload(Transaction.product),
+        joinedload(Transaction.from_vitrine),
+        joinedload(Transaction.to_vitrine),
+        joinedload(Transaction.admin),
+    ).filter(Transaction.id == transaction_id).first()
+
+
+def _period_transactions(session, start_date, end_date, loader):
+    transaction_entity = transactions_entity(session, start_date, end_date)
+    query = session.query(transaction_entity).options(
+        loader(transaction_entity.product),
+        loader(transaction_entity.from_vitrine),
+        loader(transaction_entity.to_vitrine),
+    ).order_by(transaction_entity.created_at.desc())
+
+    if start_date:
+        query = query.filter(transaction_entity.created_at >= start_date)
+    if end_date:
+        query = query.filter(transaction_entity.created_at <= end_date)
+    return query
+
+
+def get_journal_page(session, start_date=None, cursor=None, older=True, limit=10):
+    """Страница журнала по ключу (created_at, id) вместе с товаром и витринами одним запросом.
+
+    cursor - ключ (created_at, id) крайней операции соседней страницы; older
+    выбирает направление. Возвращает (операции от новых к старым, есть ли
+    еще операции в этом направлении).
+    """
+    # Архивы подключаются, только если страница может в них попасть
+    if cursor is None:
+        transaction_entity = transactions_entity(session, start_date, None)
+    elif older:
+        transaction_entity = transactions_entity(session, start_date, cursor[0])
+    else:
+        transaction_entity = transactions_entity(session, max(start_date or cursor[0], cursor[0]), None)
+
+    query = session.query(transaction_entity).options(
+        joinedload(transaction_entity.product),
+        joinedload(transaction_entity.from_vitrine),
+        joinedload(transaction_entity.to_vitrine),
+    )
+    if start_date:
+        query = query.filter(transaction_entity.created_at >= start_date)
+
+    key = tuple_(transaction_entity.created_at, transaction_entity.id)
+    if older:
+        if cursor is not None:
+            query = query.filter(key < tuple_(*cursor))
+        query = query.order_by(transaction_entity.created_at.desc(), transaction_entity.id.desc())
+    else:
+        query = query.filter(key > tuple_(*cursor))
+        query = query.order_by(transaction_entity.created_at.asc(), transaction_entity.id.asc())
+
+    # Лишняя строка показывает, есть ли следующая страница
+    transactions = query.limit(limit + 1).all()
+    has_more = len(transactions) > limit
+    transactions = transactions[:limit]
+    if not older:
+        transactions.reverse()
+    return transactions, has_more
+
+
+def get_export_transactions(session, start_date=None, end_date=None):
+    """Все операции за период для экспорта; товары и витрины догружаются пачками"""
+    return _period_transactions(session, start_date, end_date, selectinload).all()
+
+
+def get_vitrine_balances(session, vitrine_id, only_available=False):
+    """Остатки витрины вместе с товарами"""
+    query = session.query(Balance).options(joinedload(Balance.product)).filter(Balance.vitrine_id == vitrine_id)
+    if only_available:
+        query = query.filter(Balance.quantity > 0)
+    return query.order_by(Balance.id).all()
+
+
+def get_vitrine_products(session, vitrine_id):
+    """Возвращает товары, которые есть в наличии на витрине"""
+    return [balance.product for balance in get_vitrine_balances(session, vitrine_id, only_available=True)]
+
+
+def get_vitrine_movements(session, vitrine_id):
+    """Возвращает итоги движений витрины: {(product_id, type): quantity}"""
+    rows = session.query(VitrineMovement.product_id, VitrineMovement.type, VitrineMovement.quantity).filter_by(
+        vitrine_id=vitrine_id
+    ).all()
+    return {(product_id, movement_type): quantity for product_id, movement_type, quantity in rows}
+
+
+def get_vitrine_report_data(session):
+    """Данные отчета по всем витринам тремя запросами: [(витрина, остатки, итоги движений)]"""
+    vitrines = session.query(User).filter_by(role='vitrine').order_by(User.id).all()
+
+    balances = defaultdict(list)
+    for balance in session.query(Balance).options(joinedload(Balance.product)).order_by(Balance.id):
+        balances[balance.vitrine_id].append(balance)
+
+    movements = defaultdict(dict)
+    rows = session.query(VitrineMovement.vitrine_id, VitrineMovement.product_id, VitrineMovement.type,
+                         VitrineMovement.quantity)
+    for vitrine_id, product_id, movement_type, quantity in rows:
+        movements[vitrine_id][(product_id, movement_type)] = quantity
+
+    return [(vitrine, balances[vitrine.id], movements[vitrine.id]) for vitrine in vitrines]
@@ -0,0 +1,96 @@
+"""
+Дневные итоги операций (таблица daily_rollups).
+
+Каждая запись операции меняет строку итогов за день ее создания по ключу
+(день, витрина, товар, тип, статус): число операций и сумму товара.
+Статистика за период (statistics_utils) складывается из целых дней по итогам,
+а сырые операции читаются только для неполных первого и последнего дня.
+"""
+from datetime import datetime
+from sqlalchemy import case, func, select, delete, insert, literal
+from database import DailyRollup
+from balance_utils import upsert_increment
+from archive_utils import transactions_source
+
+
+def _rollup_vitrine_id(transaction):
+    # Витрина операции: получатель для выдачи, отправитель для остальных типов
+    if transaction.type == 'give':
+        return transaction.to_vitrine_id
+    return transaction.from_vitrine_id
+
+
+def rollup_vitrine_column(transactions):
+    """Витрина операции в виде SQL-выражения над колонками операций"""
+    return case((transactions.type == 'give', transactions.to_vitrine_id), else_=transactions.from_vitrine_id)
+
+
+def add_to_rollup(session, transaction, sign=1, status=None):
+    """Учитывает операцию в итогах за день (sign=1) или убирает ее оттуда (sign=-1)"""
+    vitrine_id = _rollup_vitrine_id(transaction)
+    if vitrine_id is None or transaction.product_id is None:
+        return
+
+    if transaction.created_at is None:
+        # created_at заполняется значением по умолчанию при вставке
+        session.flush()
+
+    upsert_increment(
+        session, DailyRollup,
+        {
+            'day': transaction.created_at.date(),
+            'vitrine_id': vitrine_id,
+            'product_id': transaction.product_id,
+            'type': transaction.type,
+            'status': status or transaction.status or 'pending',
+        },
+        {'operations': sign, 'quantity': sign * transaction.quantity}
+    )
+
+
+def add_rows_to_rollup(session, rows):
+    """Учитывает в итогах пачку новых операций, заданных словарями колонок (как для bulk insert)"""
+    increments = {}
+    for row in rows:
+        vitrine_id = row['to_vitrine_id'] if row['type'] == 'give' else row.get('from_vitrine_id')
+        if vitrine_id is None or row['product_id'] is None:
+            continue
+        key = (row['created_at'].date(), vitrine_id, row['product_id'], row['type'], row.get('status') or 'pending')
+        operations, quantity = increments.get(key, (0, 0))
+        increments[key] = (operations + 1, quantity + row['quantity'])
+
+    for (day, vitrine_id, product_id, transaction_type, status), (operations, quantity) in increments.items():
+        upsert_increment(
+            session, DailyRollup,
+            {'day': day, 'vitrine_id': vitrine_id, 'product_id': product_id, 'type': transaction_type,
+             'status': status},
+            {'operations': operations, 'quantity': quantity}
+        )
+
+
+def move_rollup_status(session, transaction, old_status, new_status):
+    """Переносит операцию в итогах из одного статуса в другой"""
+    add_to_rollup(session, transaction, -1, old_status)
+    add_to_rollup(session, transaction, 1, new_status)
+
+
+def rebuild_daily_rollups(connection):
+    """Пересчитывает дневные итоги по всем операциям, включая архивы; возвращает число строк итогов"""
+    transactions = transactions_source(connection).c
+    day = func.date(transactions.created_at)
+    vitrine_id = rollup_vitrine_column(transactions)
+    status = func.coalesce(transactions.status, 'pending')
+
+    source = (
+        select(day, vitrine_id, transactions.product_id, transactions.type, status,
+               func.count(transactions.id), func.sum(transactions.quantity), literal(datetime.utcnow()))
+        .where(transactions.created_at.isnot(None), vitrine_id.isnot(None), transactions.product_id.isnot(None))
+        .group_by(day, vitrine_id, transactions.product_id, transactions.type, status)
+    )
+
+    connection.execute(delete(DailyRollup))
+    connection.execute(insert(DailyRollup).from_select(
+        ['day', 'vitrine_id', 'product_id', 'type', 'status', 'operations', 'quantity', 'updated_at'],
+        source
+    ))
+    return connection.execute(select(func.count(DailyRollup.id))).scalar()
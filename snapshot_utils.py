@@ -0,0 +1,125 @@
+"""
+Снимки остатков и остатки витрин на дату.
+
+Раз в BALANCE_SNAPSHOT_INTERVAL секунд сохраняется снимок остатков всех витрин
+на момент taken_at. Снимок строится одним INSERT ... SELECT из предыдущего
+снимка и операций, подтвержденных после него (confirmed_at), поэтому он
+согласован с историей, по которой потом считаются остатки на дату.
+
+Остаток на дату - ближайший снимок не позже этой даты плюс операции,
+подтвержденные между снимком и датой: запрос читает не больше одного периода
+снимков, а не всю историю.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, union_all, func, literal
+from database import User, BalanceSnapshot, BalanceSnapshotItem, run_in_session
+from balance_utils import balance_changes
+from archive_utils import transactions_source
+from catalog_utils import get_catalog_product
+from config import BALANCE_SNAPSHOT_INTERVAL
+
+# Снимок делается на минуту раньше текущего момента: подтверждения, записанные
+# в последние секунды, могут быть еще не закоммичены
+SNAPSHOT_DELAY = timedelta(minutes=1)
+
+
+def get_latest_snapshot(session, moment=None):
+    """Последний снимок не позже moment (или вообще последний)"""
+    query = session.query(BalanceSnapshot)
+    if moment is not None:
+        query = query.filter(BalanceSnapshot.taken_at <= moment)
+    return query.order_by(BalanceSnapshot.taken_at.desc()).first()
+
+
+def _balances_since(session, snapshot, moment):
+    """Подзапрос (vitrine_id, product_id, quantity): строки снимка и операции после него до moment"""
+    # Архивы выбираются по подтверждению: операция, созданная до снимка и
+    # подтвержденная после него, может лежать в архиве более раннего месяца
+    transactions = transactions_source(session, confirmed_after=snapshot.taken_at if snapshot else None)
+    c = transactions.c
+    conditions = [c.confirmed_at <= moment]
+    if snapshot is not None:
+        conditions.append(c.confirmed_at > snapshot.taken_at)
+    changes = balance_changes(transactions, *conditions)
+
+    parts = [select(changes.c.vitrine_id, changes.c.product_id, changes.c.quantity)]
+    if snapshot is not None:
+        items = BalanceSnapshotItem.__table__.c
+        parts.append(select(items.vitrine_id, items.product_id, items.quantity).where(
+            items.snapshot_id == snapshot.id
+        ))
+    return union_all(*parts).subquery('balances_since')
+
+
+def take_balance_snapshot(session, now=None, min_interval=0):
+    """Сохраняет снимок остатков; возвращает (снимок, число строк) или None, если снимок еще свежий"""
+    now = now or datetime.utcnow()
+    taken_at = now - SNAPSHOT_DELAY
+    previous = get_latest_snapshot(session)
+    if previous is not None and (taken_at - previous.taken_at).total_seconds() < min_interval:
+        return None
+
+    snapshot = BalanceSnapshot(taken_at=taken_at, created_at=now)
+    session.add(snapshot)
+    session.flush()
+
+    balances = _balances_since(session, previous, taken_at)
+    total = func.sum(balances.c.quantity)
+    result = session.execute(insert(BalanceSnapshotItem).from_select(
+        ['snapshot_id', 'vitrine_id', 'product_id', 'quantity'],
+        select(literal(snapshot.id), balances.c.vitrine_id, balances.c.product_id, total)
+        .group_by(balances.c.vitrine_id, balances.c.product_id)
+        .having(total != 0)
+    ))
+    session.commit()
+    return snapshot, result.rowcount
+
+
+def get_balances_as_of(session, moment, vitrine_id=None):
+    """Остатки на момент moment: {(vitrine_id, product_id): количество} без нулевых"""
+    balances = _balances_since(session, get_latest_snapshot(session, moment), moment)
+    total = func.sum(balances.c.quantity)
+    query = (
+        select(balances.c.vitrine_id, balances.c.product_id, total)
+        .group_by(balances.c.vitrine_id, balances.c.product_id)
+        .having(total != 0)
+    )
+    if vitrine_id is not None:
+        query = query.where(balances.c.vitrine_id == vitrine_id)
+    return {(vitrine, product): quantity for vitrine, product, quantity in session.execute(query)}
+
+
+def get_balances_as_of_report(session, moment):
+    """Остатки всех витрин на moment для отчета: [(витрина, [(товар, количество)])]"""
+    balances = get_balances_as_of(session, moment)
+    vitrines = session.query(User).filter(User.id.in_({vitrine_id for vitrine_id, _ in balances})).order_by(
+        User.id
+    ).all()
+
+    report = []
+    for vitrine in vitrines:
+        items = [
+            (get_catalog_product(session, product_id), quantity)
+            for (vitrine_id, product_id), quantity in sorted(balances.items())
+            if vitrine_id == vitrine.id
+        ]
+        report.append((vitrine, items))
+    return report
+
+
+async def balance_snapshot_loop(interval=BALANCE_SNAPSHOT_INTERVAL):
+    """Периодически сохраняет снимки остатков в пуле потоков БД"""
+    if interval <= 0:
+        return
+
+    while True:
+        try:
+            # После перезапуска не делаем лишний снимок, если последний еще свежий
+            taken = await run_in_session(take_balance_snapshot, min_interval=interval / 2)
+            if taken:
+                snapshot, rows = taken
+                print(f"✅ Снимок остатков на {snapshot.taken_at:%d.%m.%Y %H:%M}: {rows} строк")
+        except Exception as e:
+            print(f"⚠️ Ошибка снимка остатков: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,112 @@
+"""
+Статистика операций, посчитанная в базе данных.
+
+Суммы считаются запросами GROUP BY type, status: целые дни периода берутся
+из дневных итогов (daily_rollups), а неполные первый и последний день - из
+самих операций. Фильтры по витрине и товару применяются к обоим источникам;
+витрина операции - получатель для выдачи и отправитель для остальных типов.
+"""
+from datetime import datetime, time, timedelta
+from sqlalchemy import func
+from database import DailyRollup
+from archive_utils import transactions_source
+from rollup_utils import rollup_vitrine_column
+
+# Тип операции -> ключ в сводке статистики
+STATISTICS_KEYS = {
+    'give': 'given',
+    'return': 'returned',
+    'sale': 'sold',
+    'take': 'taken',
+    'transfer': 'transferred',
+}
+
+
+def _add_rows(totals, rows):
+    for transaction_type, status, operations, quantity in rows:
+        key = (transaction_type, status or 'pending')
+        current_operations, current_quantity = totals.get(key, (0, 0))
+        totals[key] = (current_operations + (operations or 0), current_quantity + (quantity or 0))
+
+
+def _raw_rows(session, lower, upper, include_upper, vitrine_id, product_id):
+    transactions = transactions_source(session, lower, upper).c
+    query = session.query(
+        transactions.type, transactions.status, func.count(transactions.id), func.sum(transactions.quantity)
+    ).filter(transactions.created_at >= lower)
+    if include_upper:
+        query = query.filter(transactions.created_at <= upper)
+    else:
+        query = query.filter(transactions.created_at < upper)
+    if vitrine_id is not None:
+        query = query.filter(rollup_vitrine_column(transactions) == vitrine_id)
+    if product_id is not None:
+        query = query.filter(transactions.product_id == product_id)
+    return query.group_by(transactions.type, transactions.status).all()
+
+
+def _rollup_rows(session, first_day, last_day, vitrine_id, product_id):
+    query = session.query(
+        DailyRollup.type, DailyRollup.status, func.sum(DailyRollup.operations), func.sum(DailyRollup.quantity)
+    )
+    if first_day is not None:
+        query = query.filter(DailyRollup.day >= first_day)
+    if last_day is not None:
+        query = query.filter(DailyRollup.day <= last_day)
+    if vitrine_id is not None:
+        query = query.filter(DailyRollup.vitrine_id == vitrine_id)
+    if product_id is not None:
+        query = query.filter(DailyRollup.product_id == product_id)
+    return query.group_by(DailyRollup.type, DailyRollup.status).all()
+
+
+def get_operations_statistics(session, start_date=None, end_date=None, vitrine_id=None, product_id=None):
+    """Число операций и сумма товара за период [start_date, end_date].
+
+    Возвращает {(type, status): (операций, количество товара)}.
+    """
+    totals = {}
+
+    # Целые дни периода берем из итогов, неполные края - из операций
+    first_day = None
+    if start_date is not None:
+        first_day = start_date.date()
+        if start_date.time() != time.min:
+            first_day += timedelta(days=1)
+    last_day = end_date.date() - timedelta(days=1) if end_date is not None else None
+
+    if first_day is not None and last_day is not None and first_day > last_day:
+        _add_rows(totals, _raw_rows(session, start_date, end_date, True, vitrine_id, product_id))
+        return totals
+
+    _add_rows(totals, _rollup_rows(session, first_day, last_day, vitrine_id, product_id))
+
+    if start_date is not None and first_day != start_date.date():
+        day_end = datetime.combine(first_day, time.min)
+        _add_rows(totals, _raw_rows(session, start_date, day_end, False, vitrine_id, product_id))
+    if end_date is not None:
+        day_start = datetime.combine(last_day + timedelta(days=1), time.min)
+        _add_rows(totals, _raw_rows(session, day_start, end_date, True, vitrine_id, product_id))
+
+    return totals
+
+
+def summarize_statistics(totals):
+    """Сводка для показа: все операции, суммы подтвержденных по типам, ожидающие и отклоненные"""
+    summary = dict.fromkeys(['operations', *STATISTICS_KEYS.values(), 'pending', 'rejected'], 0)
+
+    for (transaction_type, status), (operations, quantity) in totals.items():
+        summary['operations'] += operations
+        if status == 'confirmed':
+            key = STATISTICS_KEYS.get(transaction_type)
+            if key:
+                summary[key] += quantity
+        elif status in ('pending', 'rejected'):
+            summary[status] += operations
+
+    return summary
+
+
+def get_period_statistics(session, start_date=None, end_date=None, vitrine_id=None, product_id=None):
+    """Сводка статистики за период с необязательными фильтрами по витрине и товару"""
+    return summarize_statistics(get_operations_statistics(session, start_date, end_date, vitrine_id, product_id))
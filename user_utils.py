@@ -0,0 +1,79 @@
+"""
+Кэш пользователей по telegram_id.
+
+Почти каждый обработчик начинает с поиска пользователя, а динамические
+обработчики меню и состояний ищут его еще раз перед вызовом нужного
+обработчика. Кэш хранит неизменяемые копии (id, telegram_id, username, role,
+language) не дольше USER_CACHE_TTL секунд и не больше USER_CACHE_SIZE записей,
+вытесняя давно не использованные. Запись сбрасывается при смене языка или
+роли пользователя и при заведении администраторов из ADMIN_IDS.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from database import run_in_session
+from repository import get_user_by_telegram_id
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+# Копия пользователя в кэше; поля совпадают с колонками users
+CachedUser = namedtuple('CachedUser', ['id', 'telegram_id', 'username', 'role', 'language'])
+
+
+class UserCache:
+    """LRU-кэш пользователей с ограниченным временем жизни записи"""
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Сбросы приходят и из потоков БД, поэтому словарь защищен блокировкой
+        self._lock = threading.Lock()
+
+    def get(self, telegram_id):
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[telegram_id]
+                return None
+            self._entries.move_to_end(telegram_id)
+            return user
+
+    def put(self, user):
+        """Запоминает пользователя (ORM-объект или CachedUser) и возвращает его копию"""
+        cached = CachedUser(user.id, user.telegram_id, user.username, user.role, user.language)
+        if self.ttl <= 0 or self.max_size <= 0:
+            return cached
+
+        with self._lock:
+            self._entries[cached.telegram_id] = (cached, time.monotonic() + self.ttl)
+            self._entries.move_to_end(cached.telegram_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return cached
+
+    def invalidate(self, telegram_id=None):
+        """Сбрасывает запись пользователя, а без аргумента - весь кэш"""
+        with self._lock:
+            if telegram_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(telegram_id, None)
+
+
+user_cache = UserCache()
+
+
+def _load_user(session, telegram_id):
+    user = get_user_by_telegram_id(session, telegram_id)
+    return user_cache.put(user) if user else None
+
+
+async def get_current_user(telegram_id):
+    """Пользователь по Telegram ID: из кэша, а при промахе - одним запросом к БД"""
+    user = user_cache.get(telegram_id)
+    if user is None:
+        user = await run_in_session(_load_user, telegram_id)
+    return user
@@ -1,212 +1,303 @@
-import json
-import os
-from datetime import datetime, timedelta
-from aiogram import types
-from config import DEFAULT_LANGUAGE
-
-_locales_cache = {}
-_available_languages = []
-
-
-def load_all_locales():
-    """Загружает все доступные локализации из папки locales"""
-    global _available_languages
-    locales_dir = 'locales'
-
-    if not os.path.exists(locales_dir):
-        os.makedirs(locales_dir)
-        print(f"⚠️ Создана папка {locales_dir}")
-        return
-
-    try:
-        locale_files = [f for f in os.listdir(locales_dir) if f.endswith('.json')]
-        _available_languages = [f.replace('.json', '') for f in locale_files]
-
-        print(f"✅ Загружены языки: {', '.join(_available_languages)}")
-
-    except Exception as e:
-        print(f"❌ Ошибка загрузки локализаций: {e}")
-        _available_languages = ['en']  # fallback
-
-
-def load_locale(language=None):
-    if language is None:
-        language = DEFAULT_LANGUAGE
-
-    if language in _locales_cache:
-        return _locales_cache[language]
-
-    try:
-        locale_file = f'locales/{language}.json'
-        if not os.path.exists(locale_file):
-            # Если файл не найден, пробуем английский как запасной
-            if language != 'en':
-                print(f"⚠️ Файл локализации {language}.json не найден, используем английский")
-                return load_locale('en')
-            else:
-                return {}
-
-        with open(locale_file, 'r', encoding='utf-8') as f:
-            locale_data = json.load(f)
-        _locales_cache[language] = locale_data
-        return locale_data
-    except Exception as e:
-        print(f"⚠️ Ошибка загрузки локализации {language}: {e}")
-        # Если файл локализации не найден, используем английский как запасной
-        if language != 'en':
-            return load_locale('en')
-        return {}
-
-
-def get_text(key, language=None, **kwargs):
-    if language is None:
-        language = DEFAULT_LANGUAGE
-
-    locale = load_locale(language)
-    text = locale.get(key, key)  # Если ключ не найден, возвращаем сам ключ
-
-    # Если текст не найден в выбранном языке, пробуем английский
-    if text == key and language != 'en':
-        en_locale = load_locale('en')
-        text = en_locale.get(key, key)
-
-    if kwargs:
-        try:
-            text = text.format(**kwargs)
-        except KeyError as e:
-            print(f"⚠️ Отсутствует ключ для форматирования: {e} в тексте: {text}")
-        except Exception as e:
-            print(f"⚠️ Ошибка форматирования текста: {e}")
-
-    return text
-
-
-def get_available_languages():
-    """Возвращает список доступных языков"""
-    if not _available_languages:
-        load_all_locales()
-    return _available_languages
-
-
-def get_language_keyboard():
-    """Динамически создает клавиатуру выбора языка на основе доступных локалей"""
-    languages_map = {
-        'ru': '🇷🇺 Русский',
-        'uz': "🇺🇿 O'zbek",
-        'en': '🇺🇸 English',
-        'de': '🇩🇪 Deutsch',
-        'fr': '🇫🇷 Français',
-        'es': '🇪🇸 Español',
-        'zh': '🇨🇳 中文',
-        'ar': '🇸🇦 العربية',
-        'tr': '🇹🇷 Türkçe',
-        'ko': '🇰🇷 한국어',
-        'ja': '🇯🇵 日本語'
-    }
-
-    available_langs = get_available_languages()
-    keyboard_buttons = []
-
-    # Создаем строки по 2 кнопки в каждой
-    row = []
-    for lang_code in available_langs:
-        lang_name = languages_map.get(lang_code, f"🌐 {lang_code.upper()}")
-        row.append(lang_name)
-
-        if len(row) == 2:
-            keyboard_buttons.append(row)
-            row = []
-
-    # Добавляем оставшиеся кнопки
-    if row:
-        keyboard_buttons.append(row)
-
-    return types.ReplyKeyboardMarkup(keyboard_buttons, resize_keyboard=True)
-
-
-def format_report(vitrine, balances, transactions, start_date=None, end_date=None, language='uz'):
-    if not start_date:
-        start_date = datetime.now() - timedelta(days=30)
-    if not end_date:
-        end_date = datetime.now()
-
-    report_texts = {
-        'title': get_text('report_for_vitrine', language),
-        'period': get_text('period', language),
-        'given': get_text('given', language),
-        'returned': get_text('returned', language),
-        'taken': get_text('taken', language),
-        'sold': get_text('sold', language),
-        'balance': get_text('balance', language),
-        'from_date': get_text('from_date', language),
-        'to_date': get_text('to_date', language)
-    }
-
-    report = f"{report_texts['title']}: {vitrine.username}\n"
-    report += f"{report_texts['period']}: {start_date.strftime('%d.%m.%Y')} {report_texts['from_date']} - {end_date.strftime('%d.%m.%Y')} {report_texts['to_date']}\n\n"
-
-    for balance in balances:
-        product = balance.product
-        product_transactions = [t for t in transactions if t.product_id == product.id]
-
-        given = sum(t.quantity for t in product_transactions if t.type == 'give' and t.status == 'confirmed')
-        returned = sum(t.quantity for t in product_transactions if t.type == 'return' and t.status == 'confirmed')
-        taken = sum(t.quantity for t in product_transactions if t.type == 'take' and t.status == 'confirmed')
-        sold = sum(t.quantity for t in product_transactions if t.type == 'sale' and t.status == 'confirmed')
-
-        report += f"📦 {product.sku} - {product.name}\n"
-        report += f"  {report_texts['given']}: {given}\n"
-        report += f"  {report_texts['returned']}: {returned}\n"
-        report += f"  {report_texts['taken']}: {taken}\n"
-        report += f"  {report_texts['sold']}: {sold}\n"
-        report += f"  {report_texts['balance']}: {balance.quantity}\n\n"
-
-    return report
-
-
-def split_message(text, max_length=4000):
-    """Разбивает длинное сообщение на части"""
-    if len(text) <= max_length:
-        return [text]
-
-    parts = []
-    while text:
-        if len(text) <= max_length:
-            parts.append(text)
-            break
-
-        split_pos = text.rfind('\n', 0, max_length)
-        if split_pos == -1:
-            split_pos = text.rfind(' ', 0, max_length)
-        if split_pos == -1:
-            split_pos = max_length
-
-        parts.append(text[:split_pos])
-        text = text[split_pos:].lstrip()
-
-    return parts
-
-
-async def safe_send_message(bot, chat_id, text, reply_markup=None, max_length=4000):
-    """
-    Безопасно отправляет сообщение с обработкой ошибок
-    """
-    try:
-        chat = await bot.get_chat(chat_id)
-        if chat:
-            if len(text) > max_length:
-                parts = split_message(text, max_length)
-                for part in parts:
-                    await bot.send_message(chat_id, part, reply_markup=reply_markup)
-                    reply_markup = None
-            else:
-                await bot.send_message(chat_id, text, reply_markup=reply_markup)
-            return True
-    except Exception as e:
-        print(f"❌ {get_text('message_send_error', 'en')} {chat_id}: {e}")
-        return False
-    return False
-
-
-# Загружаем все локализации при импорте модуля
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from aiogram import types
+from aiogram.utils.exceptions import Unauthorized, ChatNotFound, RetryAfter
+from config import DEFAULT_LANGUAGE, CHAT_UNREACHABLE_TTL, NOTIFY_CONCURRENCY
+
+_locales_cache = {}
+_available_languages = []
+
+
+def load_all_locales():
+    """Загружает все доступные локализации из папки locales"""
+    global _available_languages
+    locales_dir = 'locales'
+
+    if not os.path.exists(locales_dir):
+        os.makedirs(locales_dir)
+        print(f"⚠️ Создана папка {locales_dir}")
+        return
+
+    try:
+        locale_files = [f for f in os.listdir(locales_dir) if f.endswith('.json')]
+        _available_languages = [f.replace('.json', '') for f in locale_files]
+
+        print(f"✅ Загружены языки: {', '.join(_available_languages)}")
+
+    except Exception as e:
+        print(f"❌ Ошибка загрузки локализаций: {e}")
+        _available_languages = ['en']  # fallback
+
+
+def load_locale(language=None):
+    if language is None:
+        language = DEFAULT_LANGUAGE
+
+    if language in _locales_cache:
+        return _locales_cache[language]
+
+    try:
+        locale_file = f'locales/{language}.json'
+        if not os.path.exists(locale_file):
+            # Если файл не найден, пробуем английский как запасной
+            if language != 'en':
+                print(f"⚠️ Файл локализации {language}.json не найден, используем английский")
+                return load_locale('en')
+            else:
+                return {}
+
+        with open(locale_file, 'r', encoding='utf-8') as f:
+            locale_data = json.load(f)
+        _locales_cache[language] = locale_data
+        return locale_data
+    except Exception as e:
+        print(f"⚠️ Ошибка загрузки локализации {language}: {e}")
+        # Если файл локализации не найден, используем английский как запасной
+        if language != 'en':
+            return load_locale('en')
+        return {}
+
+
+def get_text(key, language=None, **kwargs):
+    if language is None:
+        language = DEFAULT_LANGUAGE
+
+    locale = load_locale(language)
+    text = locale.get(key, key)  # Если ключ не найден, возвращаем сам ключ
+
+    # Если текст не найден в выбранном языке, пробуем английский
+    if text == key and language != 'en':
+        en_locale = load_locale('en')
+        text = en_locale.get(key, key)
+
+    if kwargs:
+        try:
+            text = text.format(**kwargs)
+        except KeyError as e:
+            print(f"⚠️ Отсутствует ключ для форматирования: {e} в тексте: {text}")
+        except Exception as e:
+            print(f"⚠️ Ошибка форматирования текста: {e}")
+
+    return text
+
+
+def get_available_languages():
+    """Возвращает список доступных языков"""
+    if not _available_languages:
+        load_all_locales()
+    return _available_languages
+
+
+def get_language_keyboard():
+    """Динамически создает клавиатуру выбора языка на основе доступных локалей"""
+    languages_map = {
+        'ru': '🇷🇺 Русский',
+        'uz': "🇺🇿 O'zbek",
+        'en': '🇺🇸 English',
+        'de': '🇩🇪 Deutsch',
+        'fr': '🇫🇷 Français',
+        'es': '🇪🇸 Español',
+        'zh': '🇨🇳 中文',
+        'ar': '🇸🇦 العربية',
+        'tr': '🇹🇷 Türkçe',
+        'ko': '🇰🇷 한국어',
+        'ja': '🇯🇵 日本語'
+    }
+
+    available_langs = get_available_languages()
+    keyboard_buttons = []
+
+    # Создаем строки по 2 кнопки в каждой
+    row = []
+    for lang_code in available_langs:
+        lang_name = languages_map.get(lang_code, f"🌐 {lang_code.upper()}")
+        row.append(lang_name)
+
+        if len(row) == 2:
+            keyboard_buttons.append(row)
+            row = []
+
+    # Добавляем оставшиеся кнопки
+    if row:
+        keyboard_buttons.append(row)
+
+    return types.ReplyKeyboardMarkup(keyboard_buttons, resize_keyboard=True)
+
+
+def format_report(vitrine, balances, movements, start_date=None, end_date=None, language='uz'):
+    """Форматирует отчет витрины; movements - итоги движений {(product_id, type): quantity}"""
+    if not start_date:
+        start_date = datetime.now() - timedelta(days=30)
+    if not end_date:
+        end_date = datetime.now()
+
+    report_texts = {
+        'title': get_text('report_for_vitrine', language),
+        'period': get_text('period', language),
+        'given': get_text('given', language),
+        'returned': get_text('returned', language),
+        'taken': get_text('taken', language),
+        'sold': get_text('sold', language),
+        'balance': get_text('balance', language),
+        'from_date': get_text('from_date', language),
+        'to_date': get_text('to_date', language)
+    }
+
+    report = f"{report_texts['title']}: {vitrine.username}\n"
+    report += f"{report_texts['period']}: {start_date.strftime('%d.%m.%Y')} {report_texts['from_date']} - {end_date.strftime('%d.%m.%Y')} {report_texts['to_date']}\n\n"
+
+    for balance in balances:
+        product = balance.product
+
+        given = movements.get((product.id, 'give'), 0)
+        returned = movements.get((product.id, 'return'), 0)
+        taken = movements.get((product.id, 'take'), 0)
+        sold = movements.get((product.id, 'sale'), 0)
+
+        report += f"📦 {product.sku} - {product.name}\n"
+        report += f"  {report_texts['given']}: {given}\n"
+        report += f"  {report_texts['returned']}: {returned}\n"
+        report += f"  {report_texts['taken']}: {taken}\n"
+        report += f"  {report_texts['sold']}: {sold}\n"
+        report += f"  {report_texts['balance']}: {balance.quantity}\n\n"
+
+    return report
+
+
+def split_message(text, max_length=4000):
+    """Разбивает длинное сообщение на части"""
+    if len(text) <= max_length:
+        return [text]
+
+    parts = []
+    while text:
+        if len(text) <= max_length:
+            parts.append(text)
+            break
+
+        split_pos = text.rfind('\n', 0, max_length)
+        if split_pos == -1:
+            split_pos = text.rfind(' ', 0, max_length)
+        if split_pos == -1:
+            split_pos = max_length
+
+        parts.append(text[:split_pos])
+        text = text[split_pos:].lstrip()
+
+    return parts
+
+
+# Причины, по которым сообщение не доставлено
+SEND_BLOCKED = 'blocked'        # пользователь заблокировал бота или удален
+SEND_CHAT_NOT_FOUND = 'chat_not_found'
+SEND_FLOOD = 'flood'            # Telegram просит подождать (RetryAfter)
+SEND_ERROR = 'error'            # прочие ошибки: сеть, неверный запрос
+
+
+class ChatReachabilityCache:
+    """Чаты, куда недавно не удалось отправить сообщение: {chat_id: (причина, до какого момента)}.
+
+    Пока запись действует, отправка в чат пропускается без обращения к
+    Telegram. Заблокированные и ненайденные чаты помнятся
+    CHAT_UNREACHABLE_TTL секунд, при флуд-контроле - столько, сколько
+    попросил Telegram. Запись сбрасывается, когда пользователь сам пишет боту.
+    """
+
+    def __init__(self, ttl=CHAT_UNREACHABLE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, chat_id):
+        """Причина, по которой чат сейчас недоступен, или None"""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                return None
+            reason, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[chat_id]
+                return None
+            return reason
+
+    def mark(self, chat_id, reason, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[chat_id] = (reason, time.monotonic() + ttl)
+
+    def forget(self, chat_id):
+        with self._lock:
+            self._entries.pop(chat_id, None)
+
+
+chat_reachability = ChatReachabilityCache()
+
+
+def _classify_send_error(chat_id, error):
+    """Причина недоставки по типу исключения; недоступные чаты запоминаются в кэше"""
+    if isinstance(error, RetryAfter):
+        chat_reachability.mark(chat_id, SEND_FLOOD, error.timeout)
+        return SEND_FLOOD
+    if isinstance(error, Unauthorized):
+        chat_reachability.mark(chat_id, SEND_BLOCKED)
+        return SEND_BLOCKED
+    if isinstance(error, ChatNotFound):
+        chat_reachability.mark(chat_id, SEND_CHAT_NOT_FOUND)
+        return SEND_CHAT_NOT_FOUND
+    return SEND_ERROR
+
+
+async def try_send_message(bot, chat_id, text, reply_markup=None, max_length=4000):
+    """Отправляет сообщение; возвращает None при успехе или причину недоставки (SEND_*)"""
+    reason = chat_reachability.get(chat_id)
+    if reason is not None:
+        return reason
+
+    try:
+        for part in split_message(text, max_length):
+            await bot.send_message(chat_id, part, reply_markup=reply_markup)
+            reply_markup = None
+        return None
+    except Exception as e:
+        print(f"❌ {get_text('message_send_error', 'en')} {chat_id}: {e}")
+        return _classify_send_error(chat_id, e)
+
+
+async def safe_send_message(bot, chat_id, text, reply_markup=None, max_length=4000):
+    """
+    Безопасно отправляет сообщение с обработкой ошибок; возвращает True, если оно доставлено
+    """
+    return await try_send_message(bot, chat_id, text, reply_markup, max_length) is None
+
+
+async def fan_out_messages(bot, messages, concurrency=NOTIFY_CONCURRENCY):
+    """Отправляет сообщения [(chat_id, текст[, клавиатура])] параллельно.
+
+    Одновременно пишем не больше чем в concurrency чатов; сообщения одному
+    чату уходят по порядку. Возвращает результаты try_send_message в порядке
+    messages: None для доставленных, причину недоставки для остальных.
+    """
+    results = [None] * len(messages)
+    chats = {}
+    for index, message in enumerate(messages):
+        chats.setdefault(message[0], []).append(index)
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def send_chat(indexes):
+        async with semaphore:
+            for index in indexes:
+                results[index] = await try_send_message(bot, *messages[index])
+
+    await asyncio.gather(*(send_chat(indexes) for indexes in chats.values()))
+    return results
+
+
+# Загружаем все локализации при импорте модуля
 load_all_locales()
\ No newline at end of file
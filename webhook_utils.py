@@ -0,0 +1,84 @@
+"""
+Прием обновлений через webhook на aiohttp (BOT_MODE=webhook).
+
+Telegram присылает каждое обновление POST-запросом на WEBHOOK_PATH; запрос
+обрабатывается сразу, без общего цикла getUpdates, поэтому несколько
+экземпляров бота можно поставить за балансировщиком. Если задан
+WEBHOOK_SECRET, запросы без заголовка X-Telegram-Bot-Api-Secret-Token с этим
+значением отклоняются. Если задан WEBHOOK_URL, при запуске бот регистрирует
+webhook в Telegram; без него сервер просто слушает порт, и обновления можно
+отправлять вручную (например, curl с JSON обновления).
+
+По SIGINT/SIGTERM сервер перестает принимать запросы, дожидается обработки
+уже принятых (не дольше WEBHOOK_SHUTDOWN_TIMEOUT секунд) и закрывает сессию
+бота и хранилище состояний. Webhook в Telegram при этом не снимается:
+обновления продолжат получать другие экземпляры, а после перезапуска - этот.
+"""
+import asyncio
+import hmac
+import signal
+from aiohttp import web
+from aiogram.dispatcher.webhook import WebhookRequestHandler, BOT_DISPATCHER_KEY
+from config import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+                    WEBHOOK_SHUTDOWN_TIMEOUT)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+WEBHOOK_SECRET_KEY = 'WEBHOOK_SECRET'
+
+
+class SecretWebhookRequestHandler(WebhookRequestHandler):
+    """Обработчик webhook aiogram с проверкой секретного токена Telegram"""
+
+    async def post(self):
+        secret = self.request.app[WEBHOOK_SECRET_KEY]
+        if secret and not hmac.compare_digest(self.request.headers.get(SECRET_HEADER, ''), secret):
+            raise web.HTTPUnauthorized()
+        return await super().post()
+
+    async def parse_update(self, bot):
+        try:
+            return await super().parse_update(bot)
+        except (ValueError, TypeError):
+            raise web.HTTPBadRequest(text='invalid update')
+
+
+def build_webhook_app(dp, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    """Приложение aiohttp, передающее обновления с path в диспетчер dp"""
+    app = web.Application()
+    app[BOT_DISPATCHER_KEY] = dp
+    app[WEBHOOK_SECRET_KEY] = secret
+    app.router.add_route('*', path, SecretWebhookRequestHandler, name='webhook_handler')
+    return app
+
+
+async def run_webhook(dp, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH, url=WEBHOOK_URL,
+                      secret=WEBHOOK_SECRET):
+    """Слушает webhook до SIGINT/SIGTERM, затем корректно останавливается"""
+    runner = web.AppRunner(build_webhook_app(dp, path, secret))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+    await site.start()
+    print(f"🌐 Webhook слушает {host}:{port}{path}")
+
+    if url:
+        await dp.bot.set_webhook(url.rstrip('/') + path, secret_token=secret or None)
+        print(f"✅ Webhook зарегистрирован: {url.rstrip('/')}{path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(stop_signal, stop.set)
+        except NotImplementedError:
+            # Windows: остановка по Ctrl+C через KeyboardInterrupt
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        print("🛑 Остановка webhook: дожидаюсь обработки принятых обновлений")
+        await runner.cleanup()
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        session = await dp.bot.get_session()
+        await session.close()